@@ -0,0 +1,32 @@
+"""Add indexes for keyset pagination of file listing
+
+Revision ID: 3d8a5c1f7e62
+Revises: 9b41e6f0c2d7
+Create Date: 2026-10-18 20:31:05.117342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d8a5c1f7e62'
+down_revision: Union[str, Sequence[str], None] = '9b41e6f0c2d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_files_owner_created_at', 'files', ['owner', 'created_at', 'id'], unique=False)
+    op.create_index('ix_files_owner_original_filename', 'files', ['owner', 'original_filename', 'id'], unique=False)
+    op.create_index('ix_files_owner_size', 'files', ['owner', 'size', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_files_owner_size', table_name='files')
+    op.drop_index('ix_files_owner_original_filename', table_name='files')
+    op.drop_index('ix_files_owner_created_at', table_name='files')
@@ -0,0 +1,30 @@
+"""Add expires_at indexes for the expired rows sweeper
+
+Revision ID: 6c2e9f4b7a13
+Revises: e4b7a2d9c815
+Create Date: 2026-10-18 23:12:40.518227
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6c2e9f4b7a13'
+down_revision: Union[str, Sequence[str], None] = 'e4b7a2d9c815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_share_links_expires_at'), 'share_links', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_blacklist_tokens_expires_at'), 'blacklist_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_blacklist_tokens_expires_at'), table_name='blacklist_tokens')
+    op.drop_index(op.f('ix_share_links_expires_at'), table_name='share_links')
@@ -0,0 +1,42 @@
+"""Add auth_rate_limits table
+
+Revision ID: 8e1d4a6b3f25
+Revises: 6c2e9f4b7a13
+Create Date: 2026-10-18 23:48:12.304917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e1d4a6b3f25'
+down_revision: Union[str, Sequence[str], None] = '6c2e9f4b7a13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('auth_rate_limits',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(length=320), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column('capacity', sa.Float(), nullable=False),
+    sa.Column('refill_rate', sa.Float(), nullable=False),
+    sa.Column('allowed', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key'),
+    prefixes=['UNLOGGED'],
+    )
+    op.create_index(op.f('ix_auth_rate_limits_expires_at'), 'auth_rate_limits', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_auth_rate_limits_expires_at'), table_name='auth_rate_limits')
+    op.drop_table('auth_rate_limits')
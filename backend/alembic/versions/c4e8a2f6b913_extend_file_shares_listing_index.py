@@ -0,0 +1,32 @@
+"""Extend file_shares listing index with file_id
+
+Revision ID: c4e8a2f6b913
+Revises: b7f3c1e9d482
+Create Date: 2026-10-19 12:40:05.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2f6b913'
+down_revision: Union[str, Sequence[str], None] = 'b7f3c1e9d482'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Список чужих файлов сортируется по (shared_at, file_id): с file_id в
+    # индексе keyset-страница читается из индекса без сортировки
+    op.create_index('ix_file_shares_user_id_shared_at_file_id', 'file_shares', ['user_id', 'shared_at', 'file_id'], unique=False)
+    op.drop_index('ix_file_shares_user_id_shared_at', table_name='file_shares')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index('ix_file_shares_user_id_shared_at', 'file_shares', ['user_id', 'shared_at'], unique=False)
+    op.drop_index('ix_file_shares_user_id_shared_at_file_id', table_name='file_shares')
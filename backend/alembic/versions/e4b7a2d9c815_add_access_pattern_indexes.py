@@ -0,0 +1,94 @@
+"""Add unique and composite indexes for hot access patterns
+
+Revision ID: e4b7a2d9c815
+Revises: 3d8a5c1f7e62
+Create Date: 2026-10-18 21:04:48.352910
+
+"""
+from typing import Sequence, Union
+
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7a2d9c815'
+down_revision: Union[str, Sequence[str], None] = '3d8a5c1f7e62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+MAX_FILENAME_LENGTH = 255
+
+
+def rename_duplicate_files(connection) -> None:
+    """
+    Оставляет имя самому старому файлу владельца, остальным добавляет " (id)".
+
+    Имя обрезается по основе, чтобы уложиться в 255 символов; если такое имя
+    у владельца уже есть, пробуются " (id-1)", " (id-2)" и так далее.
+    """
+    duplicates = connection.execute(sa.text("""
+        SELECT f.id, f.owner, f.original_filename
+        FROM files AS f
+        WHERE EXISTS (
+            SELECT 1 FROM files AS o
+            WHERE o.owner = f.owner
+              AND o.original_filename = f.original_filename
+              AND o.id < f.id
+        )
+        ORDER BY f.id
+    """)).all()
+
+    name_taken = sa.text(
+        "SELECT 1 FROM files WHERE owner = :owner AND original_filename = :name"
+    )
+    for file_id, owner, filename in duplicates:
+        base_name, file_extension = os.path.splitext(filename)
+        attempt = 0
+        while True:
+            suffix = f" ({file_id})" if attempt == 0 else f" ({file_id}-{attempt})"
+            # Слишком длинное «расширение» не сохраняем, иначе не влезет суффикс
+            extension = file_extension if len(file_extension) + len(suffix) < MAX_FILENAME_LENGTH else ""
+            stem = (base_name if extension else filename)[:MAX_FILENAME_LENGTH - len(suffix) - len(extension)]
+            candidate = f"{stem}{suffix}{extension}"
+            if connection.execute(name_taken, {"owner": owner, "name": candidate}).first() is None:
+                break
+            attempt += 1
+
+        connection.execute(
+            sa.text("UPDATE files SET original_filename = :name WHERE id = :id"),
+            {"name": candidate, "id": file_id},
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Старые проверки SELECT-then-INSERT не защищали от гонок, поэтому
+    # дубликаты могли уже появиться: переименовываем лишние файлы
+    # в стиле "name (id).ext" и удаляем повторные выдачи доступа.
+    rename_duplicate_files(op.get_bind())
+    op.execute("""
+        DELETE FROM file_shares AS a
+        USING file_shares AS b
+        WHERE a.file_id = b.file_id
+          AND a.user_id = b.user_id
+          AND a.id > b.id
+    """)
+
+    op.drop_index('ix_files_owner_original_filename', table_name='files')
+    op.create_index('ix_files_owner_original_filename', 'files', ['owner', 'original_filename'], unique=True)
+    op.create_index('ix_file_shares_file_id_user_id', 'file_shares', ['file_id', 'user_id'], unique=True)
+    op.create_index('ix_file_shares_user_id_shared_at', 'file_shares', ['user_id', 'shared_at'], unique=False)
+    op.create_index(op.f('ix_share_links_file_id'), 'share_links', ['file_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_share_links_file_id'), table_name='share_links')
+    op.drop_index('ix_file_shares_user_id_shared_at', table_name='file_shares')
+    op.drop_index('ix_file_shares_file_id_user_id', table_name='file_shares')
+    op.drop_index('ix_files_owner_original_filename', table_name='files')
+    op.create_index('ix_files_owner_original_filename', 'files', ['owner', 'original_filename', 'id'], unique=False)
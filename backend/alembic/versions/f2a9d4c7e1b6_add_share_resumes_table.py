@@ -0,0 +1,38 @@
+"""Add share_resumes table
+
+Revision ID: f2a9d4c7e1b6
+Revises: c4e8a2f6b913
+Create Date: 2026-10-20 09:14:52.340917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9d4c7e1b6'
+down_revision: Union[str, Sequence[str], None] = 'c4e8a2f6b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('share_resumes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('share_link_id', sa.Integer(), nullable=False),
+    sa.Column('next_start', sa.BigInteger(), nullable=False),
+    sa.Column('resumes_left', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['share_link_id'], ['share_links.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_share_resumes_expires_at'), 'share_resumes', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_share_resumes_expires_at'), table_name='share_resumes')
+    op.drop_table('share_resumes')
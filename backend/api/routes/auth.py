@@ -1,17 +1,22 @@
-import hashlib
 from datetime import datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import async_session_maker
 from core.auth_cookies import delete_auth_cookies, set_auth_cookies
-from core.deps import get_current_user
+from core.deps import get_current_user, get_session, release_connection, use_read_replica
+from core.rate_limit import check_auth_rate_limit
+from core.revocation import is_token_revoked, revocation_list
 from core.secure import (
     create_access_token,
     create_refresh_token,
-    get_password_hash,
-    verify_password,
+    hash_password,
+    token_cache,
+    token_digest,
+    token_id,
+    verify_and_update_password,
     verify_token,
 )
 from models.token import BlacklistedToken
@@ -25,73 +30,92 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 @router.post("/register")
 async def register(
     user_data: UserCreate,
+    request: Request,
     response: Response,
+    session: AsyncSession = Depends(get_session),
 ):
-    async with async_session_maker() as session:
-        email_exists = await session.execute(
-            select(User).where(User.email == user_data.email)
-        )
-        if email_exists.scalar_one_or_none():
-            raise HTTPException(400, "Email already registered")
+    await check_auth_rate_limit(request, user_data.email)
 
-        username_exists = await session.execute(
-            select(User).where(User.name == user_data.name)
-        )
-        if username_exists.scalar_one_or_none():
-            raise HTTPException(400, "Username already taken")
+    email_exists = await session.execute(
+        select(User).where(User.email == user_data.email)
+    )
+    if email_exists.scalar_one_or_none():
+        raise HTTPException(400, "Email already registered")
 
-        user = User(
-            name=user_data.name,
-            email=user_data.email,
-            password=get_password_hash(user_data.password),
-        )
+    username_exists = await session.execute(
+        select(User).where(User.name == user_data.name)
+    )
+    if username_exists.scalar_one_or_none():
+        raise HTTPException(400, "Username already taken")
 
-        session.add(user)
-        await session.commit()
-        await session.refresh(user)
+    # Соединение не держим, пока считается хэш
+    await release_connection(session)
+    password_hash = await hash_password(user_data.password)
+
+    user = User(
+        name=user_data.name,
+        email=user_data.email,
+        password=password_hash,
+    )
 
-        access_token = create_access_token(data={"sub": str(user.id)})
-        refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
 
-        set_auth_cookies(response, access_token, refresh_token)
+    access_token = create_access_token(data={"sub": str(user.id)})
+    refresh_token = create_refresh_token(data={"sub": str(user.id)})
 
-        return {
-            "status": 200,
-        }
+    set_auth_cookies(response, access_token, refresh_token)
+
+    return {
+        "status": 200,
+    }
 
 
 @router.post("/login")
 async def login(
     user_data: LoginRequest,
+    request: Request,
     response: Response,
+    session: AsyncSession = Depends(get_session),
 ):
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(User).where(User.email == user_data.email)
-        )
+    await check_auth_rate_limit(request, user_data.email)
+
+    result = await session.execute(
+        select(User).where(User.email == user_data.email)
+    )
+
+    user = result.scalar_one_or_none()
 
-        user = result.scalar_one_or_none()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    await release_connection(session)
+    password_ok, new_hash = await verify_and_update_password(user_data.password, user.password)
 
-        if not verify_password(user_data.password, user.password):
-            raise HTTPException(status_code=401, detail="Incorrect password")
+    if not password_ok:
+        raise HTTPException(status_code=401, detail="Incorrect password")
 
-        access_token = create_access_token(data={"sub": str(user.id)})
-        refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    if new_hash:
+        # Параметры Argon2 поменялись: пересчитанный хэш уже готов
+        user.password = new_hash
+        await session.commit()
+
+    access_token = create_access_token(data={"sub": str(user.id)})
+    refresh_token = create_refresh_token(data={"sub": str(user.id)})
 
-        set_auth_cookies(response, access_token, refresh_token)
+    set_auth_cookies(response, access_token, refresh_token)
 
-        return {
-            "status": 200,
-        }
+    return {
+        "status": 200,
+    }
 
 
 @router.post("/refresh")
 async def refresh(
     request: Request,
     response: Response,
+    session: AsyncSession = Depends(get_session),
 ):
     refresh_token = request.cookies.get("refresh_token")
 
@@ -102,63 +126,69 @@ async def refresh(
     if payload.get("type") != "refresh":
         raise HTTPException(status_code=422, detail="Not a refresh token")
 
+    if await is_token_revoked(session, token_id(payload, refresh_token)):
+        raise HTTPException(status_code=401, detail="Token revoked")
+
     user_id = int(payload.get("sub"))
 
-    async with async_session_maker() as session:
-        result = await session.execute(select(User).where(User.id == user_id))
+    result = await session.execute(select(User).where(User.id == user_id))
 
-        user = result.scalar_one_or_none()
+    user = result.scalar_one_or_none()
 
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-        access_token = create_access_token(data={"sub": str(user.id)})
-        refresh_token = create_refresh_token(data={"sub": str(user.id)})
+    access_token = create_access_token(data={"sub": str(user.id)})
+    refresh_token = create_refresh_token(data={"sub": str(user.id)})
 
-        set_auth_cookies(response, access_token, refresh_token)
+    set_auth_cookies(response, access_token, refresh_token)
 
-        return {
-            "status": 200,
-        }
+    return {
+        "status": 200,
+    }
 
 
 @router.post("/logout")
 async def logout(
     request: Request,
     response: Response,
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user),
 ):
-    async with async_session_maker() as session:
-        refresh_token = request.cookies.get("refresh_token")
-
-        if refresh_token:
-            payload = verify_token(refresh_token)
-
-            if payload:
-                jti = payload.get("jti")
-
-                if jti is None:
-                    jti = hashlib.sha256(refresh_token.encode()).hexdigest()[:36]
-
-                token_type = payload.get("type", "refresh")
-                exp = payload.get("exp")
-
-                blacklisted_token = BlacklistedToken(
-                    jti=jti,
-                    user_id=current_user.id,
-                    token_type=token_type,
-                    expires_at=datetime.fromtimestamp(exp),
-                    reason="logout",
-                )
-                session.add(blacklisted_token)
-                await session.commit()
+    # Отзываем и refresh, и текущий access token: иначе access продолжал
+    # бы работать до истечения срока
+    revoked = []
+    for cookie in ("access_token", "refresh_token"):
+        token = request.cookies.get(cookie)
+        payload = verify_token(token) if token else None
+        if not payload:
+            continue
+        revoked.append({
+            "jti": token_id(payload, token),
+            "user_id": current_user.id,
+            "token_type": payload.get("type", cookie.removesuffix("_token")),
+            "expires_at": datetime.fromtimestamp(payload.get("exp")),
+            "reason": "logout",
+        })
+
+    if revoked:
+        # Повторный logout с тем же токеном не должен падать на уникальном jti
+        await session.execute(
+            pg_insert(BlacklistedToken).values(revoked).on_conflict_do_nothing(
+                index_elements=[BlacklistedToken.jti]
+            )
+        )
+        await session.commit()
+        for row in revoked:
+            revocation_list.revoke(row["jti"], row["expires_at"])
+        token_cache.invalidate(token_digest(request.cookies["access_token"]))
 
-        delete_auth_cookies(response)
+    delete_auth_cookies(response)
 
-        return {"status": 200, "message": "Logged out successfully"}
+    return {"status": 200, "message": "Logged out successfully"}
 
 
-@router.get("/me")
+@router.get("/me", dependencies=[Depends(use_read_replica)])
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return {
         "id": current_user.id,
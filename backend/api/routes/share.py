@@ -1,19 +1,23 @@
 import secrets
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from sqlalchemy import or_, update
 from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi import APIRouter, Form, HTTPException, Depends
+from fastapi import APIRouter, Form, HTTPException, Depends, Request
 from fastapi.responses import FileResponse
 
-from app.db import async_session_maker
-from core.deps import get_current_user
+from core.deps import get_current_user, get_session, use_read_replica
+from core.http_range import get_requested_ranges
 from core.minio_client import download_from_minio
+from core.secure import create_share_resume_token, verify_share_resume_token
 from app.config import settings
 
 from models.file import File as FileModel
 from models.link import ShareLink
+from models.share_resume import ShareResume
 from models.user import User
 
 router = APIRouter(prefix="/share", tags=["share"])
@@ -24,126 +28,255 @@ async def create_share_link(
     file_id: int,
     expires_hours: int = Form(24),
     max_downloads: int = Form(1),
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user)
 ):
 
-    async with async_session_maker() as session:
-        stmt = select(FileModel).where(
-            FileModel.id == file_id,
-            FileModel.owner == user.id
+    stmt = select(FileModel.id).where(
+        FileModel.id == file_id,
+        FileModel.owner == user.id
+    )
+    file_id = await session.scalar(stmt)
+
+    if file_id is None:
+        raise HTTPException(
+            status_code=404,
+            detail="File not found or access denied"
         )
-        result = await session.execute(stmt)
-        file = result.scalar_one_or_none()
 
-        if not file:
-            raise HTTPException(
-                status_code=404,
-                detail="File not found or access denied"
-            )
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.now() + timedelta(hours=expires_hours)
+
+    share_link = ShareLink(
+        token=token,
+        file_id=file_id,
+        expires_at=expires_at,
+        max_downloads=max_downloads,
+        download_count=0,
+        created_at=datetime.now()
+    )
+
+    session.add(share_link)
+    await session.commit()
+    await session.refresh(share_link)
+
+    return {
+        "share_url": f"/share/{token}",
+        "expires_at": expires_at.isoformat(),
+        "max_downloads": max_downloads,
+        "token": token
+    }
+
+
+@router.get("/{token}/info", dependencies=[Depends(use_read_replica)])
+async def get_shared_info(
+    token: str,
+    session: AsyncSession = Depends(get_session),
+):
+    stmt = select(ShareLink, FileModel).join(
+        FileModel, ShareLink.file_id == FileModel.id).where(ShareLink.token == token)
+    result = await session.execute(stmt)
+    result_data = result.first()
+
+    if not result_data:
+        raise HTTPException(status_code=404, detail="Link not found")
+
+    share_link, file = result_data
 
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.now() + timedelta(hours=expires_hours)
+    if share_link.expires_at and share_link.expires_at < datetime.now():
+        raise HTTPException(status_code=410, detail="Link has expired")
 
-        share_link = ShareLink(
-            token=token,
-            file_id=file_id,
-            expires_at=expires_at,
-            max_downloads=max_downloads,
-            download_count=0,
-            created_at=datetime.now()
+    if share_link.max_downloads and share_link.download_count >= share_link.max_downloads:
+        raise HTTPException(
+            status_code=410, detail="Download limit reached")
+
+    return {
+        "token": share_link.token,
+        "file": {
+            "id": file.id,
+            "original_filename": file.original_filename,
+            "size": file.size,
+            "created_at": file.created_at.isoformat() if file.created_at else None
+        },
+        "expires_at": share_link.expires_at.isoformat() if share_link.expires_at else None,
+        "max_downloads": share_link.max_downloads,
+        "downloads_count": share_link.download_count,
+        "created_at": share_link.created_at.isoformat() if share_link.created_at else None,
+        "is_expired": share_link.expires_at and share_link.expires_at < datetime.now(),
+        "downloads_left": (
+            share_link.max_downloads - share_link.download_count
+            if share_link.max_downloads else None
         )
+    }
+
+
+async def raise_link_unavailable(session: AsyncSession, token: str, now: datetime):
+    """Выясняет, почему ссылка не прошла условие скачивания, и отвечает ошибкой."""
+    share_link = (await session.execute(
+        select(
+            ShareLink.expires_at,
+            ShareLink.max_downloads,
+            ShareLink.download_count,
+        ).where(ShareLink.token == token)
+    )).first()
+
+    if not share_link:
+        raise HTTPException(status_code=404, detail="Link not found")
+
+    if share_link.expires_at <= now:
+        raise HTTPException(status_code=410, detail="Link expired")
+
+    if share_link.max_downloads >= 1 and share_link.download_count >= share_link.max_downloads:
+        raise HTTPException(
+            status_code=410, detail="Download limit reached")
+
+    raise HTTPException(status_code=404, detail="File not found")
+
+
+# Cookie с разрешением докачки; путь ограничен одной ссылкой
+SHARE_RESUME_COOKIE: str = "share_resume"
 
-        session.add(share_link)
-        await session.commit()
-        await session.refresh(share_link)
-
-        return {
-            "share_url": f"/share/{token}",
-            "expires_at": expires_at.isoformat(),
-            "max_downloads": max_downloads,
-            "token": token
-        }
-
-
-@router.get("/{token}/info")
-async def get_shared_info(token: str):
-    async with async_session_maker() as session:
-        stmt = select(ShareLink, FileModel).join(
-            FileModel, ShareLink.file_id == FileModel.id).where(ShareLink.token == token)
-        result = await session.execute(stmt)
-        result_data = result.first()
-
-        if not result_data:
-            raise HTTPException(status_code=404, detail="Link not found")
-
-        share_link, file = result_data
-
-        if share_link.expires_at and share_link.expires_at < datetime.now():
-            raise HTTPException(status_code=410, detail="Link has expired")
-
-        if share_link.max_downloads and share_link.download_count >= share_link.max_downloads:
-            raise HTTPException(
-                status_code=410, detail="Download limit reached")
-
-        return {
-            "token": share_link.token,
-            "file": {
-                "id": file.id,
-                "original_filename": file.original_filename,
-                "size": file.size,
-                "created_at": file.created_at.isoformat() if file.created_at else None
-            },
-            "expires_at": share_link.expires_at.isoformat() if share_link.expires_at else None,
-            "max_downloads": share_link.max_downloads,
-            "downloads_count": share_link.download_count,
-            "created_at": share_link.created_at.isoformat() if share_link.created_at else None,
-            "is_expired": share_link.expires_at and share_link.expires_at < datetime.now(),
-            "downloads_left": (
-                share_link.max_downloads - share_link.download_count
-                if share_link.max_downloads else None
-            )
-        }
+
+async def claim_resume(session: AsyncSession, resume_id: int, share_link_id: int, start: int, now: datetime) -> bool:
+    """
+    Забирает одну докачку из разрешения, если Range продолжает загрузку.
+
+    Докачка должна начинаться дальше начала предыдущей и укладываться в
+    SHARE_MAX_RESUMES: иначе повторные Range с того же смещения отдавали
+    бы файл заново без учёта. Состояние в БД, поэтому старый cookie не
+    даёт повторить уже использованную докачку.
+    """
+    claimed = await session.scalar(
+        update(ShareResume)
+        .where(
+            ShareResume.id == resume_id,
+            ShareResume.share_link_id == share_link_id,
+            ShareResume.expires_at > now,
+            ShareResume.resumes_left > 0,
+            ShareResume.next_start <= start,
+        )
+        .values(next_start=start + 1, resumes_left=ShareResume.resumes_left - 1)
+        .returning(ShareResume.id)
+    )
+    return claimed is not None
 
 
 @router.get("/{token}")
-async def download_shared_file(token: str):
-    async with async_session_maker() as session:
-        stmt = select(ShareLink).where(ShareLink.token == token)
-        result = await session.execute(stmt)
-        share_link = result.scalar_one_or_none()
-
-        if not share_link:
-            raise HTTPException(status_code=404, detail="Link not found")
-
-        if share_link.expires_at < datetime.now():
-            raise HTTPException(status_code=410, detail="Link expired")
-
-        if share_link.max_downloads >= 1 and share_link.download_count >= share_link.max_downloads:
-            raise HTTPException(
-                status_code=410, detail="Download limit reached")
-
-        file_stmt = select(FileModel).where(FileModel.id == share_link.file_id)
-        file_result = await session.execute(file_stmt)
-        file = file_result.scalar_one_or_none()
-
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
-
-        # Увеличиваем счетчик скачиваний
-        share_link.download_count += 1
-        await session.commit()
-
-        # Скачиваем файл из MinIO вместо локальной файловой системы
-        file_response = download_from_minio(
-            file.name, 
-            settings.MINIO_BUCKET_NAME,
-            file.original_filename
+async def download_shared_file(
+    token: str,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+):
+    """
+    Скачивание файла по публичной ссылке.
+
+    Каждый запрос — скачивание: он увеличивает download_count и упирается
+    в max_downloads, в том числе Range с любого смещения. Проверка лимита
+    и учёт — один условный UPDATE. Запрос, на который нечего отдать
+    (416 на Range, 404 из хранилища), скачиванием не считается.
+
+    Учтённое скачивание создаёт разрешение докачки (share_resumes) и ставит
+    на путь ссылки подписанный cookie с его id. Range с этим cookie не
+    учитывается, если начинается не с нулевого байта и дальше предыдущей
+    докачки; таких докачек не больше SHARE_MAX_RESUMES, и доступны они,
+    пока не истекли разрешение (SHARE_RESUME_WINDOW_SECONDS) и сама ссылка.
+    Остальные запросы считаются новыми скачиваниями.
+    """
+    now = datetime.now()
+    file = (await session.execute(
+        select(
+            ShareLink.id,
+            FileModel.name,
+            FileModel.original_filename,
+            FileModel.type,
+            FileModel.size,
+            FileModel.created_at,
+            ShareLink.expires_at,
+        ).where(
+            ShareLink.token == token,
+            ShareLink.expires_at > now,
+            ShareLink.file_id == FileModel.id,
         )
-        
-        if not file_response:
-            raise HTTPException(
-                status_code=404, 
-                detail="File not found in storage"
+    )).first()
+
+    if file is None:
+        await raise_link_unavailable(session, token, now)
+
+    ranges = None
+    if "range" in request.headers:
+        ranges = get_requested_ranges(request, file.name, file.size, file.created_at)
+
+    resumed = False
+    resume_id = verify_share_resume_token(request.cookies.get(SHARE_RESUME_COOKIE), token)
+    if ranges and ranges[0][0] > 0 and resume_id is not None:
+        resumed = await claim_resume(session, resume_id, file.id, ranges[0][0], now)
+
+    resume = None
+    if not resumed:
+        # Проверка лимита и учёт скачивания — один условный UPDATE: из
+        # нескольких одновременных запросов лимит пройдут не больше, чем
+        # осталось скачиваний, на любом числе воркеров
+        counted = await session.scalar(
+            update(ShareLink)
+            .where(
+                ShareLink.id == file.id,
+                ShareLink.expires_at > now,
+                or_(
+                    ShareLink.max_downloads < 1,
+                    ShareLink.download_count < ShareLink.max_downloads,
+                ),
             )
+            .values(download_count=ShareLink.download_count + 1)
+            .returning(ShareLink.id)
+        )
+        if counted is None:
+            await raise_link_unavailable(session, token, now)
+
+        resume = ShareResume(
+            share_link_id=file.id,
+            next_start=ranges[0][0] + 1 if ranges else 1,
+            resumes_left=settings.SHARE_MAX_RESUMES,
+            expires_at=min(
+                file.expires_at,
+                now + timedelta(seconds=settings.SHARE_RESUME_WINDOW_SECONDS),
+            ),
+        )
+        session.add(resume)
+        await session.flush()
+
+    # Скачиваем файл из MinIO вместо локальной файловой системы.
+    # Учёт фиксируется только после того, как хранилище ответило: пока
+    # идёт запрос к MinIO, строка ссылки заблокирована UPDATE
+
+    file_response = await download_from_minio(
+        file.name, 
+        settings.MINIO_BUCKET_NAME,
+        file.original_filename,
+        content_type=file.type,
+        size=file.size,
+        ranges=ranges,
+        last_modified=file.created_at,
+    )
+
+    if not file_response:
+        # Ничего не отдано: скачивание и докачка не учитываются
+        await session.rollback()
+        raise HTTPException(
+            status_code=404, 
+            detail="File not found in storage"
+        )
+    await session.commit()
+
+    if resume is not None:
+        file_response.set_cookie(
+            SHARE_RESUME_COOKIE,
+            create_share_resume_token(
+                token, resume.id, resume.expires_at.astimezone(timezone.utc)
+            ),
+            max_age=max(int((resume.expires_at - now).total_seconds()), 0),
+            path=f"/share/{token}",
+            httponly=True,
+            samesite="lax",
+        )
 
-        return file_response
\ No newline at end of file
+    return file_response
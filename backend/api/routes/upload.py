@@ -1,84 +1,196 @@
+import asyncio
+import hashlib
 import os
 import uuid
-from typing import List
-
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-
-from sqlalchemy import select, delete
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+
+from sqlalchemy import (
+    Integer,
+    Row,
+    and_,
+    delete,
+    func,
+    insert,
+    literal,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import async_session_maker
 from app.config import settings
 
-from core.deps import get_current_user
-from core.minio_client import upload_file, download_from_minio, delete_from_minio, ensure_bucket_exists
-
-from schemas.file import ShareRequest
+from core.blob_store import acquire_blob, release_blob, rollback_new_blobs, temporary_key
+from core.deps import get_current_user, get_session, release_connection, use_read_replica
+from core.http_range import get_requested_ranges
+from core.minio_client import (
+    FileTooLargeError,
+    upload_file,
+    upload_stream,
+    download_from_minio,
+    delete_from_minio,
+    generate_download_url,
+    generate_upload_url,
+    head_object,
+)
+from core.multipart_stream import MultipartStream
+from core.pagination import decode_cursor, encode_cursor
+from core.secure import create_upload_token, verify_token
+
+from schemas.file import (
+    BulkRevokeRequest,
+    BulkShareRequest,
+    FileScope,
+    FileSortField,
+    PresignedUploadConfirm,
+    PresignedUploadRequest,
+    ShareRequest,
+    SortOrder,
+)
 
 from models.file import FileShares, File as FileModel
 from models.user import User
 from models.link import ShareLink
+from models.pending_upload import PendingUpload
 
 
 router = APIRouter(prefix="/files", tags=["files"])
 
 
-@router.get("/")
-async def get_files_user(user: User = Depends(get_current_user)):
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(FileModel)
-            .where(FileModel.owner == user.id)
-            .order_by(FileModel.created_at.desc())
-        )
-        owned_files_result = result.scalars().all()
-
-        ownded_files = []
-        for file in owned_files_result:
-            ownded_files.append({
-                "id": file.id,
-                "name": file.name,
-                "original_filename": file.original_filename,
-                "type": file.type,
-                "size": file.size,
-                "created_at": file.created_at.isoformat() if file.created_at else None,
-                "download_url": f"/files/{file.id}/download",
-                "is_owner": True,
-                "shared_file": False
-            })
+SORT_COLUMNS = {
+    FileSortField.CREATED_AT: FileModel.created_at,
+    FileSortField.NAME: FileModel.original_filename,
+    FileSortField.SIZE: FileModel.size,
+}
 
-        result = await session.execute(
-            select(FileModel)
-            .join(FileShares, FileModel.id == FileShares.file_id)
-            .where(FileShares.user_id == user.id)
-            .order_by(FileShares.shared_at.desc())
-        )
-        shared_files_result = result.scalars().all()
-
-        shared_files = []
-        for file in shared_files_result:
-            shared_files.append({
-                "id": file.id,
-                "name": file.name,
-                "original_filename": file.original_filename,
-                "type": file.type,
-                "size": file.size,
-                "created_at": file.created_at.isoformat() if file.created_at else None,
-                "download_url": f"/files/{file.id}/download",
-                "is_owner": False,
-                "shared_file": True
-            })
+# Чужой файл появляется в списке в момент выдачи доступа, поэтому по
+# «дате» выдача сортируется по shared_at (индекс user_id, shared_at, file_id)
+SHARED_SORT_COLUMNS = {
+    **SORT_COLUMNS,
+    FileSortField.CREATED_AT: FileShares.shared_at,
+}
+
+
+def file_listing_item(row) -> dict:
+    return {
+        "id": row.id,
+        "name": row.name,
+        "original_filename": row.original_filename,
+        "type": row.type,
+        "size": row.size,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "download_url": f"/files/{row.id}/download",
+        "is_owner": row.is_owner,
+        "shared_file": not row.is_owner
+    }
+
+
+@router.get("/", dependencies=[Depends(use_read_replica)])
+async def get_files_user(
+    scope: FileScope = FileScope.ALL,
+    sort: FileSortField = FileSortField.CREATED_AT,
+    order: SortOrder = SortOrder.DESC,
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """
+    Список файлов пользователя с keyset-пагинацией.
+
+    Страница упорядочена по (sort, id); next_cursor указывает на последнюю
+    отданную строку и передаётся в следующий запрос без изменения sort/order.
+    При sort=created_at чужие файлы упорядочены по времени выдачи доступа
+    (shared_at), а не по дате загрузки. Счётчики считаются агрегатными
+    запросами и не зависят от страницы.
+    """
+    descending = order == SortOrder.DESC
+    after = decode_cursor(cursor, sort.value, order.value) if cursor else None
+
+    def page_query(query, sort_column, id_column):
+        if after is not None:
+            key = tuple_(sort_column, id_column)
+            query = query.where(key < tuple_(*after) if descending else key > tuple_(*after))
+        if descending:
+            query = query.order_by(sort_column.desc(), id_column.desc())
+        else:
+            query = query.order_by(sort_column.asc(), id_column.asc())
+        return query.limit(limit + 1)
+
+    columns = (
+        FileModel.id,
+        FileModel.name,
+        FileModel.original_filename,
+        FileModel.type,
+        FileModel.size,
+        FileModel.created_at,
+    )
+    owned_sort = SORT_COLUMNS[sort]
+    owned = page_query(
+        select(*columns, owned_sort.label("sort_key"), literal(True).label("is_owner"))
+        .where(FileModel.owner == user.id),
+        owned_sort,
+        FileModel.id,
+    )
+    # file_id уникален в выдачах одного пользователя и равен files.id
+    shared_sort = SHARED_SORT_COLUMNS[sort]
+    shared = page_query(
+        select(*columns, shared_sort.label("sort_key"), literal(False).label("is_owner"))
+        .join(FileShares, FileModel.id == FileShares.file_id)
+        .where(FileShares.user_id == user.id),
+        shared_sort,
+        FileShares.file_id,
+    )
+
+    if scope == FileScope.OWNED:
+        query = owned
+    elif scope == FileScope.SHARED:
+        query = shared
+    else:
+        # Каждая ветка уже ограничена limit + 1 по своему индексу,
+        # остаётся слить две короткие отсортированные выборки
+        merged = union_all(owned, shared).subquery()
+        if descending:
+            ordering = (merged.c.sort_key.desc(), merged.c.id.desc())
+        else:
+            ordering = (merged.c.sort_key.asc(), merged.c.id.asc())
+        query = select(merged).order_by(*ordering).limit(limit + 1)
+
+    counts_query = select(
+        select(func.count()).select_from(FileModel)
+        .where(FileModel.owner == user.id).scalar_subquery(),
+        select(func.count()).select_from(FileShares)
+        .where(FileShares.user_id == user.id).scalar_subquery(),
+    )
+
+    rows = (await session.execute(query)).all()
+    owned_count, shared_count = (await session.execute(counts_query)).one()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort.value, order.value, last.sort_key, last.id)
 
     return {
         "files": {
-            "owned": ownded_files,
-            "shared": shared_files
+            "owned": [file_listing_item(row) for row in rows if row.is_owner],
+            "shared": [file_listing_item(row) for row in rows if not row.is_owner]
         },
         "counts": {
-            "owned": len(ownded_files),
-            "shared": len(shared_files),
-            "total": len(ownded_files) + len(shared_files)
-        }
+            "owned": owned_count,
+            "shared": shared_count,
+            "total": owned_count + shared_count
+        },
+        "next_cursor": next_cursor
     }
 
 
@@ -86,170 +198,310 @@ async def get_files_user(user: User = Depends(get_current_user)):
 async def grant_file_access(
     data: ShareRequest,
     file_id: int,
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    async with async_session_maker() as session:
-        result = await session.execute(select(FileModel).where(FileModel.id == file_id))
-        db_file = result.scalar_one_or_none()
+    owner_id = await session.scalar(select(FileModel.owner).where(FileModel.id == file_id))
 
-        if not db_file:
-            raise HTTPException(404, "Файл не найден")
+    if owner_id is None:
+        raise HTTPException(404, "Файл не найден")
 
-        if db_file.owner != user.id:
-            raise HTTPException(403, "Нет доступа к файлу")
+    if owner_id != user.id:
+        raise HTTPException(403, "Нет доступа к файлу")
 
-        if data.user_id == user.id:
-            raise HTTPException(400, "Нельзя поделиться с самим собой")
+    if data.user_id == user.id:
+        raise HTTPException(400, "Нельзя поделиться с самим собой")
 
-        result = await session.execute(
-            select(User).where(User.id == data.user_id)
-        )
-        recipient = result.scalar_one_or_none()
+    recipient_id = await session.scalar(select(User.id).where(User.id == data.user_id))
 
-        if not recipient:
-            raise HTTPException(404, "Пользователь-получатель не найден")
+    if recipient_id is None:
+        raise HTTPException(404, "Пользователь-получатель не найден")
 
-        result = await session.execute(
-            select(FileShares).where(
-                FileShares.file_id == file_id,
-                FileShares.user_id == data.user_id
-            )
-        )
-        existing_share = result.scalar_one_or_none()
+    new_share = FileShares(
+        file_id=file_id,
+        user_id=data.user_id,
+        owner_id=user.id,
+        access_level=data.access_level
+    )
+    session.add(new_share)
 
-        if existing_share:
-            raise HTTPException(409, "Доступ уже предоставлен этому пользователю")
+    # Повторную выдачу отсекает уникальный индекс (file_id, user_id)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        raise HTTPException(409, "Доступ уже предоставлен этому пользователю")
 
-        try:
-            new_share = FileShares(
-                file_id=file_id,
-                user_id=data.user_id,
-                owner_id=user.id,
-                access_level=data.access_level
-            )
+    return {
+        "message": "Доступ успешно предоставлен",
+        "share_id": new_share.id,
+        "file_id": file_id,
+        "recipient_id": data.user_id,
+        "access_level": data.access_level
+    }
 
-            session.add(new_share)
-            await session.commit()
-            await session.refresh(new_share)
 
-            return {
-                "message": "Доступ успешно предоставлен",
-                "share_id": new_share.id,
-                "file_id": file_id,
-                "recipient_id": data.user_id,
-                "access_level": data.access_level
-            }
+MAX_BULK_SHARE_PAIRS = 1000
 
-        except IntegrityError:
-            await session.rollback()
-            raise HTTPException(500, "Ошибка при предоставлении доступа")
 
+def bulk_share_pairs(file_ids: List[int], user_ids: List[int]) -> List[tuple]:
+    file_ids = list(dict.fromkeys(file_ids))
+    user_ids = list(dict.fromkeys(user_ids))
+    if len(file_ids) * len(user_ids) > MAX_BULK_SHARE_PAIRS:
+        raise HTTPException(400, f"Не больше {MAX_BULK_SHARE_PAIRS} пар файл-получатель за запрос")
+    return [(file_id, user_id) for file_id in file_ids for user_id in user_ids]
 
-@router.get("/{file_id}/shared-users")
-async def get_shared_users(
-        file_id: int,
-        current_user: User = Depends(get_current_user)
+
+def bulk_share_response(results: List[dict]) -> dict:
+    statuses = [result["status"] for result in results]
+    return {
+        "total": len(results),
+        "successful": len([status for status in statuses if status != "error"]),
+        "failed": statuses.count("error"),
+        "results": results
+    }
+
+
+@router.post("/share/bulk")
+async def grant_file_access_bulk(
+    data: BulkShareRequest,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
 ):
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(FileShares.user_id, FileShares.access_level)
-            .where(FileShares.file_id == file_id)
+    """
+    Выдача доступа к нескольким файлам нескольким пользователям.
+
+    Владение файлами и существование получателей проверяются двумя
+    запросами, все выдачи записываются одним INSERT ... ON CONFLICT:
+    повторная выдача меняет access_level. Статус по каждой паре:
+    granted, updated (изменён уровень), unchanged или error.
+    """
+    pairs = bulk_share_pairs(data.file_ids, data.user_ids)
+    file_ids = {file_id for file_id, _ in pairs}
+    user_ids = {user_id for _, user_id in pairs}
+
+    owners = dict((await session.execute(
+        select(FileModel.id, FileModel.owner).where(FileModel.id.in_(file_ids))
+    )).all())
+    recipients = set(await session.scalars(select(User.id).where(User.id.in_(user_ids))))
+
+    def pair_error(file_id, user_id):
+        if file_id not in owners:
+            return "Файл не найден"
+        if owners[file_id] != user.id:
+            return "Нет доступа к файлу"
+        if user_id == user.id:
+            return "Нельзя поделиться с самим собой"
+        if user_id not in recipients:
+            return "Пользователь-получатель не найден"
+        return None
+
+    errors = {pair: pair_error(*pair) for pair in pairs}
+    valid = [pair for pair in pairs if errors[pair] is None]
+
+    outcomes = {}
+    if valid:
+        stmt = pg_insert(FileShares).from_select(
+            ["file_id", "user_id", "owner_id", "access_level", "shared_at"],
+            select(
+                func.unnest(literal([file_id for file_id, _ in valid], ARRAY(Integer))),
+                func.unnest(literal([user_id for _, user_id in valid], ARRAY(Integer))),
+                literal(user.id),
+                literal(data.access_level, FileShares.access_level.type),
+                literal(datetime.now(timezone.utc).replace(tzinfo=None)),
+            ),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FileShares.file_id, FileShares.user_id],
+            set_={"access_level": stmt.excluded.access_level},
+            # Строки с тем же уровнем не трогаем и не возвращаем
+            where=FileShares.access_level != stmt.excluded.access_level,
+        ).returning(
+            FileShares.file_id,
+            FileShares.user_id,
+            # xmax = 0 только у только что вставленной строки
+            literal_column("xmax = 0").label("inserted"),
         )
-        shared_records = result.all()
+        for row in await session.execute(stmt):
+            outcomes[(row.file_id, row.user_id)] = "granted" if row.inserted else "updated"
+        await session.commit()
 
-        if not shared_records:
-            return []
+    results = []
+    for file_id, user_id in pairs:
+        result = {"file_id": file_id, "user_id": user_id}
+        if errors[(file_id, user_id)]:
+            result.update(status="error", error=errors[(file_id, user_id)])
+        else:
+            result.update(
+                status=outcomes.get((file_id, user_id), "unchanged"),
+                access_level=data.access_level
+            )
+        results.append(result)
 
-        user_ids = [record.user_id for record in shared_records]
+    return bulk_share_response(results)
 
-        users_result = await session.execute(
-            select(User).where(User.id.in_(user_ids))
+
+@router.post("/share/bulk/revoke")
+async def remove_file_share_bulk(
+    data: BulkRevokeRequest,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user),
+):
+    """
+    Отзыв доступа к нескольким файлам у нескольких пользователей.
+
+    Один DELETE ... RETURNING по файлам, которыми владеет пользователь.
+    Пара без выданного доступа (в том числе чужой файл) получает статус
+    error без уточнения причины.
+    """
+    pairs = bulk_share_pairs(data.file_ids, data.user_ids)
+
+    removed = set((await session.execute(
+        delete(FileShares)
+        .where(
+            FileShares.file_id == FileModel.id,
+            FileModel.owner == user.id,
+            tuple_(FileShares.file_id, FileShares.user_id).in_(pairs),
         )
-        users = users_result.scalars().all()
+        .returning(FileShares.file_id, FileShares.user_id)
+    )).all())
+    await session.commit()
 
-        users_dict = {user.id: user for user in users}
+    results = []
+    for file_id, user_id in pairs:
+        result = {"file_id": file_id, "user_id": user_id}
+        if (file_id, user_id) in removed:
+            result.update(status="revoked")
+        else:
+            result.update(status="error", error="Доступ не найден")
+        results.append(result)
+
+    return bulk_share_response(results)
 
-        response = []
-        for record in shared_records:
-            user = users_dict.get(record.user_id)
-            if user:
-                response.append({
-                    "id": user.id,
-                    "name": user.name,
-                    "email": user.email,
-                    "access_level": record.access_level
-                })
 
-        return response
+@router.get("/{file_id}/shared-users", dependencies=[Depends(use_read_replica)])
+async def get_shared_users(
+        file_id: int,
+        session: AsyncSession = Depends(get_session),
+        current_user: User = Depends(get_current_user)
+):
+    result = await session.execute(
+        select(User.id, User.name, User.email, FileShares.access_level)
+        .join(FileShares, FileShares.user_id == User.id)
+        .where(FileShares.file_id == file_id)
+    )
+
+    return [
+        {
+            "id": record.id,
+            "name": record.name,
+            "email": record.email,
+            "access_level": record.access_level
+        }
+        for record in result
+    ]
 
 
 @router.delete("/{file_id}/share/{user_id}")
 async def remove_file_share(
     file_id: int,
     user_id: int,
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user),
 ):
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(FileModel).where(FileModel.id == file_id)
+    owner_id = await session.scalar(select(FileModel.owner).where(FileModel.id == file_id))
+
+    if owner_id is None:
+        raise HTTPException(404, "Файл не найден")
+
+    if owner_id != user.id:
+        raise HTTPException(403, "Вы не владелец этого файла")
+
+    if user_id == user.id:
+        raise HTTPException(400, "Нельзя удалить доступ самому себе")
+
+    removed_id = await session.scalar(
+        delete(FileShares)
+        .where(
+            FileShares.file_id == file_id,
+            FileShares.user_id == user_id
         )
-        db_file = result.scalar_one_or_none()
+        .returning(FileShares.id)
+    )
 
-        if not db_file:
-            raise HTTPException(404, "Файл не найден")
+    if removed_id is None:
+        raise HTTPException(404, "Доступ не найден")
 
-        if db_file.owner != user.id:
-            raise HTTPException(403, "Вы не владелец этого файла")
+    await session.commit()
 
-        if user_id == user.id:
-            raise HTTPException(400, "Нельзя удалить доступ самому себе")
+    return {
+        "message": "Доступ успешно удален",
+        "file_id": file_id,
+        "removed_user_id": user_id
+    }
 
-        result = await session.execute(
-            select(FileShares).where(
-                FileShares.file_id == file_id,
-                FileShares.user_id == user_id
-            )
+
+async def get_readable_file(session, file_id: int, user: User) -> Row:
+    """
+    Файл, который пользователь может скачать: свой или открытый ему через FileShares.
+
+    Владение и выдача доступа проверяются одним запросом; возвращаются только
+    столбцы, нужные для отдачи файла.
+    """
+    result = await session.execute(
+        select(
+            FileModel.id,
+            FileModel.name,
+            FileModel.original_filename,
+            FileModel.type,
+            FileModel.size,
+            FileModel.created_at,
+            FileModel.owner,
+            FileShares.id.label("share_id"),
+        )
+        .outerjoin(
+            FileShares,
+            and_(FileShares.file_id == FileModel.id, FileShares.user_id == user.id)
         )
-        file_share = result.scalar_one_or_none()
+        .where(FileModel.id == file_id)
+    )
+    db_file = result.first()
 
-        if not file_share:
-            raise HTTPException(404, "Доступ не найден")
+    if not db_file:
+        raise HTTPException(status_code=404, detail="Файл не найден")
 
-        await session.delete(file_share)
-        await session.commit()
+    if db_file.owner != user.id and db_file.share_id is None:
+        raise HTTPException(status_code=403, detail="Нет доступа к файлу")
 
-        return {
-            "message": "Доступ успешно удален",
-            "file_id": file_id,
-            "removed_user_id": user_id
-        }
+    return db_file
+
+
+def require_presigned_urls() -> None:
+    if not settings.PRESIGNED_URLS_ENABLED:
+        raise HTTPException(status_code=404, detail="Presigned URLs are disabled")
 
 
 @router.get("/{file_id}/download")
 async def download_file(
     file_id: int,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user)
 ):
-    async with async_session_maker() as session:
-        result = await session.execute(select(FileModel).where(FileModel.id == file_id))
-        db_file = result.scalar_one_or_none()
-
-        if not db_file:
-            raise HTTPException(status_code=404, detail="Файл не найден")
-
-        if db_file.owner != user.id:
-            result = await session.execute(
-                select(FileShares).where(
-                    FileShares.file_id == file_id,
-                    FileShares.user_id == user.id
-                )
-            )
-            access_file = result.scalar_one_or_none()
-            
-            if not access_file:
-                raise HTTPException(status_code=403, detail="Нет доступа к файлу")
-
-    file_response = download_from_minio(db_file.name, settings.MINIO_BUCKET_NAME, db_file.original_filename)
+    db_file = await get_readable_file(session, file_id, user)
+    await release_connection(session)
+
+    ranges = get_requested_ranges(request, db_file.name, db_file.size, db_file.created_at)
+
+    file_response = await download_from_minio(
+        db_file.name,
+        settings.MINIO_BUCKET_NAME,
+        db_file.original_filename,
+        content_type=db_file.type,
+        size=db_file.size,
+        ranges=ranges,
+        last_modified=db_file.created_at,
+    )
     
     if not file_response:
         raise HTTPException(
@@ -260,223 +512,610 @@ async def download_file(
     return file_response
 
 
-@router.delete("/{file_id}")
-async def delete_file(
+@router.get("/{file_id}/download-url", dependencies=[Depends(require_presigned_urls)])
+async def get_download_url(
     file_id: int,
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user)
 ):
-    async with async_session_maker() as session:
-        file = await session.get(FileModel, file_id)
+    """Короткоживущая presigned-ссылка: сами байты идут из MinIO мимо API."""
+    db_file = await get_readable_file(session, file_id, user)
 
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
+    url = await generate_download_url(
+        db_file.name,
+        settings.MINIO_BUCKET_NAME,
+        db_file.original_filename,
+        content_type=db_file.type,
+        expires_in=settings.PRESIGNED_URL_EXPIRE_SECONDS,
+    )
 
-        if file.owner != user.id:
-            raise HTTPException(status_code=403, detail="Access denied")
+    return {
+        "file_id": db_file.id,
+        "url": url,
+        "expires_in": settings.PRESIGNED_URL_EXPIRE_SECONDS,
+    }
 
-        delete_links_stmt = delete(ShareLink).where(ShareLink.file_id == file_id)
-        await session.execute(delete_links_stmt)
 
-        delete_success = delete_from_minio(file.name, settings.MINIO_BUCKET_NAME)
-        if not delete_success:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to delete file from storage"
-            )
+@router.post("/upload-url", dependencies=[Depends(require_presigned_urls)])
+async def create_upload_url(
+    data: PresignedUploadRequest,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    """
+    Выдаёт presigned POST для прямой загрузки в MinIO.
+
+    Политика POST не пропустит файл больше заявленного size. После
+    загрузки клиент вызывает /files/upload-url/confirm с upload_token, и
+    только тогда появляется запись File. Неподтверждённый объект удаляется
+    фоновой очисткой после истечения upload_token (см. PendingUpload).
+    """
+    MAX_FILE_SIZE = 100 * 1024 * 1024
 
-        await session.delete(file)
-        await session.commit()
+    if data.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413, 
+            detail=f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
 
-        return {
-            "status": "success",
-            "message": "File and all associated share links deleted successfully",
-            "file_id": file_id
-        }
+    result = await session.execute(
+        select(FileModel.id).where(
+            FileModel.owner == user.id,
+            FileModel.original_filename == data.filename
+        )
+    )
+    if result.first():
+        raise HTTPException(
+            status_code=409, 
+            detail=f"Файл с именем '{data.filename}' уже существует у вас"
+        )
 
+    file_extension = os.path.splitext(data.filename)[1].lower()
+    unique_filename = f"{uuid.uuid4()}{file_extension}"
+    content_type = data.content_type or "application/octet-stream"
+    expires_in = settings.PRESIGNED_URL_EXPIRE_SECONDS
+    token_lifetime = timedelta(seconds=expires_in) + timedelta(hours=1)
+
+    # Запись появляется до выдачи ссылки: объект, загруженный по ней, всегда
+    # либо подтверждён, либо будет удалён очисткой
+    session.add(PendingUpload(
+        name=unique_filename,
+        owner=user.id,
+        expires_at=datetime.now(timezone.utc).replace(tzinfo=None) + token_lifetime,
+    ))
+    await session.commit()
+
+    presigned_post = await generate_upload_url(
+        unique_filename,
+        settings.MINIO_BUCKET_NAME,
+        max_size=data.size,
+        content_type=content_type,
+        expires_in=expires_in,
+    )
+    upload_token = create_upload_token(
+        {
+            "sub": str(user.id),
+            "key": unique_filename,
+            "filename": data.filename,
+            "content_type": content_type,
+            "size": data.size,
+        },
+        token_lifetime,
+    )
 
-@router.post("/upload")
-async def create_file(
-    file: UploadFile = File(...),
+    return {
+        "url": presigned_post["url"],
+        "method": "POST",
+        "fields": presigned_post["fields"],
+        "expires_in": expires_in,
+        "upload_token": upload_token,
+    }
+
+
+@router.post("/upload-url/confirm", dependencies=[Depends(require_presigned_urls)])
+async def confirm_upload_url(
+    data: PresignedUploadConfirm,
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user)
 ):
     MAX_FILE_SIZE = 100 * 1024 * 1024
-    
-    content = await file.read()
 
-    if len(content) > MAX_FILE_SIZE:
+    payload = verify_token(data.upload_token)
+    if not payload or payload.get("type") != "upload" or payload.get("sub") != str(user.id):
+        raise HTTPException(status_code=400, detail="Invalid upload token")
+
+    unique_filename = payload["key"]
+    object_info = await head_object(unique_filename, settings.MINIO_BUCKET_NAME)
+    if not object_info:
+        raise HTTPException(status_code=404, detail="Файл не найден в хранилище")
+
+    size = object_info["ContentLength"]
+    # Политика POST уже не пускает файл больше заявленного, но хранилище без
+    # её поддержки (или старый токен без size) проверяем здесь
+    if size > min(MAX_FILE_SIZE, payload.get("size", MAX_FILE_SIZE)):
+        await delete_from_minio(unique_filename, settings.MINIO_BUCKET_NAME)
+        await session.execute(delete(PendingUpload).where(PendingUpload.name == unique_filename))
+        await session.commit()
         raise HTTPException(
             status_code=413, 
             detail=f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB"
         )
 
-    file_extension = os.path.splitext(file.filename)[1].lower()
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = f"http://{settings.MINIO_ENDPOINT}:9000/{settings.MINIO_BUCKET_NAME}/{unique_filename}"
+    # Подтверждение забирает запись PendingUpload в той же транзакции, что
+    # и вставка File: очистка удаляет объект, только пока запись жива
+    claimed = await session.scalar(
+        delete(PendingUpload)
+        .where(PendingUpload.name == unique_filename, PendingUpload.owner == user.id)
+        .returning(PendingUpload.id)
+    )
+    if claimed is None:
+        result = await session.execute(
+            select(FileModel.id).where(FileModel.name == unique_filename)
+        )
+        if result.first():
+            raise HTTPException(status_code=409, detail="Загрузка уже подтверждена")
+        raise HTTPException(status_code=410, detail="Срок загрузки истёк")
 
-    ensure_bucket_exists(settings.MINIO_BUCKET_NAME)
+    file_path = f"http://{settings.MINIO_ENDPOINT}:9000/{settings.MINIO_BUCKET_NAME}/{unique_filename}"
 
-    async with async_session_maker() as session:
-        result = await session.execute(
-            select(FileModel).where(
-                FileModel.owner == user.id,
-                FileModel.original_filename == file.filename
-            )
+    db_file = FileModel(
+        name=unique_filename,
+        original_filename=payload["filename"],
+        type=payload["content_type"],
+        owner=user.id,
+        path=file_path,
+        size=size,
+    )
+    session.add(db_file)
+    try:
+        await session.commit()
+    except IntegrityError:
+        await session.rollback()
+        await delete_from_minio(unique_filename, settings.MINIO_BUCKET_NAME)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Файл с именем '{payload['filename']}' уже существует у вас"
         )
-        existing_file = result.scalar_one_or_none()
 
-        if existing_file:
+    return {
+        "status": "success",
+        "file_id": db_file.id,
+        "filename": db_file.original_filename,
+        "saved_as": unique_filename,
+        "size": size,
+        "download_url": f"/files/{db_file.id}/download",
+        "minio_url": file_path,
+    }
+
+
+@router.delete("/{file_id}")
+async def delete_file(
+    file_id: int,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    result = await session.execute(
+        select(FileModel.owner, FileModel.name, FileModel.blob_id)
+        .where(FileModel.id == file_id)
+    )
+    file = result.first()
+
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    if file.owner != user.id:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    delete_links_stmt = delete(ShareLink).where(ShareLink.file_id == file_id)
+    await session.execute(delete_links_stmt)
+    await session.execute(delete(FileShares).where(FileShares.file_id == file_id))
+    await session.execute(delete(FileModel).where(FileModel.id == file_id))
+
+    # Объект общий для всех File с тем же содержимым: удаляем его из
+    # MinIO только вместе с последней ссылкой
+    if file.blob_id is not None:
+        object_name = await release_blob(session, file.blob_id)
+    else:
+        object_name = file.name
+
+    if object_name:
+        delete_success = await delete_from_minio(object_name, settings.MINIO_BUCKET_NAME)
+        if not delete_success:
             raise HTTPException(
-                status_code=409, 
-                detail=f"Файл с именем '{file.filename}' уже существует у вас"
+                status_code=500,
+                detail="Failed to delete file from storage"
             )
 
-        file.file.seek(0)
-        success = upload_file(file, unique_filename, settings.MINIO_BUCKET_NAME)
-        
-        if not success:
+    await session.commit()
+
+    return {
+        "status": "success",
+        "message": "File and all associated share links deleted successfully",
+        "file_id": file_id
+    }
+
+
+async def save_uploaded_file(
+    session: AsyncSession,
+    temp_key: str,
+    digest: str,
+    size: int,
+    filename: str,
+    content_type: str,
+    owner: int,
+) -> FileModel:
+    """
+    Привязывает загруженный во временный ключ файл к blob и создаёт запись File.
+
+    Одинаковое содержимое хранится в MinIO один раз под ключом sha256/<digest>,
+    временный объект удаляется в любом случае.
+
+    Запись File вставляется до копирования в blob: конфликт имени ловит
+    уникальный индекс (owner, original_filename), и тогда транзакция
+    откатывается, не трогая хранилище (409).
+    """
+    try:
+        db_file = FileModel(
+            name=temp_key,
+            original_filename=filename,
+            type=content_type or "application/octet-stream",
+            owner=owner,
+            path="",
+            size=size,
+        )
+        session.add(db_file)
+        try:
+            await session.flush()
+        except IntegrityError:
+            await session.rollback()
             raise HTTPException(
-                status_code=500, 
-                detail="Ошибка при загрузке файла в хранилище"
+                status_code=409,
+                detail=f"Файл с именем '{filename}' уже существует у вас"
             )
 
-        file_data = {
-            "name": unique_filename,
-            "original_filename": file.filename,
-            "type": file.content_type or "application/octet-stream",
-            "owner": user.id,
-            "path": str(file_path),
-            "size": len(content),
-        }
+        blob = await acquire_blob(session, temp_key, digest, size)
+        db_file.name = blob.key
+        db_file.path = f"http://{settings.MINIO_ENDPOINT}:9000/{settings.MINIO_BUCKET_NAME}/{blob.key}"
+        db_file.blob_id = blob.id
+        await session.commit()
+        # Откат чужой записи в той же сессии не должен сбросить атрибуты
+        session.expunge(db_file)
+    except Exception:
+        # Сессия может быть общей для нескольких файлов (create_files)
+        await rollback_new_blobs(session)
+        raise
+    finally:
+        await delete_from_minio(temp_key, settings.MINIO_BUCKET_NAME)
+
+    return db_file
+
+
+async def lock_owner_filenames(session: AsyncSession, owner: int) -> None:
+    """
+    Транзакционная advisory-блокировка на имена файлов владельца.
+
+    Параллельные пачки одного пользователя подбирают суффиксы по очереди
+    и не выбирают одно и то же «имя (N)».
+    """
+    await session.execute(
+        select(func.pg_advisory_xact_lock(func.hashtextextended(f"files:owner:{owner}", 0)))
+    )
+
+
+async def resolve_filenames(session: AsyncSession, owner: int, filenames: List[str]) -> List[str]:
+    """
+    Подбирает свободные имена для пачки файлов одним запросом.
+
+    Из БД берутся только имена владельца, которые совпадают с запрошенными
+    или похожи на «база (N).расширение»; дальше первый свободный номер
+    ищется в памяти, с учётом имён, уже выданных этой же пачке.
+    """
+    conditions = []
+    for filename in set(filenames):
+        base_name, file_extension = os.path.splitext(filename)
+        conditions.append(FileModel.original_filename == filename)
+        conditions.append(and_(
+            FileModel.original_filename.startswith(f"{base_name} (", autoescape=True),
+            FileModel.original_filename.endswith(f"){file_extension}", autoescape=True),
+        ))
+
+    result = await session.scalars(
+        select(FileModel.original_filename).where(FileModel.owner == owner, or_(*conditions))
+    )
+    taken_names = set(result)
+
+    final_names = []
+    for filename in filenames:
+        base_name, file_extension = os.path.splitext(filename)
+        new_filename = filename
+        counter = 0
+        while new_filename in taken_names:
+            counter += 1
+            new_filename = f"{base_name} ({counter}){file_extension}"
+        taken_names.add(new_filename)
+        final_names.append(new_filename)
+    return final_names
+
+
+FILENAME_CONFLICT_RETRIES = 3
+
+
+async def save_uploaded_batch(
+    session: AsyncSession,
+    uploads: List[dict],
+    owner: int,
+) -> List[tuple]:
+    """
+    Сохраняет пачку загруженных во временные ключи файлов одной транзакцией.
+
+    uploads — словари с ключами temp_key, digest, size, filename,
+    content_type. Свободные имена подбираются одним запросом под
+    блокировкой владельца, записи File вставляются одним
+    INSERT ... RETURNING, затем привязываются к blob одним UPDATE.
+    Возвращает (id, имя файла, ключ в MinIO) в порядке uploads. Временные
+    объекты удаляет вызывающий код.
+    """
+    try:
+        for _ in range(FILENAME_CONFLICT_RETRIES):
+            await lock_owner_filenames(session, owner)
+            filenames = await resolve_filenames(
+                session, owner, [upload["filename"] for upload in uploads]
+            )
+            try:
+                result = await session.execute(
+                    insert(FileModel)
+                    .values([
+                        {
+                            "name": upload["temp_key"],
+                            "original_filename": filename,
+                            "type": upload["content_type"] or "application/octet-stream",
+                            "owner": owner,
+                            "path": "",
+                            "size": upload["size"],
+                        }
+                        for upload, filename in zip(uploads, filenames)
+                    ])
+                    .returning(FileModel.id, FileModel.original_filename)
+                )
+            except IntegrityError:
+                # Имя успела занять одиночная загрузка: она не берёт
+                # блокировку владельца, и её ловит только уникальный индекс
+                await session.rollback()
+                continue
+            break
+        else:
+            raise HTTPException(
+                status_code=409,
+                detail="Не удалось подобрать свободные имена файлов"
+            )
 
-        db_file = FileModel(**file_data)
-        session.add(db_file)
+        file_ids = {row.original_filename: row.id for row in result}
+
+        # Блокировки хэшей берутся в одном порядке, чтобы параллельные
+        # пачки с общим содержимым не ждали друг друга по кругу
+        blob_keys = {}
+        values = []
+        for position in sorted(range(len(uploads)), key=lambda i: uploads[i]["digest"]):
+            upload = uploads[position]
+            blob = await acquire_blob(session, upload["temp_key"], upload["digest"], upload["size"])
+            blob_keys[position] = blob.key
+            values.append({
+                "id": file_ids[filenames[position]],
+                "name": blob.key,
+                "path": f"http://{settings.MINIO_ENDPOINT}:9000/{settings.MINIO_BUCKET_NAME}/{blob.key}",
+                "blob_id": blob.id,
+            })
+        await session.execute(update(FileModel), values)
         await session.commit()
-        await session.refresh(db_file)
+    except Exception:
+        await rollback_new_blobs(session)
+        raise
+
+    return [
+        (file_ids[filename], filename, blob_keys[position])
+        for position, filename in enumerate(filenames)
+    ]
+
+
+UPLOAD_OPENAPI_EXTRA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/upload", openapi_extra=UPLOAD_OPENAPI_EXTRA)
+async def create_file(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    """
+    Загрузка одного файла.
+
+    Тело запроса не разбирается FastAPI целиком: файл читается из потока
+    и по частям уходит в multipart upload MinIO, поэтому в памяти
+    находится не больше одной части, а размер считается по ходу передачи.
+    Занятое имя проверяется сразу после заголовков части, до передачи тела.
+    """
+    MAX_FILE_SIZE = 100 * 1024 * 1024
+
+    file = None
+    async for part in MultipartStream(request).files():
+        if part.field_name == "file":
+            file = part
+            break
+
+    if file is None:
+        raise HTTPException(status_code=422, detail="Файл не передан")
+
+    # Дешёвая проверка до передачи тела: занятое имя не должно стоить
+    # загрузки в хранилище. Гарантию даёт уникальный индекс при сохранении
+    result = await session.execute(
+        select(FileModel.id).where(
+            FileModel.owner == user.id,
+            FileModel.original_filename == file.filename
+        )
+    )
+    if result.first():
+        raise HTTPException(
+            status_code=409,
+            detail=f"Файл с именем '{file.filename}' уже существует у вас"
+        )
+
+    temp_key = temporary_key(str(uuid.uuid4()))
+    await release_connection(session)
+
+    hasher = hashlib.sha256()
+    try:
+        size = await upload_stream(
+            file.chunks(),
+            temp_key,
+            settings.MINIO_BUCKET_NAME,
+            content_type=file.content_type,
+            max_size=MAX_FILE_SIZE,
+            hasher=hasher,
+        )
+    except FileTooLargeError:
+        raise HTTPException(
+            status_code=413, 
+            detail=f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+    except Exception as e:
+        print(f"Error uploading file: {e}")
+        raise HTTPException(
+            status_code=500, 
+            detail="Ошибка при загрузке файла в хранилище"
+        )
+
+    db_file = await save_uploaded_file(
+        session, temp_key, hasher.hexdigest(), size, file.filename, file.content_type, user.id
+    )
 
     return {
         "status": "success",
         "file_id": db_file.id,
         "filename": file.filename,
-        "saved_as": unique_filename,
-        "size": len(content),
+        "saved_as": db_file.name,
+        "size": size,
         "download_url": f"/files/{db_file.id}/download",
-        "minio_url": file_path,
+        "minio_url": db_file.path,
     }
 
 
 @router.post("/upload/multiple")
 async def create_files(
     files: List[UploadFile] = File(...),
+    session: AsyncSession = Depends(get_session),
     user: User = Depends(get_current_user)
 ):
+    """
+    Загрузка нескольких файлов.
+
+    Сначала файлы параллельно загружаются во временные ключи MinIO (не
+    больше UPLOAD_BATCH_S3_CONCURRENCY сразу), затем все успешно
+    загруженные сохраняются одной транзакцией (save_uploaded_batch): либо
+    вся пачка, либо ни одного файла. Результаты возвращаются в исходном
+    порядке файлов.
+    """
     MAX_TOTAL_SIZE = 500 * 1024 * 1024
     MAX_FILE_SIZE = 100 * 1024 * 1024
 
     total_size = 0
-    results = []
+    results = [None] * len(files)
 
-    for file in files:
-        content = await file.read()
-        await file.seek(0)
-
-        if len(content) > MAX_FILE_SIZE:
-            results.append({
+    for index, file in enumerate(files):
+        if file.size > MAX_FILE_SIZE:
+            results[index] = {
                 "status": "error",
                 "filename": file.filename,
                 "error": f"Файл слишком большой. Максимум: {MAX_FILE_SIZE // (1024*1024)}MB"
-            })
+            }
             continue
 
-        total_size += len(content)
+        total_size += file.size
 
     if total_size > MAX_TOTAL_SIZE:
         raise HTTPException(413, f"Общий размер файлов превышает {MAX_TOTAL_SIZE // (1024*1024)}MB")
 
-    ensure_bucket_exists(settings.MINIO_BUCKET_NAME)
+    pending = [index for index, result in enumerate(results) if result is None]
+    uploads = {}
 
-    for file in files:
-        try:
-            if any(r.get("filename") == file.filename and r["status"] == "error" for r in results):
-                continue
+    # Пока файлы идут в MinIO, соединение с БД не нужно
+    await release_connection(session)
 
-            content = await file.read()
-            file_extension = os.path.splitext(file.filename)[1].lower()
-            unique_filename = f"{uuid.uuid4()}{file_extension}"
-            file_path = f"http://{settings.MINIO_ENDPOINT}:9000/{settings.MINIO_BUCKET_NAME}/{unique_filename}"
+    s3_semaphore = asyncio.Semaphore(settings.UPLOAD_BATCH_S3_CONCURRENCY)
 
-            async with async_session_maker() as session:
-                result = await session.execute(
-                    select(FileModel).where(
-                        FileModel.owner == user.id,
-                        FileModel.original_filename == file.filename
-                    )
-                )
-                existing_file = result.scalar_one_or_none()
-
-                if existing_file:
-                    base_name = os.path.splitext(file.filename)[0]
-                    counter = 1
-                    new_filename = f"{base_name} ({counter}){file_extension}"
-
-                    while True:
-                        result = await session.execute(
-                            select(FileModel).where(
-                                FileModel.owner == user.id,
-                                FileModel.original_filename == new_filename
-                            )
-                        )
-                        if not result.scalar_one_or_none():
-                            break
-                        counter += 1
-                        new_filename = f"{base_name} ({counter}){file_extension}"
-
-                    file.filename = new_filename
-
-            file.file.seek(0)
-            success = upload_file(file, unique_filename, settings.MINIO_BUCKET_NAME)
-            
-            if not success:
-                results.append({
-                    "status": "error",
-                    "filename": file.filename,
-                    "error": "Ошибка при загрузке в хранилище"
-                })
-                continue
+    async def upload_to_temp(index):
+        file = files[index]
+        temp_key = temporary_key(str(uuid.uuid4()))
+        hasher = hashlib.sha256()
+
+        async with s3_semaphore:
+            success = await upload_file(file, temp_key, settings.MINIO_BUCKET_NAME, hasher=hasher)
 
-            file_data = {
-                "name": unique_filename,
-                "original_filename": file.filename,
-                "type": file.content_type or "application/octet-stream",
-                "owner": user.id,
-                "path": str(file_path),
-                "size": len(content),
+        if not success:
+            await delete_from_minio(temp_key, settings.MINIO_BUCKET_NAME)
+            results[index] = {
+                "status": "error",
+                "filename": file.filename,
+                "error": "Ошибка при загрузке в хранилище"
             }
+            return
+
+        uploads[index] = {
+            "temp_key": temp_key,
+            "digest": hasher.hexdigest(),
+            "size": file.size,
+            "filename": file.filename,
+            "content_type": file.content_type,
+        }
 
-            async with async_session_maker() as session:
-                db_file = FileModel(**file_data)
-                session.add(db_file)
-                await session.commit()
-                await session.refresh(db_file)
+    async def delete_temp(temp_key):
+        async with s3_semaphore:
+            await delete_from_minio(temp_key, settings.MINIO_BUCKET_NAME)
 
-                results.append({
-                    "status": "success",
-                    "file_id": db_file.id,
-                    "filename": file.filename,
-                    "saved_as": unique_filename,
-                    "size": len(content),
-                    "download_url": f"/files/{db_file.id}/download"
-                })
+    await asyncio.gather(*(upload_to_temp(index) for index in pending))
 
+    saved_indexes = [index for index in pending if index in uploads]
+    if saved_indexes:
+        try:
+            saved = await save_uploaded_batch(
+                session, [uploads[index] for index in saved_indexes], user.id
+            )
         except Exception as e:
-            results.append({
-                "status": "error",
-                "filename": file.filename,
-                "error": str(e)
-            })
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            for index in saved_indexes:
+                results[index] = {
+                    "status": "error",
+                    "filename": files[index].filename,
+                    "error": error
+                }
+        else:
+            for index, (file_id, filename, saved_as) in zip(saved_indexes, saved):
+                results[index] = {
+                    "status": "success",
+                    "file_id": file_id,
+                    "filename": filename,
+                    "saved_as": saved_as,
+                    "size": files[index].size,
+                    "download_url": f"/files/{file_id}/download"
+                }
+        finally:
+            await asyncio.gather(*(delete_temp(uploads[index]["temp_key"]) for index in saved_indexes))
 
     return {
         "total_files": len(files),
         "successful": len([r for r in results if r["status"] == "success"]),
         "failed": len([r for r in results if r["status"] == "error"]),
         "files": results
-    }
\ No newline at end of file
+    }
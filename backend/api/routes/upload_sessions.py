@@ -0,0 +1,305 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+
+from core.deps import get_current_user, get_session, release_connection
+from core.minio_client import (
+    abort_multipart_upload,
+    complete_multipart_upload,
+    create_multipart_upload,
+    delete_from_minio,
+    list_uploaded_parts,
+    upload_part,
+)
+
+from schemas.file import UploadSessionCreate
+
+from models.file import File as FileModel
+from models.upload_session import UploadSession
+from models.user import User
+
+
+router = APIRouter(prefix="/files/upload-sessions", tags=["files"])
+
+MAX_FILE_SIZE = 100 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+async def get_owned_session(session, session_id: int, user: User) -> UploadSession:
+    upload_session = await session.get(UploadSession, session_id)
+
+    if not upload_session or upload_session.owner != user.id:
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+
+    if upload_session.expires_at < datetime.now(timezone.utc).replace(tzinfo=None):
+        raise HTTPException(status_code=410, detail="Сессия загрузки истекла")
+
+    return upload_session
+
+
+def session_state(upload_session: UploadSession, parts: list) -> dict:
+    received = sorted(part["PartNumber"] for part in parts)
+    received_set = set(received)
+    return {
+        "session_id": upload_session.id,
+        "filename": upload_session.original_filename,
+        "size": upload_session.size,
+        "part_size": upload_session.part_size,
+        "total_parts": upload_session.total_parts,
+        "received_parts": received,
+        "missing_parts": [
+            number for number in range(1, upload_session.total_parts + 1)
+            if number not in received_set
+        ],
+        "expires_at": upload_session.expires_at.isoformat(),
+    }
+
+
+@router.post("")
+async def create_upload_session(
+    data: UploadSessionCreate,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    """
+    Создаёт возобновляемую загрузку.
+
+    Клиент отправляет части PUT-запросами в любом порядке и параллельно,
+    узнаёт принятые части через GET и завершает загрузку через /complete.
+    Под сессией лежит multipart upload MinIO, поэтому части хранятся в
+    хранилище, а не на API-сервере.
+    """
+    if data.size > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Файл слишком большой. Максимальный размер: {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+
+    part_size = max(settings.UPLOAD_SESSION_PART_SIZE, -(-data.size // MAX_PARTS))
+
+    result = await session.execute(
+        select(FileModel.id).where(
+            FileModel.owner == user.id,
+            FileModel.original_filename == data.filename
+        )
+    )
+    if result.first():
+        raise HTTPException(
+            status_code=409,
+            detail=f"Файл с именем '{data.filename}' уже существует у вас"
+        )
+
+    file_extension = os.path.splitext(data.filename)[1].lower()
+    unique_filename = f"{uuid.uuid4()}{file_extension}"
+    content_type = data.content_type or "application/octet-stream"
+
+    try:
+        upload_id = await create_multipart_upload(
+            unique_filename, settings.MINIO_BUCKET_NAME, content_type
+        )
+    except Exception as e:
+        print(f"Error creating multipart upload: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Ошибка при создании загрузки в хранилище"
+        )
+
+    upload_session = UploadSession(
+        upload_id=upload_id,
+        name=unique_filename,
+        original_filename=data.filename,
+        type=content_type,
+        owner=user.id,
+        size=data.size,
+        part_size=part_size,
+        expires_at=datetime.now(timezone.utc).replace(tzinfo=None)
+        + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS),
+    )
+    session.add(upload_session)
+    await session.commit()
+
+    return session_state(upload_session, [])
+
+
+@router.get("/{session_id}")
+async def get_upload_session(
+    session_id: int,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    upload_session = await get_owned_session(session, session_id, user)
+
+    parts = await list_uploaded_parts(
+        upload_session.name, settings.MINIO_BUCKET_NAME, upload_session.upload_id
+    )
+    return session_state(upload_session, parts)
+
+
+@router.put("/{session_id}/parts/{part_number}")
+async def put_upload_part(
+    session_id: int,
+    part_number: int,
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    """Принимает одну часть файла (сырое тело запроса) и передаёт её в MinIO."""
+    upload_session = await get_owned_session(session, session_id, user)
+    await release_connection(session)
+
+    if not 1 <= part_number <= upload_session.total_parts:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Номер части должен быть от 1 до {upload_session.total_parts}"
+        )
+
+    expected_size = upload_session.expected_part_size(part_number)
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) != expected_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Размер части {part_number} должен быть {expected_size} байт"
+        )
+
+    data = bytearray()
+    async for chunk in request.stream():
+        data += chunk
+        if len(data) > expected_size:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Размер части {part_number} должен быть {expected_size} байт"
+            )
+
+    if len(data) != expected_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Размер части {part_number} должен быть {expected_size} байт"
+        )
+
+    try:
+        etag = await upload_part(
+            upload_session.name,
+            settings.MINIO_BUCKET_NAME,
+            upload_session.upload_id,
+            part_number,
+            bytes(data),
+        )
+    except Exception as e:
+        print(f"Error uploading part: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Ошибка при загрузке части в хранилище"
+        )
+
+    return {
+        "session_id": upload_session.id,
+        "part_number": part_number,
+        "size": len(data),
+        "etag": etag,
+    }
+
+
+@router.post("/{session_id}/complete")
+async def complete_upload_session(
+    session_id: int,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    upload_session = await get_owned_session(session, session_id, user)
+
+    parts = await list_uploaded_parts(
+        upload_session.name, settings.MINIO_BUCKET_NAME, upload_session.upload_id
+    )
+    state = session_state(upload_session, parts)
+    if state["missing_parts"]:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Не все части загружены", "missing_parts": state["missing_parts"]}
+        )
+
+    try:
+        await complete_multipart_upload(
+            upload_session.name,
+            settings.MINIO_BUCKET_NAME,
+            upload_session.upload_id,
+            sorted(parts, key=lambda part: part["PartNumber"]),
+        )
+    except Exception as e:
+        print(f"Error completing multipart upload: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail="Ошибка при завершении загрузки в хранилище"
+        )
+
+    file_path = f"http://{settings.MINIO_ENDPOINT}:9000/{settings.MINIO_BUCKET_NAME}/{upload_session.name}"
+    db_file = FileModel(
+        name=upload_session.name,
+        original_filename=upload_session.original_filename,
+        type=upload_session.type,
+        owner=user.id,
+        path=file_path,
+        size=upload_session.size,
+    )
+    session.add(db_file)
+    await session.delete(upload_session)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Имя заняли, пока шла загрузка: объект уже собран, сессия
+        # больше не нужна
+        await session.rollback()
+        await session.execute(delete(UploadSession).where(UploadSession.id == session_id))
+        await session.commit()
+        await delete_from_minio(db_file.name, settings.MINIO_BUCKET_NAME)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Файл с именем '{db_file.original_filename}' уже существует у вас"
+        )
+
+    return {
+        "status": "success",
+        "file_id": db_file.id,
+        "filename": db_file.original_filename,
+        "saved_as": db_file.name,
+        "size": db_file.size,
+        "download_url": f"/files/{db_file.id}/download",
+        "minio_url": file_path,
+    }
+
+
+@router.delete("/{session_id}")
+async def abort_upload_session(
+    session_id: int,
+    session: AsyncSession = Depends(get_session),
+    user: User = Depends(get_current_user)
+):
+    upload_session = await session.get(UploadSession, session_id)
+
+    if not upload_session or upload_session.owner != user.id:
+        raise HTTPException(status_code=404, detail="Сессия загрузки не найдена")
+
+    aborted = await abort_multipart_upload(
+        upload_session.name, settings.MINIO_BUCKET_NAME, upload_session.upload_id
+    )
+    if not aborted:
+        raise HTTPException(
+            status_code=500,
+            detail="Ошибка при отмене загрузки в хранилище"
+        )
+
+    await session.delete(upload_session)
+    await session.commit()
+
+    return {
+        "status": "success",
+        "message": "Загрузка отменена",
+        "session_id": session_id,
+    }
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import List, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import SecretStr, Field
@@ -14,21 +15,97 @@ class Settings(BaseSettings):
     DB_NAME: str = Field(default="filecloud")
     DB_USER: str = Field(default="filecloud_user")
     DB_PASSWORD: SecretStr = Field(default="filecloud_password")
+    DB_POOL_SIZE: int = Field(default=10)
+    DB_MAX_OVERFLOW: int = Field(default=20)
+    DB_POOL_RECYCLE_SECONDS: int = Field(default=1800)
+    DB_POOL_TIMEOUT_SECONDS: float = Field(default=30.0)
+    DB_POOL_PRE_PING: bool = Field(default=True)
+    # 0 отключает кэш подготовленных выражений (нужно за pgbouncer в режиме transaction)
+    DB_STATEMENT_CACHE_SIZE: int = Field(default=100)
+    # statement_timeout на стороне сервера; 0 — без ограничения
+    DB_STATEMENT_TIMEOUT_MS: int = Field(default=30000)
+    # Реплики только для чтения (полные URL postgresql+asyncpg://...);
+    # пустой список — всё идёт на primary
+    DB_REPLICA_URLS: List[str] = Field(default_factory=list)
+    DB_REPLICA_MAX_LAG_SECONDS: float = Field(default=5.0)
+    DB_REPLICA_CHECK_INTERVAL_SECONDS: float = Field(default=5.0)
+    DB_REPLICA_CHECK_TIMEOUT_SECONDS: float = Field(default=2.0)
+    # Сколько после записи клиент читает только с primary
+    DB_READ_YOUR_WRITES_SECONDS: int = Field(default=15)
+
+    # Кэш пользователей в get_current_user
+    USER_CACHE_ENABLED: bool = Field(default=True)
+    USER_CACHE_MAX_ENTRIES: int = Field(default=10000)
+    USER_CACHE_TTL_SECONDS: float = Field(default=60.0)
 
     # JWT
     SECRET_KEY: SecretStr
     ALGORITHM: str = Field(default="HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = Field(default=30)
     REFRESH_TOKEN_EXPIRE_DAYS: int = Field(default=7)
+    # Кэш проверенных access-токенов; 0 отключает
+    TOKEN_CACHE_MAX_ENTRIES: int = Field(default=10000)
+    # Argon2: параметры хэша и пул потоков для хэширования
+    PASSWORD_HASH_TIME_COST: int = Field(default=3)
+    PASSWORD_HASH_MEMORY_COST_KIB: int = Field(default=65536)
+    PASSWORD_HASH_PARALLELISM: int = Field(default=4)
+    PASSWORD_HASH_WORKERS: int = Field(default=2)
+    # Сколько заданий может ждать свободного потока, прежде чем отвечать 503
+    PASSWORD_HASH_MAX_QUEUE: int = Field(default=16)
+    # Как часто подгружать новые записи blacklist_tokens из БД
+    REVOCATION_POLL_INTERVAL_SECONDS: float = Field(default=2.0)
+    # Лимит попыток входа и регистрации: корзина токенов на IP клиента и
+    # на email. "memory" — свой счётчик в каждом воркере, "postgres" —
+    # общий для всех воркеров (таблица auth_rate_limits)
+    AUTH_RATE_LIMIT_ENABLED: bool = Field(default=True)
+    AUTH_RATE_LIMIT_BACKEND: str = Field(default="memory")
+    AUTH_RATE_LIMIT_IP_BURST: int = Field(default=20)
+    AUTH_RATE_LIMIT_IP_PER_MINUTE: float = Field(default=10.0)
+    AUTH_RATE_LIMIT_EMAIL_BURST: int = Field(default=5)
+    AUTH_RATE_LIMIT_EMAIL_PER_MINUTE: float = Field(default=2.0)
+    AUTH_RATE_LIMIT_MAX_KEYS: int = Field(default=100000)
+    # Адреса или подсети обратных прокси (nginx), которым можно верить в
+    # X-Forwarded-For / X-Real-IP; от остальных берётся адрес соединения
+    AUTH_TRUSTED_PROXIES: List[str] = Field(default_factory=list)
 
     # MinIO
     MINIO_ENDPOINT: str = Field(default="minio")
     MINIO_ACCESS_KEY: str = Field(default="minioadmin")
     MINIO_SECRET_KEY: SecretStr = Field(default="minioadmin")
     MINIO_BUCKET_NAME: str = Field(default="uploads")
+    MINIO_MAX_POOL_CONNECTIONS: int = Field(default=50)
+    MINIO_KEEPALIVE_TIMEOUT: float = Field(default=30.0)
+    MINIO_CONNECT_TIMEOUT: float = Field(default=5.0)
+    MINIO_READ_TIMEOUT: float = Field(default=60.0)
+    # Адрес MinIO, доступный браузеру; нужен для presigned URL
+    MINIO_PUBLIC_URL: Optional[str] = Field(default=None)
+    PRESIGNED_URLS_ENABLED: bool = Field(default=False)
+    PRESIGNED_URL_EXPIRE_SECONDS: int = Field(default=300)
 
     # File storage
     UPLOAD_DIR: str = Field(default="static")
+    UPLOAD_BATCH_S3_CONCURRENCY: int = Field(default=4)
+    UPLOAD_SESSION_PART_SIZE: int = Field(default=8 * 1024 * 1024)
+    UPLOAD_SESSION_TTL_HOURS: int = Field(default=24)
+    UPLOAD_SESSION_REAP_INTERVAL_SECONDS: int = Field(default=600)
+    # Дисковый кэш горячих объектов в UPLOAD_DIR; лимит на весь каталог,
+    # общий для воркеров; 0 отключает кэш
+    FILE_CACHE_MAX_BYTES: int = Field(default=1024 * 1024 * 1024)
+    FILE_CACHE_MAX_ENTRY_BYTES: int = Field(default=100 * 1024 * 1024)
+    # Сколько после учтённого скачивания по публичной ссылке можно
+    # докачивать файл Range-запросами без учёта (но не дольше срока ссылки)
+    # и сколько таких докачек допускает одно скачивание
+    SHARE_RESUME_WINDOW_SECONDS: int = Field(default=6 * 3600)
+    SHARE_MAX_RESUMES: int = Field(default=3)
+
+    # Токен для /metrics (Authorization: Bearer <токен>); без него
+    # эндпоинт отключён и отвечает 404
+    METRICS_TOKEN: Optional[SecretStr] = Field(default=None)
+
+    # Очистка истёкших ссылок и отозванных токенов
+    MAINTENANCE_SWEEP_INTERVAL_SECONDS: int = Field(default=600)
+    MAINTENANCE_SWEEP_BATCH_SIZE: int = Field(default=500)
+    MAINTENANCE_SWEEP_ROWS_PER_SECOND: float = Field(default=2000.0)
 
     model_config = SettingsConfigDict(
         env_file=Path(__file__).parent.parent / ".env",
@@ -1,16 +1,273 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy import Select, event, text
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
     AsyncAttrs,
+    AsyncEngine,
 )
-from sqlalchemy.orm import DeclarativeBase, declared_attr
-from app.config import get_db_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import DeclarativeBase, Session, declared_attr
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from app.config import get_db_url, settings
+
+
+logger = logging.getLogger(__name__)
 
 
 DATABASE_URL = get_db_url()
 
-engine = create_async_engine(DATABASE_URL)
-async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+# Границы гистограммы ожидания соединения из пула, в секундах
+CHECKOUT_WAIT_BUCKETS = (0.001, 0.01, 0.1, 1.0)
+
+
+class PoolMetrics:
+    """Счётчики ожидания соединений: отличают нехватку пула от медленных запросов."""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(CHECKOUT_WAIT_BUCKETS) + 1)
+
+    def observe(self, wait: float) -> None:
+        self.checkouts += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        for index, bound in enumerate(CHECKOUT_WAIT_BUCKETS):
+            if wait <= bound:
+                self.wait_buckets[index] += 1
+                return
+        self.wait_buckets[-1] += 1
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredAsyncQueuePool(AsyncAdaptedQueuePool):
+    """Пул, замеряющий время получения соединения (в том числе ожидание свободного)."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.observe(time.perf_counter() - started)
+        return connection
+
+
+def get_pool_stats() -> dict:
+    pool = engine.pool
+    bucket_labels = [f"le_{int(bound * 1000)}ms" for bound in CHECKOUT_WAIT_BUCKETS] + ["inf"]
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "checkouts": pool_metrics.checkouts,
+        "checkout_timeouts": pool_metrics.timeouts,
+        "checkout_wait_avg_ms": (
+            pool_metrics.wait_total / pool_metrics.checkouts * 1000 if pool_metrics.checkouts else 0.0
+        ),
+        "checkout_wait_max_ms": pool_metrics.wait_max * 1000,
+        "checkout_wait_buckets": dict(zip(bucket_labels, pool_metrics.wait_buckets)),
+    }
+
+
+server_settings = {}
+if settings.DB_STATEMENT_TIMEOUT_MS > 0:
+    server_settings["statement_timeout"] = str(settings.DB_STATEMENT_TIMEOUT_MS)
+
+
+def create_db_engine(url: str, poolclass=AsyncAdaptedQueuePool) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        poolclass=poolclass,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={
+            # Кэш SQLAlchemy-адаптера и собственный кэш asyncpg
+            "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+            "server_settings": server_settings,
+        },
+    )
+
+
+engine = create_db_engine(DATABASE_URL, poolclass=MeteredAsyncQueuePool)
+
+
+# Отставание реплики в секундах; NULL, если реплика ещё ничего не применила
+# или не получает WAL. Совпадение receive и replay LSN значит «догнала»,
+# только пока WAL-receiver подключён к primary: реплика, потерявшая
+# upstream, тоже всё применила и иначе показывала бы нулевое отставание.
+# Без роли pg_read_all_stats status не виден, но строка есть, пока жив
+# процесс WAL-receiver
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE status IS NULL OR status = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class Replica:
+    """Реплика для чтения и её состояние по последней проверке."""
+
+    def __init__(self, url: str) -> None:
+        self.engine = create_db_engine(url)
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.address = f"{self.engine.url.host}:{self.engine.url.port or 5432}"
+        event.listen(self.engine.sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, context) -> None:
+        # Обрыв соединения выводит реплику из ротации до следующей проверки
+        if context.is_disconnect:
+            self.healthy = False
+
+
+class ReplicaRouter:
+    """
+    Выбирает реплику для чтения.
+
+    В ротации только реплики, прошедшие последнюю проверку и отстающие
+    не больше чем на DB_REPLICA_MAX_LAG_SECONDS. Если таких нет, чтение
+    идёт на primary.
+    """
+
+    def __init__(self, urls: List[str], max_lag: float) -> None:
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self._next = 0
+
+    def choose(self) -> Optional[AsyncEngine]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next].engine
+
+    async def check(self) -> None:
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+
+    async def _check(self, replica: Replica) -> None:
+        was_healthy = replica.healthy
+        try:
+            async with replica.engine.connect() as connection:
+                lag = await asyncio.wait_for(
+                    connection.scalar(REPLICA_LAG_QUERY),
+                    timeout=settings.DB_REPLICA_CHECK_TIMEOUT_SECONDS,
+                )
+        except Exception as e:
+            replica.healthy = False
+            replica.lag = None
+            replica.error = str(e) or type(e).__name__
+        else:
+            replica.lag = float(lag) if lag is not None else None
+            replica.healthy = replica.lag is not None and replica.lag <= self.max_lag
+            replica.error = None
+
+        if was_healthy != replica.healthy:
+            logger.warning(
+                f"Replica {replica.address} is "
+                f"{'back in rotation' if replica.healthy else 'out of rotation'} "
+                f"(lag={replica.lag}, error={replica.error})"
+            )
+
+    def stats(self) -> list:
+        # Адреса и тексты ошибок только в логах: метрики не должны
+        # раскрывать топологию БД
+        return [
+            {
+                "replica": index,
+                "healthy": replica.healthy,
+                "lag_seconds": replica.lag,
+                "failing": replica.error is not None,
+            }
+            for index, replica in enumerate(self.replicas)
+        ]
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replica_router = ReplicaRouter(settings.DB_REPLICA_URLS, settings.DB_REPLICA_MAX_LAG_SECONDS)
+
+
+async def run_replica_health_checks() -> None:
+    while True:
+        try:
+            await replica_router.check()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Replica health check failed: {e}")
+
+        await asyncio.sleep(settings.DB_REPLICA_CHECK_INTERVAL_SECONDS)
+
+
+class RoutingSession(Session):
+    """
+    Сессия, которая отправляет чтение на реплику из info["replica"].
+
+    На primary остаются запись, SELECT ... FOR UPDATE и любое чтение после
+    первой записи в этой сессии: запрос должен видеть собственные изменения.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if (
+            replica is not None
+            and not self.info.get("wrote")
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            return replica.sync_engine
+        return engine.sync_engine
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_dml(orm_execute_state) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_flush(session, flush_context) -> None:
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _notify_write_commit(session) -> None:
+    # Хук ставит get_session: закреплённому за primary клиенту не страшно
+    # отставание реплик сразу после его записи
+    on_write_commit = session.info.get("on_write_commit")
+    if session.info.get("wrote") and on_write_commit is not None:
+        on_write_commit()
+
+
+async_session_maker = async_sessionmaker(
+    engine, sync_session_class=RoutingSession, expire_on_commit=False
+)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
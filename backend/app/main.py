@@ -1,10 +1,22 @@
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.config import settings
+from app.db import get_pool_stats, replica_router, run_replica_health_checks
+from core.deps import PrimaryPinMiddleware, require_metrics_token
+from core.file_cache import file_cache
+from core.minio_client import start_s3_client, close_s3_client
+from core.maintenance import run_expired_rows_sweeper
 from core.minio_init import init_minio
-from api.routes import auth, upload, share
+from core.rate_limit import auth_rate_limiter
+from core.revocation import revocation_list, run_revocation_list_refresher
+from core.secure import password_hash_pool, token_cache
+from core.upload_sessions import run_upload_session_reaper
+from core.user_cache import user_cache
+from api.routes import auth, upload, upload_sessions, share
 
 
 @asynccontextmanager
@@ -16,7 +28,9 @@ async def lifespan(app: FastAPI):
     
     print("🚀 Starting FileCloud application...")
     
-    minio_success = init_minio()
+    await start_s3_client()
+    file_cache.load()
+    minio_success = await init_minio()
     if minio_success:
         print(f"✅ MinIO bucket '{settings.MINIO_BUCKET_NAME}' initialized successfully")
     else:
@@ -25,10 +39,30 @@ async def lifespan(app: FastAPI):
     print(f"📊 Database: {settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}")
     print(f"📁 File storage: MinIO at {settings.MINIO_ENDPOINT}:9000")
     print("✅ Application startup complete")
+
+    reaper_task = asyncio.create_task(run_upload_session_reaper())
+    sweeper_task = asyncio.create_task(run_expired_rows_sweeper())
+    # Первая загрузка — в фоне: до неё отзыв проверяется запросом к БД
+    revocation_task = asyncio.create_task(run_revocation_list_refresher())
+    replica_task = None
+    if replica_router.replicas:
+        # Первая проверка до приёма запросов: иначе реплики вне ротации
+        await replica_router.check()
+        replica_task = asyncio.create_task(run_replica_health_checks())
     
     yield
     
     print("🛑 Shutting down FileCloud application...")
+    for task in (reaper_task, sweeper_task, revocation_task, replica_task):
+        if task is None:
+            continue
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await replica_router.dispose()
+    await close_s3_client()
 
 
 app = FastAPI(
@@ -39,6 +73,7 @@ app = FastAPI(
 )
 
 
+app.add_middleware(PrimaryPinMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -52,11 +87,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"],
+    expose_headers=["Content-Disposition", "Content-Range", "Accept-Ranges"],
 )
 
 
 app.include_router(auth.router)
+app.include_router(upload_sessions.router)
 app.include_router(upload.router)
 app.include_router(share.router)
 
@@ -81,6 +117,20 @@ async def health_check():
     }
 
 
+@app.get("/metrics", dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    return {
+        "file_cache": file_cache.stats(),
+        "db_pool": get_pool_stats(),
+        "db_replicas": replica_router.stats(),
+        "user_cache": user_cache.stats(),
+        "revocation_list": revocation_list.stats(),
+        "password_hash_pool": password_hash_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "auth_rate_limit": auth_rate_limiter.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
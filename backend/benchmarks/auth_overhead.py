@@ -0,0 +1,80 @@
+"""
+Накладные расходы аутентификации на один запрос (get_current_user).
+
+Сравнивает проверку подписи JWT на каждом запросе с кэшем проверенных
+токенов. Кэш пользователей прогрет, список отзыва загружен, поэтому БД
+не участвует и замеряется только работа процесса:
+
+    python -m benchmarks.auth_overhead --iterations 200000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from starlette.requests import Request
+
+from core.deps import get_current_user
+from core.revocation import revocation_list
+from core.secure import create_access_token, token_cache, verify_token, verify_token_cached
+from core.user_cache import cache_user
+from models.user import User
+
+
+def make_request(access_token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/auth/me",
+        "headers": [(b"cookie", f"access_token={access_token}".encode())],
+    })
+
+
+def measure(label: str, iterations: int, func) -> None:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<45} {elapsed / iterations * 1e6:8.2f} µs")
+
+
+async def measure_async(label: str, iterations: int, func) -> None:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await func()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<45} {elapsed / iterations * 1e6:8.2f} µs")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args()
+
+    user = User(id=1, name="bench", email="bench@mail.com", created_at=datetime.now())
+    cache_user(user)
+    revocation_list.loaded = True
+
+    token = create_access_token(data={"sub": str(user.id)})
+    request = make_request(token)
+
+    measure("verify_token (HMAC + JSON)", args.iterations, lambda: verify_token(token))
+    verify_token_cached(token)
+    measure("verify_token_cached (hit)", args.iterations, lambda: verify_token_cached(token))
+
+    max_entries = token_cache.max_entries
+    token_cache.max_entries = 0
+    token_cache.clear()
+    await measure_async(
+        "get_current_user, token cache off", args.iterations,
+        lambda: get_current_user(request, session=None),
+    )
+    token_cache.max_entries = max_entries
+    await measure_async(
+        "get_current_user, token cache on", args.iterations,
+        lambda: get_current_user(request, session=None),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
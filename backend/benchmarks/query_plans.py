@@ -0,0 +1,221 @@
+"""
+Сравнение планов горячих запросов до и после индексов миграций
+e4b7a2d9c815 и c4e8a2f6b913.
+
+Исходная схема повторяет индексы ревизии 3d8a5c1f7e62 (предыдущей для
+e4b7a2d9c815), поэтому разница в планах — ровно вклад этих миграций.
+
+Списки повторяют SQL, который строит get_files_user (первая страница и
+страница по курсору); сортировка по имени у чужих файлов индексом не
+покрывается и приведена для сравнения.
+
+Данные генерируются в отдельной схеме, рабочие таблицы не затрагиваются:
+
+    python -m benchmarks.query_plans --files 2000000 --shares 2000000 --links 500000
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import get_db_url
+
+
+SCHEMA = "bench_query_plans"
+
+# Индексы ревизии 3d8a5c1f7e62, кроме первичных ключей
+BASELINE_INDEXES = [
+    "CREATE INDEX ix_files_owner_created_at ON files (owner, created_at, id)",
+    "CREATE INDEX ix_files_owner_original_filename ON files (owner, original_filename, id)",
+    "CREATE INDEX ix_files_owner_size ON files (owner, size, id)",
+    "CREATE UNIQUE INDEX ix_share_links_token ON share_links (token)",
+]
+
+# Изменения e4b7a2d9c815 и c4e8a2f6b913 в итоговом виде
+MIGRATION_INDEXES = [
+    "DROP INDEX ix_files_owner_original_filename",
+    "CREATE UNIQUE INDEX ix_files_owner_original_filename ON files (owner, original_filename)",
+    "CREATE UNIQUE INDEX ix_file_shares_file_id_user_id ON file_shares (file_id, user_id)",
+    "CREATE INDEX ix_file_shares_user_id_shared_at_file_id ON file_shares (user_id, shared_at, file_id)",
+    "CREATE INDEX ix_share_links_file_id ON share_links (file_id)",
+]
+
+QUERIES = {
+    "conflict check (create_file)": """
+        SELECT id FROM files
+        WHERE owner = {owner} AND original_filename = '{filename}'
+    """,
+    "access check (download_file)": """
+        SELECT id FROM file_shares
+        WHERE file_id = {file_id} AND user_id = {user_id}
+    """,
+    "shared listing, first page (get_files_user)": """
+        SELECT f.id, f.name, f.original_filename, f.type, f.size, f.created_at,
+               s.shared_at AS sort_key, false AS is_owner
+        FROM files AS f
+        JOIN file_shares AS s ON f.id = s.file_id
+        WHERE s.user_id = {user_id}
+        ORDER BY s.shared_at DESC, s.file_id DESC
+        LIMIT 51
+    """,
+    "shared listing, cursor page (get_files_user)": """
+        SELECT f.id, f.name, f.original_filename, f.type, f.size, f.created_at,
+               s.shared_at AS sort_key, false AS is_owner
+        FROM files AS f
+        JOIN file_shares AS s ON f.id = s.file_id
+        WHERE s.user_id = {user_id}
+          AND (s.shared_at, s.file_id) < ('{cursor_shared_at}', {cursor_file_id})
+        ORDER BY s.shared_at DESC, s.file_id DESC
+        LIMIT 51
+    """,
+    "shared listing by name (get_files_user, sort=name)": """
+        SELECT f.id, f.name, f.original_filename, f.type, f.size, f.created_at,
+               f.original_filename AS sort_key, false AS is_owner
+        FROM files AS f
+        JOIN file_shares AS s ON f.id = s.file_id
+        WHERE s.user_id = {user_id}
+        ORDER BY f.original_filename DESC, s.file_id DESC
+        LIMIT 51
+    """,
+    "link cascade (delete_file)": """
+        DELETE FROM share_links WHERE file_id = {link_file_id}
+    """,
+}
+
+
+async def seed(conn, files: int, shares: int, links: int, owners: int) -> None:
+    await conn.exec_driver_sql(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.exec_driver_sql(f"CREATE SCHEMA {SCHEMA}")
+    await conn.exec_driver_sql(f"SET search_path TO {SCHEMA}")
+
+    await conn.exec_driver_sql("""
+        CREATE TABLE files (
+            id bigserial PRIMARY KEY,
+            name varchar(255) NOT NULL,
+            owner integer NOT NULL,
+            original_filename varchar(255) NOT NULL,
+            type varchar NOT NULL,
+            size bigint NOT NULL,
+            created_at timestamp NOT NULL
+        )
+    """)
+    await conn.exec_driver_sql("""
+        CREATE TABLE file_shares (
+            id bigserial PRIMARY KEY,
+            file_id bigint NOT NULL,
+            user_id integer NOT NULL,
+            shared_at timestamp NOT NULL
+        )
+    """)
+    await conn.exec_driver_sql("""
+        CREATE TABLE share_links (
+            id bigserial PRIMARY KEY,
+            token varchar(64) NOT NULL,
+            file_id bigint NOT NULL,
+            expires_at timestamp NOT NULL
+        )
+    """)
+
+    await conn.exec_driver_sql(f"""
+        INSERT INTO files (name, owner, original_filename, type, size, created_at)
+        SELECT md5(g::text) || '.bin', g % {owners},
+               'file-' || (g % {owners}) || '-' || (g / {owners}) || '.bin',
+               'application/octet-stream', (random() * 1e8)::bigint, now() - g * interval '1 second'
+        FROM generate_series(1, {files}) AS g
+    """)
+    # Пары (file_id, user_id) должны быть уникальны, как того требует новый индекс
+    await conn.exec_driver_sql(f"""
+        INSERT INTO file_shares (file_id, user_id, shared_at)
+        SELECT 1 + (g::bigint * 104729) % {files}, (g::bigint * 7919) % {owners},
+               min(now() - g * interval '1 second')
+        FROM generate_series(1, {shares}) AS g
+        GROUP BY 1, 2
+    """)
+    await conn.exec_driver_sql(f"""
+        INSERT INTO share_links (token, file_id, expires_at)
+        SELECT md5(g::text), 1 + (g * 31) % {files}, now() + interval '1 day'
+        FROM generate_series(1, {links}) AS g
+    """)
+    for statement in BASELINE_INDEXES:
+        await conn.exec_driver_sql(statement)
+    await conn.exec_driver_sql("ANALYZE files, file_shares, share_links")
+
+
+async def sample_params(conn) -> dict:
+    """Берёт значения из середины таблиц, чтобы запросы находили реальные строки."""
+    owner, filename = (await conn.exec_driver_sql(
+        "SELECT owner, original_filename FROM files ORDER BY id OFFSET (SELECT count(*) / 2 FROM files) LIMIT 1"
+    )).one()
+    file_id, user_id = (await conn.exec_driver_sql(
+        "SELECT file_id, user_id FROM file_shares ORDER BY id OFFSET (SELECT count(*) / 2 FROM file_shares) LIMIT 1"
+    )).one()
+    # Курсор — строка из середины списка этого пользователя
+    cursor_shared_at, cursor_file_id = (await conn.exec_driver_sql(
+        f"SELECT shared_at, file_id FROM file_shares WHERE user_id = {user_id} "
+        f"ORDER BY shared_at DESC, file_id DESC "
+        f"OFFSET (SELECT count(*) / 2 FROM file_shares WHERE user_id = {user_id}) LIMIT 1"
+    )).one()
+    link_file_id = (await conn.exec_driver_sql(
+        "SELECT file_id FROM share_links ORDER BY id OFFSET (SELECT count(*) / 2 FROM share_links) LIMIT 1"
+    )).scalar_one()
+    return {
+        "owner": owner,
+        "filename": filename,
+        "file_id": file_id,
+        "user_id": user_id,
+        "cursor_shared_at": cursor_shared_at,
+        "cursor_file_id": cursor_file_id,
+        "link_file_id": link_file_id,
+    }
+
+
+async def explain_all(conn, title: str, params: dict) -> None:
+    print(f"\n===== {title} =====")
+    for name, query in QUERIES.items():
+        transaction = await conn.begin_nested()
+        result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {query.format(**params)}")
+        plan = [row[0] for row in result]
+        await transaction.rollback()
+        print(f"\n--- {name}")
+        print("\n".join(plan))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=2_000_000)
+    parser.add_argument("--shares", type=int, default=2_000_000)
+    parser.add_argument("--links", type=int, default=500_000)
+    parser.add_argument("--owners", type=int, default=10_000)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после прогона")
+    args = parser.parse_args()
+
+    engine = create_async_engine(get_db_url())
+    try:
+        async with engine.connect() as conn:
+            started = time.perf_counter()
+            await seed(conn, args.files, args.shares, args.links, args.owners)
+            await conn.commit()
+            print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+            params = await sample_params(conn)
+            await explain_all(conn, "до миграций (3d8a5c1f7e62)", params)
+
+            started = time.perf_counter()
+            for statement in MIGRATION_INDEXES:
+                await conn.exec_driver_sql(statement)
+            await conn.exec_driver_sql("ANALYZE files, file_shares, share_links")
+            await conn.commit()
+            print(f"\nIndexes built in {time.perf_counter() - started:.1f}s")
+
+            await explain_all(conn, "после e4b7a2d9c815 и c4e8a2f6b913", params)
+
+            if not args.keep:
+                await conn.exec_driver_sql(f"DROP SCHEMA {SCHEMA} CASCADE")
+                await conn.commit()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
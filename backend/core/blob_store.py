@@ -0,0 +1,120 @@
+"""Дедупликация объектов в MinIO по SHA-256 содержимого со счётчиком ссылок"""
+import logging
+from typing import Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import RoutingSession
+from core.minio_client import copy_object, delete_from_minio
+from models.blob import Blob
+
+logger = logging.getLogger(__name__)
+
+# Хэши объектов, скопированных в текущей транзакции сессии: при откате их
+# удаляет rollback_new_blobs, после commit на них уже ссылаются строки blobs
+NEW_BLOBS_INFO_KEY = "new_blob_digests"
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _forget_new_blobs(session) -> None:
+    session.info.pop(NEW_BLOBS_INFO_KEY, None)
+
+
+def temporary_key(unique_name: str) -> str:
+    """Ключ, под которым файл лежит, пока не известен его хэш."""
+    return f"tmp/{unique_name}"
+
+
+async def lock_digest(session: AsyncSession, digest: str) -> None:
+    """
+    Транзакционная advisory-блокировка на хэш.
+
+    Сериализует создание и удаление одного и того же blob между воркерами,
+    чтобы объект не был удалён в момент, когда на него появляется новая ссылка.
+    """
+    await session.execute(select(func.pg_advisory_xact_lock(func.hashtextextended(digest, 0))))
+
+
+async def acquire_blob(
+    session: AsyncSession,
+    temp_key: str,
+    digest: str,
+    size: int,
+) -> Blob:
+    """
+    Возвращает blob для загруженного содержимого и увеличивает его ref_count.
+
+    Если такого содержимого ещё нет, временный объект копируется под ключ
+    sha256/<digest>. Временный объект удаляет вызывающий код после commit;
+    при ошибке вызывающий код откатывает транзакцию через rollback_new_blobs,
+    иначе скопированный объект останется в бакете без строки blobs.
+    """
+    await lock_digest(session, digest)
+
+    result = await session.execute(select(Blob).where(Blob.digest == digest))
+    blob = result.scalar_one_or_none()
+
+    if blob is None:
+        blob = Blob(digest=digest, size=size, ref_count=0)
+        await copy_object(temp_key, blob.key, settings.MINIO_BUCKET_NAME)
+        session.info.setdefault(NEW_BLOBS_INFO_KEY, []).append(digest)
+        session.add(blob)
+
+    blob.ref_count += 1
+    await session.flush()
+    return blob
+
+
+async def rollback_new_blobs(session: AsyncSession) -> None:
+    """
+    Откатывает транзакцию и удаляет объекты, скопированные в ней acquire_blob.
+
+    После отката блокировки хэшей отпущены, и другой воркер мог успеть
+    создать тот же blob заново под тем же ключом. Поэтому объект удаляется
+    под повторно взятой блокировкой и только если строки blobs для него нет.
+    """
+    digests = sorted(set(session.info.pop(NEW_BLOBS_INFO_KEY, ())))
+    await session.rollback()
+    if not digests:
+        return
+
+    try:
+        for digest in digests:
+            await lock_digest(session, digest)
+        result = await session.execute(select(Blob.digest).where(Blob.digest.in_(digests)))
+        referenced = set(result.scalars())
+        for digest in digests:
+            if digest not in referenced:
+                await delete_from_minio(Blob(digest=digest).key, settings.MINIO_BUCKET_NAME)
+        # Транзакция только читала; commit отпускает блокировки
+        await session.commit()
+    except Exception as e:
+        # Исходную ошибку загрузки не подменяем
+        logger.error(f"Failed to delete uncommitted blobs {digests}: {e}")
+        await session.rollback()
+
+
+async def release_blob(session: AsyncSession, blob_id: int) -> Optional[str]:
+    """
+    Уменьшает ref_count и возвращает ключ объекта, если ссылок не осталось.
+
+    Строка blob удаляется в той же транзакции; объект в MinIO удаляет
+    вызывающий код до commit, чтобы при ошибке хранилища откатить и счётчик.
+    """
+    blob = await session.get(Blob, blob_id)
+    if blob is None:
+        return None
+
+    await lock_digest(session, blob.digest)
+    await session.refresh(blob)
+
+    blob.ref_count -= 1
+    if blob.ref_count > 0:
+        await session.flush()
+        return None
+
+    await session.delete(blob)
+    await session.flush()
+    return blob.key
@@ -1,14 +1,21 @@
-from fastapi import HTTPException, status, Request, Response
-from typing import Optional, Dict, Any
+import secrets
+import time
+
+from fastapi import Depends, HTTPException, status, Request, Response
+from typing import AsyncIterator, Optional, Dict, Any
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import async_session_maker
+from app.config import settings
+from app.db import async_session_maker, replica_router
 
 
 from models.user import User
 
-from core.secure import verify_token
+from core.revocation import is_token_revoked
+from core.secure import token_id, verify_token_cached
+from core.user_cache import cache_user, get_cached_user
 from core.auth_cookies import (
     set_auth_cookies,
     delete_auth_cookies,
@@ -75,7 +82,115 @@ def get_auth_cookies(response: Response) -> AuthCookies:
     return AuthCookies(response)
 
 
-async def get_current_user(request: Request) -> Dict:
+PRIMARY_PIN_COOKIE: str = "db_primary_until"
+# Флаг в request.state: запрос зафиксировал запись
+PRIMARY_PIN_STATE_KEY: str = "pin_to_primary"
+
+
+def pin_to_primary(response: Response) -> None:
+    """Отправляет чтение клиента на primary на DB_READ_YOUR_WRITES_SECONDS."""
+    window = settings.DB_READ_YOUR_WRITES_SECONDS
+    response.set_cookie(
+        key=PRIMARY_PIN_COOKIE,
+        value=str(int(time.time()) + window),
+        max_age=window,
+        httponly=True,
+        samesite="lax",
+    )
+
+
+def is_pinned_to_primary(request: Request) -> bool:
+    try:
+        return int(request.cookies.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class PrimaryPinMiddleware:
+    """
+    Ставит cookie закрепления за primary на ответ, который реально уходит.
+
+    Cookie, поставленный на Response из зависимости, FastAPI теряет, если
+    обработчик сам возвращает Response (например, StreamingResponse при
+    скачивании). Поэтому get_session только отмечает запись в
+    request.state, а заголовок добавляется здесь, в начале ответа.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_pin(message) -> None:
+            if message["type"] == "http.response.start" and scope.get("state", {}).get(PRIMARY_PIN_STATE_KEY):
+                cookie = Response()
+                pin_to_primary(cookie)
+                message["headers"] = [
+                    *message.get("headers", []),
+                    *(header for header in cookie.raw_headers if header[0] == b"set-cookie"),
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
+
+
+async def get_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Сессия БД на время запроса.
+
+    FastAPI кэширует зависимость в пределах запроса, поэтому get_current_user
+    и обработчик получают одну и ту же сессию и одно соединение из пула.
+    Обработчик сам вызывает commit(); всё незафиксированное откатывается
+    при ошибке и при закрытии сессии после ответа.
+
+    Зафиксированная запись закрепляет клиента за primary (cookie ставит
+    PrimaryPinMiddleware), чтобы следующие запросы на чтение видели её,
+    даже если реплики отстают.
+    """
+    async with async_session_maker() as session:
+        if replica_router.replicas and settings.DB_READ_YOUR_WRITES_SECONDS > 0:
+            session.info["on_write_commit"] = lambda: setattr(request.state, PRIMARY_PIN_STATE_KEY, True)
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+
+
+async def use_read_replica(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> None:
+    """
+    Направляет чтение сессии запроса на реплику.
+
+    Подключается в dependencies= эндпоинтов только на чтение: такие
+    зависимости выполняются первыми, поэтому и поиск пользователя в
+    get_current_user уходит на реплику. Клиент, недавно что-то записавший,
+    продолжает читать с primary.
+    """
+    if not is_pinned_to_primary(request):
+        session.info["replica"] = replica_router.choose()
+
+
+async def release_connection(session: AsyncSession) -> None:
+    """
+    Завершает транзакцию только для чтения и возвращает соединение в пул.
+
+    Вызывается перед долгим вводом-выводом (потоковая загрузка или отдача),
+    чтобы соединение не простаивало всё это время. Сессия остаётся рабочей:
+    следующий запрос к БД возьмёт соединение заново.
+    """
+    await session.commit()
+
+
+async def get_current_user(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+) -> User:
     access_token = request.cookies.get("access_token")
 
     if not access_token:
@@ -84,7 +199,7 @@ async def get_current_user(request: Request) -> Dict:
             detail="Access token not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    payload = verify_token(access_token)
+    payload = verify_token_cached(access_token)
 
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -97,14 +212,46 @@ async def get_current_user(request: Request) -> Dict:
     if not user_id:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    async with async_session_maker() as session:
-        stmt = select(User).where(User.id == int(user_id))
-        result = await session.execute(stmt)
-        user = result.scalar_one_or_none()
+    if await is_token_revoked(session, token_id(payload, access_token)):
+        raise HTTPException(status_code=401, detail="Token revoked")
+
+    # Токен уже подтверждает, кто это; БД нужна только при промахе кэша
+    user = get_cached_user(int(user_id))
+    if user is not None:
+        return user
+
+    stmt = select(User).where(User.id == int(user_id))
+    result = await session.execute(stmt)
+    user = result.scalar_one_or_none()
 
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-            )
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+
+    # Отвязываем пользователя от сессии: откат в обработчике не должен
+    # сбрасывать уже загруженные атрибуты
+    session.expunge(user)
+    cache_user(user)
 
     return user
+
+
+async def require_metrics_token(request: Request) -> None:
+    """
+    Пускает к /metrics только с токеном METRICS_TOKEN.
+
+    Метрики раскрывают устройство развёртывания (пул, кэши, реплики),
+    поэтому без настроенного токена эндпоинт делает вид, что его нет.
+    """
+    if settings.METRICS_TOKEN is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    expected = settings.METRICS_TOKEN.get_secret_value()
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.encode(), expected.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -0,0 +1,246 @@
+"""LRU-кэш горячих объектов MinIO на локальном диске (UPLOAD_DIR)"""
+import hashlib
+import os
+import uuid
+from collections import OrderedDict
+from typing import BinaryIO, List, Optional, Tuple
+
+import anyio
+
+from app.config import settings, get_files_path
+
+
+TEMP_PREFIX = ".tmp-"
+
+
+def is_stale_temp(name: str) -> bool:
+    """
+    Недописанный файл, владелец которого уже не работает.
+
+    Временные файлы называются .tmp-<pid>-<uuid>: файлы живых воркеров
+    трогать нельзя, их os.replace ещё впереди. Свой pid при запуске
+    значит, что файл остался от прежнего процесса с тем же номером.
+    """
+    if not name.startswith(TEMP_PREFIX):
+        return False
+    try:
+        pid = int(name[len(TEMP_PREFIX):].split("-", 1)[0])
+    except ValueError:
+        return True
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+def scan_entries(directory: str) -> List[Tuple[float, str, int]]:
+    """Готовые записи каталога кэша: (mtime, имя, размер), старые первыми."""
+    found = []
+    for entry in os.scandir(directory):
+        if not entry.is_file() or entry.name.startswith(TEMP_PREFIX):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            # Другой воркер вытеснил запись между scandir и stat
+            continue
+        found.append((stat.st_mtime, entry.name, stat.st_size))
+    return sorted(found)
+
+
+class CacheWriter:
+    """Заполняет запись кэша по мере того, как объект отдаётся клиенту."""
+
+    def __init__(self, cache: "FileCache", key: str, size: int) -> None:
+        self.cache = cache
+        self.key = key
+        self.size = size
+        self.written = 0
+        self.temp_path = os.path.join(
+            cache.directory, f"{TEMP_PREFIX}{os.getpid()}-{uuid.uuid4().hex}"
+        )
+        self._file = None
+
+    async def write(self, chunk: bytes) -> None:
+        if self._file is None:
+            self._file = await anyio.open_file(self.temp_path, "wb")
+        await self._file.write(chunk)
+        self.written += len(chunk)
+
+    async def commit(self) -> None:
+        if self._file is not None:
+            await self._file.aclose()
+            self._file = None
+        if self.written != self.size:
+            self.abort()
+            return
+        os.replace(self.temp_path, self.cache.path_for(self.key))
+        # Каталог общий: перед вытеснением учитываем записи других воркеров
+        found = await anyio.to_thread.run_sync(scan_entries, self.cache.directory)
+        self.cache.sync(found)
+        self.cache.add(self.key, self.size)
+
+    def abort(self) -> None:
+        try:
+            if self._file is not None:
+                self._file.wrapped.close()
+        except OSError:
+            pass
+        self._file = None
+        try:
+            os.unlink(self.temp_path)
+        except OSError:
+            pass
+
+
+class FileCache:
+    """
+    Ограниченный по байтам LRU-кэш файлов.
+
+    Ключи объектов в MinIO неизменяемы (uuid или sha256), поэтому запись
+    нужно сбрасывать только при удалении объекта. Индекс LRU живёт в памяти
+    процесса, а наличие файла на диске — источник истины: несколько
+    воркеров могут делить один каталог. Перед каждой новой записью индекс
+    перестраивается по каталогу, поэтому max_bytes ограничивает весь
+    каталог, а не долю одного воркера. Время последнего обращения хранится
+    в mtime файла: его обновляет каждое попадание любого воркера.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.directory: Optional[str] = None
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None and self.max_bytes > 0
+
+    def load(self) -> None:
+        """Подключает каталог UPLOAD_DIR и подхватывает уже лежащие там файлы."""
+        if self.max_bytes <= 0:
+            return
+
+        self.directory = os.path.join(get_files_path(), "cache")
+        os.makedirs(self.directory, exist_ok=True)
+
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and is_stale_temp(entry.name):
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    pass
+
+        self.sync(scan_entries(self.directory))
+        self._evict()
+
+    def sync(self, found: List[Tuple[float, str, int]]) -> None:
+        """
+        Перестраивает индекс по содержимому каталога (результату scan_entries).
+
+        Порядок LRU берётся из mtime, который обновляют попадания всех
+        воркеров, а не из atime: тот зависит от опций монтирования
+        (relatime, noatime). Так вытеснение не выбрасывает записи,
+        горячие у соседнего воркера.
+        """
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self.total_bytes = sum(self._entries.values())
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key: str) -> Optional[BinaryIO]:
+        """
+        Открывает запись кэша или возвращает None.
+
+        Отдавать нужно из открытого файла, а не по пути: другой воркер
+        может вытеснить запись в любой момент, но уже открытый файл
+        остаётся читаемым до закрытия. Закрывает файл вызывающий код.
+        """
+        if not self.enabled:
+            return None
+
+        path = self.path_for(key)
+        name = os.path.basename(path)
+        try:
+            file = open(path, "rb")
+        except OSError:
+            self._forget(name)
+            self.misses += 1
+            return None
+
+        size = os.fstat(file.fileno()).st_size
+        try:
+            os.utime(file.fileno())
+        except OSError:
+            pass
+
+        if name not in self._entries:
+            self._entries[name] = size
+            self.total_bytes += size
+        self._entries.move_to_end(name)
+        self.hits += 1
+        return file
+
+    def writer(self, key: str, size: Optional[int]) -> Optional[CacheWriter]:
+        if not self.enabled or size is None or size > self.max_entry_bytes:
+            return None
+        return CacheWriter(self, key, size)
+
+    def add(self, key: str, size: int) -> None:
+        name = os.path.basename(self.path_for(key))
+        self._forget(name)
+        self._entries[name] = size
+        self.total_bytes += size
+        self._evict()
+
+    def invalidate(self, key: str) -> None:
+        if not self.enabled:
+            return
+        path = self.path_for(key)
+        self._forget(os.path.basename(path))
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _forget(self, name: str) -> None:
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _evict(self) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+file_cache = FileCache(
+    max_bytes=settings.FILE_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.FILE_CACHE_MAX_ENTRY_BYTES,
+)
@@ -0,0 +1,120 @@
+"""Разбор заголовков Range / If-Range для частичной отдачи файлов (RFC 7233)"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+
+MAX_RANGES: int = 16
+
+ByteRange = Tuple[int, int]
+
+
+def make_etag(key: str) -> str:
+    """Объекты в хранилище неизменяемы, поэтому ключ объекта — сильный валидатор."""
+    return f'"{key}"'
+
+
+def format_http_date(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_range_header(range_header: str, size: int) -> Optional[List[ByteRange]]:
+    """
+    Возвращает отсортированный список диапазонов (start, end) включительно.
+
+    None означает, что заголовок нужно проигнорировать и отдать файл целиком,
+    пустой список — что ни один диапазон не удовлетворим (416).
+    """
+    unit, _, ranges_spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not ranges_spec:
+        return None
+
+    specs = [spec.strip() for spec in ranges_spec.split(",") if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        first, sep, last = spec.partition("-")
+        if not sep:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if start < 0 or (last and end < start):
+                    return None
+            else:
+                suffix = int(last)
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                start = max(size - suffix, 0)
+                end = size - 1
+        except ValueError:
+            return None
+
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+
+    ranges.sort()
+    merged: List[ByteRange] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(if_range: str, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+
+    if last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    return format_http_date(since) == format_http_date(last_modified)
+
+
+def get_requested_ranges(
+    request: Request,
+    key: str,
+    size: int,
+    last_modified: Optional[datetime] = None,
+) -> Optional[List[ByteRange]]:
+    """
+    Определяет диапазоны для ответа 206 с учётом If-Range.
+
+    None — отдать файл целиком (200). Неудовлетворимый Range приводит к 416.
+    """
+    range_header = request.headers.get("range")
+    if not range_header or size <= 0:
+        return None
+
+    if_range = request.headers.get("if-range")
+    if if_range and not if_range_matches(if_range, make_etag(key), last_modified):
+        return None
+
+    ranges = parse_range_header(range_header, size)
+    if ranges is None:
+        return None
+
+    if not ranges:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    return ranges
@@ -0,0 +1,104 @@
+"""Фоновая очистка истёкших ссылок, отозванных токенов и лимитов входа"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, select
+
+from app.config import settings
+from app.db import engine
+from models.link import ShareLink
+from models.rate_limit import AuthRateLimit
+from models.share_resume import ShareResume
+from models.token import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: очистку в кластере выполняет один воркер
+SWEEP_LOCK_NAME: str = "maintenance:sweep_expired_rows"
+
+# Истёкшая строка больше не влияет на ответы: ссылка отвечает 410 по
+# expires_at, докачка по истёкшему разрешению считается новым скачиванием,
+# токен не проходит проверку exp, а корзина лимита уже заполнилась бы целиком
+SWEPT_MODELS = (ShareLink, ShareResume, BlacklistedToken, AuthRateLimit)
+
+# expires_at корзин лимита ставит сама БД (localtimestamp), поэтому и
+# сравнивать его нужно с часами БД, а не приложения
+DB_CLOCK_MODELS = (AuthRateLimit,)
+
+
+async def sweep_expired_rows() -> dict:
+    """
+    Удаляет истёкшие строки небольшими пачками.
+
+    Каждая пачка — отдельная короткая транзакция (строки, занятые другими
+    транзакциями, пропускаются). Между пачками выдерживается пауза, чтобы
+    не удалять больше MAINTENANCE_SWEEP_ROWS_PER_SECOND строк в секунду.
+    Если блокировку держит другой воркер, ничего не делает и возвращает {}.
+    """
+    batch_size = settings.MAINTENANCE_SWEEP_BATCH_SIZE
+    batch_interval = batch_size / settings.MAINTENANCE_SWEEP_ROWS_PER_SECOND
+    lock_key = func.hashtextextended(SWEEP_LOCK_NAME, 0)
+    swept = {}
+
+    async with engine.connect() as connection:
+        # Сессионная блокировка держится, пока жив connection, и
+        # освобождается сервером, если воркер упадёт
+        locked = await connection.scalar(select(func.pg_try_advisory_lock(lock_key)))
+        await connection.commit()
+        if not locked:
+            return swept
+
+        try:
+            now = datetime.now()
+            for model in SWEPT_MODELS:
+                swept[model.__tablename__] = 0
+                while True:
+                    started = time.monotonic()
+                    expired_before = func.localtimestamp() if model in DB_CLOCK_MODELS else now
+                    expired_ids = (
+                        select(model.id)
+                        .where(model.expires_at < expired_before)
+                        .limit(batch_size)
+                        .with_for_update(skip_locked=True)
+                    )
+                    result = await connection.execute(
+                        delete(model).where(model.id.in_(expired_ids.scalar_subquery()))
+                    )
+                    await connection.commit()
+                    swept[model.__tablename__] += result.rowcount
+
+                    if result.rowcount < batch_size:
+                        break
+                    await asyncio.sleep(max(batch_interval - (time.monotonic() - started), 0))
+        finally:
+            try:
+                await connection.execute(select(func.pg_advisory_unlock(lock_key)))
+                await connection.commit()
+            except Exception as e:
+                # Соединение испорчено (например, очистку отменили посреди
+                # запроса). Закрываем его, а не возвращаем в пул: вместе с
+                # ним сервер снимет сессионную блокировку. Исходное
+                # исключение или отмена не должны теряться
+                logger.warning(f"Failed to release sweeper lock: {e}")
+                try:
+                    await connection.invalidate()
+                except Exception as e:
+                    logger.warning(f"Failed to invalidate sweeper connection: {e}")
+
+    return swept
+
+
+async def run_expired_rows_sweeper() -> None:
+    while True:
+        try:
+            swept = await sweep_expired_rows()
+            if any(swept.values()):
+                logger.info(f"Swept expired rows: {swept}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Expired rows sweeper failed: {e}")
+
+        await asyncio.sleep(settings.MAINTENANCE_SWEEP_INTERVAL_SECONDS)
@@ -1,35 +1,118 @@
+import asyncio
 import os
-import io
-import boto3
+import secrets
+
 from urllib.parse import quote
+import anyio
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
 from botocore.exceptions import ClientError
 from fastapi.responses import StreamingResponse
 from app.config import settings
+from core.file_cache import file_cache
+from core.http_range import format_http_date, make_etag
+
 
+_s3_client = None
+_s3_client_context = None
+_s3_presign_client = None
+_s3_presign_client_context = None
+_s3_client_lock = asyncio.Lock()
+_verified_buckets = set()
 
-def get_s3_client():
-    return boto3.client(
+
+def _create_client_context(endpoint_url):
+    session = get_session()
+    return session.create_client(
         "s3",
-        endpoint_url=f"http://{settings.MINIO_ENDPOINT}:9000",
+        endpoint_url=endpoint_url,
         aws_access_key_id=settings.MINIO_ACCESS_KEY,
         aws_secret_access_key=settings.MINIO_SECRET_KEY.get_secret_value(),
         region_name="us-east-1",
-        config=boto3.session.Config(signature_version='s3v4')
+        config=AioConfig(
+            signature_version="s3v4",
+            max_pool_connections=settings.MINIO_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.MINIO_CONNECT_TIMEOUT,
+            read_timeout=settings.MINIO_READ_TIMEOUT,
+            connector_args={"keepalive_timeout": settings.MINIO_KEEPALIVE_TIMEOUT},
+        ),
     )
 
 
-def ensure_bucket_exists(bucket_name):
-    try:
-        s3 = get_s3_client()
-        s3.head_bucket(Bucket=bucket_name)
+async def start_s3_client():
+    """
+    Создаёт общий асинхронный клиент S3 на время жизни приложения.
+
+    Клиент держит пул keep-alive соединений к MinIO, поэтому вызывается
+    один раз из lifespan, а не на каждый запрос. Если задан
+    MINIO_PUBLIC_URL, рядом создаётся клиент для подписи presigned URL:
+    подпись включает хост, и он должен совпадать с тем, что видит браузер.
+    """
+    global _s3_client, _s3_client_context, _s3_presign_client, _s3_presign_client_context
+
+    async with _s3_client_lock:
+        if _s3_client is not None:
+            return _s3_client
+
+        _s3_client_context = _create_client_context(f"http://{settings.MINIO_ENDPOINT}:9000")
+        _s3_client = await _s3_client_context.__aenter__()
+
+        if settings.MINIO_PUBLIC_URL:
+            _s3_presign_client_context = _create_client_context(settings.MINIO_PUBLIC_URL)
+            _s3_presign_client = await _s3_presign_client_context.__aenter__()
+        else:
+            _s3_presign_client = _s3_client
+
+        return _s3_client
+
+
+async def close_s3_client():
+    global _s3_client, _s3_client_context, _s3_presign_client, _s3_presign_client_context
+
+    async with _s3_client_lock:
+        if _s3_presign_client_context is not None:
+            await _s3_presign_client_context.__aexit__(None, None, None)
+        if _s3_client_context is not None:
+            await _s3_client_context.__aexit__(None, None, None)
+        _s3_client = None
+        _s3_client_context = None
+        _verified_buckets.clear()
+        _s3_presign_client = None
+        _s3_presign_client_context = None
+
+
+async def get_s3_client():
+    if _s3_client is not None:
+        return _s3_client
+    return await start_s3_client()
+
+
+async def get_s3_presign_client():
+    if _s3_presign_client is None:
+        await start_s3_client()
+    return _s3_presign_client
+
+
+async def ensure_bucket_exists(bucket_name):
+    """
+    Проверяет (и при необходимости создаёт) bucket один раз за процесс.
+
+    Проверенные bucket запоминаются в _verified_buckets, поэтому повторные
+    вызовы не ходят в сеть. Повторная проверка происходит только после
+    forget_bucket, то есть когда S3 реально ответил NoSuchBucket.
+    """
+    if bucket_name in _verified_buckets:
         return True
+
+    try:
+        s3 = await get_s3_client()
+        await s3.head_bucket(Bucket=bucket_name)
     except ClientError as e:
         error_code = e.response.get("Error", {}).get("Code")
         if error_code == "404" or error_code == "NoSuchBucket":
             try:
-                s3.create_bucket(Bucket=bucket_name)
+                await s3.create_bucket(Bucket=bucket_name)
                 print(f"Bucket '{bucket_name}' created successfully")
-                return True
             except Exception as e:
                 print(f"Failed to create bucket: {e}")
                 raise
@@ -37,20 +120,55 @@ def ensure_bucket_exists(bucket_name):
             print(f"Error checking bucket: {e}")
             raise
 
+    _verified_buckets.add(bucket_name)
+    return True
+
+
+def forget_bucket(bucket_name):
+    _verified_buckets.discard(bucket_name)
+
+
+def is_no_such_bucket(error):
+    return error.response.get("Error", {}).get("Code") == "NoSuchBucket"
+
+
+async def call_with_bucket(operation, bucket_name, **kwargs):
+    """
+    Вызывает операцию S3 и, если bucket пропал, пересоздаёт его и повторяет один раз.
+
+    Подходит только для операций, которые безопасно повторить целиком
+    (тело запроса уже в памяти).
+    """
+    try:
+        return await operation(Bucket=bucket_name, **kwargs)
+    except ClientError as e:
+        if not is_no_such_bucket(e):
+            raise
+        forget_bucket(bucket_name)
+        await ensure_bucket_exists(bucket_name)
+        return await operation(Bucket=bucket_name, **kwargs)
+
+
+async def iter_upload_file(file, chunk_size=None):
+    """Читает UploadFile кусками, не загружая его целиком в память."""
+    chunk_size = chunk_size or DOWNLOAD_CHUNK_SIZE
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
 
-def upload_file(file, file_name, bucket_name):
+
+async def upload_file(file, file_name, bucket_name, hasher=None):
     try:
-        s3 = get_s3_client()
-        file.file.seek(0)
-        
-        s3.upload_fileobj(
-            file.file, 
-            bucket_name, 
+        await upload_stream(
+            iter_upload_file(file),
             file_name,
-            ExtraArgs={'ContentType': file.content_type or 'application/octet-stream'}
+            bucket_name,
+            content_type=file.content_type,
+            hasher=hasher,
         )
-        
-        print(f"File '{file_name}' uploaded successfully to bucket '{bucket_name}'")
         return True
     except ClientError as e:
         print(f"ClientError uploading file: {e}")
@@ -60,32 +178,352 @@ def upload_file(file, file_name, bucket_name):
         return False
 
 
-def download_from_minio(filename, bucket_name, original_filename=None):
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+
+class FileTooLargeError(Exception):
+    def __init__(self, max_size):
+        super().__init__(f"File exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
+async def upload_stream(chunks, file_name, bucket_name, content_type=None, max_size=None, hasher=None):
+    """
+    Загружает поток байтов в MinIO через multipart upload и возвращает его размер.
+
+    В памяти держится не больше одной части (MULTIPART_PART_SIZE). Файлы
+    меньше одной части отправляются одним put_object. При превышении
+    max_size загрузка прерывается (AbortMultipartUpload) и выбрасывается
+    FileTooLargeError. Если передан hasher (hashlib), он обновляется по
+    ходу передачи.
+    """
+    s3 = await get_s3_client()
+    content_type = content_type or "application/octet-stream"
+    buffer = bytearray()
+    size = 0
+    upload_id = None
+    parts = []
+
+    async def flush_part(data):
+        nonlocal upload_id
+        if upload_id is None:
+            response = await call_with_bucket(
+                s3.create_multipart_upload,
+                bucket_name, Key=file_name, ContentType=content_type,
+            )
+            upload_id = response["UploadId"]
+        part_number = len(parts) + 1
+        response = await s3.upload_part(
+            Bucket=bucket_name, Key=file_name, UploadId=upload_id,
+            PartNumber=part_number, Body=data,
+        )
+        parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
     try:
-        s3 = get_s3_client()
-        fileobj = io.BytesIO()
-        
-        s3.download_fileobj(bucket_name, filename, fileobj)
-        fileobj.seek(0)
+        async for chunk in chunks:
+            size += len(chunk)
+            if max_size is not None and size > max_size:
+                raise FileTooLargeError(max_size)
+            if hasher is not None:
+                hasher.update(chunk)
+            buffer += chunk
+            while len(buffer) >= MULTIPART_PART_SIZE:
+                part = bytes(buffer[:MULTIPART_PART_SIZE])
+                del buffer[:MULTIPART_PART_SIZE]
+                await flush_part(part)
+
+        if upload_id is None:
+            await call_with_bucket(
+                s3.put_object,
+                bucket_name, Key=file_name, Body=bytes(buffer), ContentType=content_type,
+            )
+        else:
+            if buffer:
+                await flush_part(bytes(buffer))
+            await s3.complete_multipart_upload(
+                Bucket=bucket_name, Key=file_name, UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+    except BaseException:
+        if upload_id is not None:
+            try:
+                await s3.abort_multipart_upload(
+                    Bucket=bucket_name, Key=file_name, UploadId=upload_id,
+                )
+            except Exception as e:
+                print(f"Error aborting multipart upload: {e}")
+        raise
+
+    print(f"File '{file_name}' uploaded successfully to bucket '{bucket_name}'")
+    return size
+
+
+async def create_multipart_upload(file_name, bucket_name, content_type=None):
+    s3 = await get_s3_client()
+    response = await call_with_bucket(
+        s3.create_multipart_upload,
+        bucket_name,
+        Key=file_name,
+        ContentType=content_type or "application/octet-stream",
+    )
+    return response["UploadId"]
+
+
+async def upload_part(file_name, bucket_name, upload_id, part_number, data):
+    s3 = await get_s3_client()
+    response = await s3.upload_part(
+        Bucket=bucket_name, Key=file_name, UploadId=upload_id,
+        PartNumber=part_number, Body=data,
+    )
+    return response["ETag"]
+
+
+async def list_uploaded_parts(file_name, bucket_name, upload_id):
+    """Возвращает все уже принятые MinIO части загрузки (ListParts с пагинацией)."""
+    s3 = await get_s3_client()
+    parts = []
+    marker = 0
+    while True:
+        response = await s3.list_parts(
+            Bucket=bucket_name, Key=file_name, UploadId=upload_id,
+            PartNumberMarker=marker,
+        )
+        parts.extend(response.get("Parts", []))
+        if not response.get("IsTruncated"):
+            return parts
+        marker = response["NextPartNumberMarker"]
+
+
+async def complete_multipart_upload(file_name, bucket_name, upload_id, parts):
+    s3 = await get_s3_client()
+    await s3.complete_multipart_upload(
+        Bucket=bucket_name, Key=file_name, UploadId=upload_id,
+        MultipartUpload={"Parts": [
+            {"ETag": part["ETag"], "PartNumber": part["PartNumber"]} for part in parts
+        ]},
+    )
+
+
+async def abort_multipart_upload(file_name, bucket_name, upload_id):
+    try:
+        s3 = await get_s3_client()
+        await s3.abort_multipart_upload(Bucket=bucket_name, Key=file_name, UploadId=upload_id)
+        return True
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code")
+        if error_code == "NoSuchUpload":
+            return True
+        print(f"ClientError aborting multipart upload: {e}")
+        return False
+    except Exception as e:
+        print(f"Error aborting multipart upload: {e}")
+        return False
+
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_object_body(body, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Отдаёт тело объекта S3 кусками фиксированного размера и возвращает соединение в пул."""
+    async with body:
+        async for chunk in body.iter_chunks(chunk_size):
+            yield chunk
 
-        download_filename = original_filename if original_filename else filename
-        safe_filename = quote(download_filename)
 
-        try:
-            response = s3.head_object(Bucket=bucket_name, Key=filename)
-            content_type = response.get('ContentType', 'application/octet-stream')
-        except:
-            content_type = 'application/octet-stream'
+async def iter_cached_body(body, writer):
+    """
+    Отдаёт объект клиенту и параллельно записывает его в дисковый кэш.
 
+    Кэш необязателен: при ошибке диска (нет места, нет прав, запись
+    вытеснена) запись бросается, а клиент получает объект из S3 до конца.
+    """
+    completed = False
+    try:
+        async for chunk in iter_object_body(body):
+            if writer is not None:
+                try:
+                    await writer.write(chunk)
+                except OSError as e:
+                    print(f"Error writing file cache: {e}")
+                    writer.abort()
+                    writer = None
+            yield chunk
+        completed = True
+    finally:
+        if writer is not None:
+            if completed:
+                try:
+                    await writer.commit()
+                except OSError as e:
+                    print(f"Error writing file cache: {e}")
+                    writer.abort()
+            else:
+                writer.abort()
+
+
+async def iter_file_range(file, start, end, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """Читает диапазон [start, end] открытого файла кусками (pread, без общей позиции)."""
+    position = start
+    while position <= end:
+        chunk = await anyio.to_thread.run_sync(
+            os.pread, file.fileno(), min(chunk_size, end - position + 1), position
+        )
+        if not chunk:
+            return
+        position += len(chunk)
+        yield chunk
+
+
+async def iter_and_close(chunks, file):
+    """Отдаёт тело ответа и закрывает файл кэша, из которого оно читается."""
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        file.close()
+
+
+async def iter_multipart_ranges(read_range, ranges, parts, boundary):
+    """Собирает тело multipart/byteranges; read_range(index, start, end) отдаёт байты диапазона."""
+    for index, ((start, end), part_header) in enumerate(zip(ranges, parts)):
+        yield part_header
+        async for chunk in read_range(index, start, end):
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode()
+
+
+def ranges_response(read_range, ranges, size, media_type, headers):
+    """Ответ 206 на один диапазон или multipart/byteranges на несколько."""
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
         return StreamingResponse(
-            fileobj,
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f"attachment; filename=\"{safe_filename}\"",
-                "Access-Control-Expose-Headers": "Content-Disposition"
-            }
+            read_range(0, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers=headers
         )
+
+    boundary = secrets.token_hex(16)
+    parts = [
+        (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    headers["Content-Length"] = str(
+        sum(len(part) + (end - start + 1) + 2 for part, (start, end) in zip(parts, ranges))
+        + len(closing)
+    )
+    return StreamingResponse(
+        iter_multipart_ranges(read_range, ranges, parts, boundary),
+        status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers
+    )
+
+
+async def download_from_minio(
+    filename,
+    bucket_name,
+    original_filename=None,
+    content_type=None,
+    size=None,
+    ranges=None,
+    last_modified=None,
+):
+    """
+    Потоково отдаёт объект из MinIO, не загружая его целиком в память.
+
+    Тип содержимого и размер берутся из записи File, поэтому отдельный
+    head_object не нужен. Если переданы ranges (см. core.http_range),
+    каждый диапазон запрашивается у MinIO ранжированным GET и отдаётся
+    ответом 206 (для нескольких диапазонов — multipart/byteranges).
+
+    Горячие объекты отдаются из локального кэша (core.file_cache) через
+    файл, открытый до начала ответа: соседний воркер может вытеснить
+    запись, но открытый файл дочитывается до конца. Полная отдача из
+    MinIO попутно заполняет кэш.
+    """
+    try:
+        download_filename = original_filename if original_filename else filename
+        safe_filename = quote(download_filename)
+
+        headers = {
+            "Content-Disposition": f"attachment; filename=\"{safe_filename}\"",
+            "Access-Control-Expose-Headers": "Content-Disposition, Content-Range, Accept-Ranges",
+            "Accept-Ranges": "bytes",
+            "ETag": make_etag(filename),
+        }
+        if last_modified is not None:
+            headers["Last-Modified"] = format_http_date(last_modified)
+
+        cached_file = file_cache.get(filename)
+        if cached_file is not None:
+            media_type = content_type or "application/octet-stream"
+            cached_size = os.fstat(cached_file.fileno()).st_size
+            if ranges and size is not None:
+                response = ranges_response(
+                    lambda index, start, end: iter_file_range(cached_file, start, end),
+                    ranges, size, media_type, headers
+                )
+            else:
+                headers["Content-Length"] = str(cached_size)
+                response = StreamingResponse(
+                    iter_file_range(cached_file, 0, cached_size - 1),
+                    media_type=media_type,
+                    headers=headers
+                )
+            response.body_iterator = iter_and_close(response.body_iterator, cached_file)
+            return response
+
+        s3 = await get_s3_client()
+        get_kwargs = {"Bucket": bucket_name, "Key": filename}
+        if ranges and size is not None:
+            first_start, first_end = ranges[0]
+            get_kwargs["Range"] = f"bytes={first_start}-{first_end}"
+        else:
+            ranges = None
+        s3_object = await s3.get_object(**get_kwargs)
+
+        media_type = content_type or s3_object.get("ContentType", "application/octet-stream")
+
+        if size is None:
+            size = s3_object.get("ContentLength")
+
+        if not ranges:
+            if size is not None:
+                headers["Content-Length"] = str(size)
+            writer = file_cache.writer(filename, size)
+            body = s3_object["Body"]
+            return StreamingResponse(
+                iter_cached_body(body, writer) if writer else iter_object_body(body),
+                media_type=media_type,
+                headers=headers
+            )
+
+        async def read_range(index, start, end):
+            # Первый диапазон уже запрошен выше: ошибки хранилища всплывают
+            # до начала ответа
+            if index == 0:
+                body = s3_object["Body"]
+            else:
+                response = await s3.get_object(
+                    Bucket=bucket_name, Key=filename, Range=f"bytes={start}-{end}"
+                )
+                body = response["Body"]
+            async for chunk in iter_object_body(body):
+                yield chunk
+
+        return ranges_response(read_range, ranges, size, media_type, headers)
     except ClientError as e:
+        if is_no_such_bucket(e):
+            forget_bucket(bucket_name)
         print(f"ClientError downloading file: {e}")
         return None
     except Exception as e:
@@ -93,10 +531,69 @@ def download_from_minio(filename, bucket_name, original_filename=None):
         return None
 
 
-def delete_from_minio(filename, bucket_name):
+async def copy_object(source_name, target_name, bucket_name):
+    """Серверное копирование внутри MinIO, байты не проходят через API."""
+    s3 = await get_s3_client()
+    await s3.copy_object(
+        Bucket=bucket_name,
+        Key=target_name,
+        CopySource={"Bucket": bucket_name, "Key": source_name},
+    )
+
+
+async def head_object(filename, bucket_name):
+    """Возвращает метаданные объекта или None, если его нет."""
+    try:
+        s3 = await get_s3_client()
+        return await s3.head_object(Bucket=bucket_name, Key=filename)
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code")
+        if error_code not in ("404", "NoSuchKey", "NotFound"):
+            print(f"ClientError reading object metadata: {e}")
+        return None
+
+
+async def generate_download_url(filename, bucket_name, original_filename=None, content_type=None, expires_in=300):
+    """Presigned GET: браузер скачивает файл напрямую из MinIO."""
+    s3 = await get_s3_presign_client()
+    download_filename = original_filename if original_filename else filename
+    params = {
+        "Bucket": bucket_name,
+        "Key": filename,
+        "ResponseContentDisposition": f"attachment; filename=\"{quote(download_filename)}\"",
+    }
+    if content_type:
+        params["ResponseContentType"] = content_type
+    return await s3.generate_presigned_url("get_object", Params=params, ExpiresIn=expires_in)
+
+
+async def generate_upload_url(filename, bucket_name, max_size, content_type=None, expires_in=300):
+    """
+    Presigned POST: браузер загружает файл напрямую в MinIO.
+
+    В отличие от presigned PUT, политика POST ограничивает размер
+    (content-length-range): MinIO сам отклонит файл больше max_size.
+    Возвращает {"url": ..., "fields": {...}} для multipart/form-data.
+    """
+    s3 = await get_s3_presign_client()
+    content_type = content_type or "application/octet-stream"
+    return await s3.generate_presigned_post(
+        Bucket=bucket_name,
+        Key=filename,
+        Fields={"Content-Type": content_type},
+        Conditions=[
+            {"Content-Type": content_type},
+            ["content-length-range", 0, max_size],
+        ],
+        ExpiresIn=expires_in,
+    )
+
+
+async def delete_from_minio(filename, bucket_name):
     try:
-        s3 = get_s3_client()
-        s3.delete_object(Bucket=bucket_name, Key=filename)
+        file_cache.invalidate(filename)
+        s3 = await get_s3_client()
+        await s3.delete_object(Bucket=bucket_name, Key=filename)
         print(f"File '{filename}' deleted from bucket '{bucket_name}'")
         return True
     except ClientError as e:
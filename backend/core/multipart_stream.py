@@ -0,0 +1,139 @@
+"""Потоковый разбор multipart/form-data без буферизации файлов в памяти или на диске"""
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+
+def _decode(value: bytes, charset: str) -> str:
+    try:
+        return value.decode(charset)
+    except (UnicodeDecodeError, LookupError):
+        return value.decode("latin-1")
+
+
+class StreamedFilePart:
+    """Файловая часть формы, данные которой читаются по мере поступления."""
+
+    def __init__(
+        self,
+        stream: "MultipartStream",
+        field_name: str,
+        filename: str,
+        content_type: str,
+    ) -> None:
+        self._stream = stream
+        self.field_name = field_name
+        self.filename = filename
+        self.content_type = content_type
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            event = await self._stream.next_event()
+            if event is None or event[0] == "end":
+                return
+            if event[0] == "data":
+                yield event[1]
+
+
+class MultipartStream:
+    """
+    Обёртка над python_multipart, читающая тело запроса по кускам.
+
+    Колбэки парсера синхронные, поэтому они складывают события в очередь,
+    а асинхронный потребитель забирает их оттуда и при необходимости
+    дочитывает следующий кусок тела.
+    """
+
+    def __init__(self, request: Request) -> None:
+        content_type, params = parse_options_header(request.headers.get("content-type"))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=422, detail="Ожидается multipart/form-data")
+
+        charset = params.get(b"charset", b"utf-8")
+        self._charset = charset.decode("latin-1") if isinstance(charset, bytes) else charset
+        self._body = request.stream()
+        self._events: deque = deque()
+        self._finished = False
+
+        self._header_field = b""
+        self._header_value = b""
+        self._part_headers: dict = {}
+
+        self._parser = MultipartParser(
+            params[b"boundary"],
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+
+    def _on_part_begin(self) -> None:
+        self._part_headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._part_headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        self._events.append(("headers", self._part_headers))
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        self._events.append(("data", data[start:end]))
+
+    def _on_part_end(self) -> None:
+        self._events.append(("end", None))
+
+    async def next_event(self) -> Optional[tuple]:
+        while not self._events:
+            if self._finished:
+                return None
+            try:
+                chunk = await self._body.__anext__()
+            except StopAsyncIteration:
+                self._parser.finalize()
+                self._finished = True
+                continue
+            if chunk:
+                self._parser.write(chunk)
+        return self._events.popleft()
+
+    async def files(self) -> AsyncIterator[StreamedFilePart]:
+        """
+        Перебирает файловые части формы по порядку.
+
+        Каждую часть нужно дочитать (или бросить) до перехода к следующей:
+        непрочитанный остаток пропускается.
+        """
+        while True:
+            event = await self.next_event()
+            if event is None:
+                return
+            if event[0] != "headers":
+                continue
+
+            headers = event[1]
+            _, options = parse_options_header(headers.get(b"content-disposition"))
+            if b"filename" not in options:
+                continue
+
+            content_type = headers.get(b"content-type")
+            yield StreamedFilePart(
+                self,
+                field_name=_decode(options.get(b"name", b""), self._charset),
+                filename=_decode(options[b"filename"], self._charset),
+                content_type=_decode(content_type, "latin-1") if content_type else "application/octet-stream",
+            )
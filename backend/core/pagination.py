@@ -0,0 +1,37 @@
+"""Непрозрачные курсоры для keyset-пагинации"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(sort: str, order: str, value: Any, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = json.dumps([sort, order, value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    """
+    Возвращает (значение ключа сортировки, id) последней отданной строки.
+
+    Курсор привязан к сортировке, с которой он был выдан: с другой
+    сортировкой он не имеет смысла, поэтому такой запрос отклоняется.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if cursor_sort != sort or cursor_order != order or not isinstance(row_id, int):
+            raise ValueError
+        if sort == "created_at":
+            value = datetime.fromisoformat(value)
+        elif sort == "size" and not isinstance(value, int):
+            raise ValueError
+        elif sort == "name" and not isinstance(value, str):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return value, row_id
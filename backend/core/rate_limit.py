@@ -0,0 +1,207 @@
+"""Ограничение частоты входа и регистрации (корзина токенов)"""
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import List, NamedTuple, Tuple
+
+from fastapi import HTTPException, Request
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.config import settings
+from app.db import engine
+from models.rate_limit import AuthRateLimit
+
+
+class Bucket(NamedTuple):
+    """Ключ корзины и её параметры: ёмкость и пополнение в токенах/сек."""
+    key: str
+    capacity: float
+    refill_rate: float
+
+
+class TokenBucketLimiter:
+    """
+    Корзины токенов в памяти процесса.
+
+    Каждая попытка забирает токен, токены пополняются с постоянной
+    скоростью до ёмкости корзины. Корзины хранятся в OrderedDict и при
+    переполнении вытесняются самые давно использованные: вытесненная
+    корзина считается полной. Рассчитан на один event loop, как TTLCache.
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+
+    def hit(self, bucket: Bucket) -> float:
+        """Забирает токен; возвращает 0 или сколько секунд ждать следующего."""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.pop(bucket.key, (bucket.capacity, now))
+        tokens = min(bucket.capacity, tokens + (now - updated_at) * bucket.refill_rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / bucket.refill_rate
+
+        self._buckets[bucket.key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.AUTH_RATE_LIMIT_ENABLED,
+            "backend": settings.AUTH_RATE_LIMIT_BACKEND,
+            "buckets": len(self._buckets),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+        }
+
+
+auth_rate_limiter = TokenBucketLimiter(max_keys=settings.AUTH_RATE_LIMIT_MAX_KEYS)
+
+
+async def hit_shared_buckets(buckets: List[Bucket]) -> List[float]:
+    """
+    Забирает токены из общих корзин в auth_rate_limits одним запросом.
+
+    Пополнение считается на сервере по его часам, поэтому воркеры видят
+    одно и то же состояние. Ключи сортируются: строки блокируются в одном
+    порядке, и встречные попытки не упираются в deadlock.
+
+    Запрос идёт в своей короткой транзакции мимо сессии обработчика:
+    иначе он считался бы записью и закреплял клиента за primary.
+    """
+    buckets = sorted(buckets)
+    table = AuthRateLimit.__table__
+    now = func.localtimestamp()
+
+    stmt = pg_insert(AuthRateLimit).values([
+        {
+            "key": bucket.key,
+            "tokens": bucket.capacity - 1,
+            "capacity": bucket.capacity,
+            "refill_rate": bucket.refill_rate,
+            "allowed": True,
+            "updated_at": now,
+            "expires_at": now + timedelta(seconds=bucket.capacity / bucket.refill_rate),
+        }
+        for bucket in buckets
+    ])
+    refilled = func.least(
+        stmt.excluded.capacity,
+        table.c.tokens + func.extract("epoch", now - table.c.updated_at) * stmt.excluded.refill_rate,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AuthRateLimit.key],
+        set_={
+            "tokens": case((refilled >= 1, refilled - 1), else_=refilled),
+            "allowed": refilled >= 1,
+            "capacity": stmt.excluded.capacity,
+            "refill_rate": stmt.excluded.refill_rate,
+            "updated_at": now,
+            "expires_at": stmt.excluded.expires_at,
+        },
+    ).returning(AuthRateLimit.allowed, AuthRateLimit.tokens, AuthRateLimit.refill_rate)
+
+    async with engine.begin() as connection:
+        rows = (await connection.execute(stmt)).all()
+    return [0.0 if row.allowed else (1 - row.tokens) / row.refill_rate for row in rows]
+
+
+# Длиннее адрес быть не может (RFC 5321), а ключ должен влезть в столбец
+MAX_EMAIL_KEY_LENGTH: int = 254
+MAX_IP_KEY_LENGTH: int = 64
+
+TRUSTED_PROXY_NETWORKS = tuple(
+    ipaddress.ip_network(proxy, strict=False) for proxy in settings.AUTH_TRUSTED_PROXIES
+)
+
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXY_NETWORKS)
+
+
+def client_ip(request: Request) -> str:
+    """
+    Адрес клиента для лимита по IP.
+
+    Заголовкам прокси верим, только если соединение пришло от доверенного
+    прокси (AUTH_TRUSTED_PROXIES): иначе клиент подставил бы любой адрес.
+    X-Forwarded-For читается справа налево до первого недоверенного адреса:
+    левее него значения прислал сам клиент.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(peer):
+        return peer
+
+    forwarded = [
+        address.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for address in header.split(",")
+        if address.strip()
+    ]
+    for address in reversed(forwarded):
+        if not is_trusted_proxy(address):
+            return address
+    if forwarded:
+        # Вся цепочка из доверенных прокси: клиент — самый левый адрес
+        return forwarded[0]
+    return request.headers.get("x-real-ip", peer).strip() or peer
+
+
+def auth_buckets(request: Request, email: str) -> List[Bucket]:
+    return [
+        Bucket(
+            f"ip:{client_ip(request)[:MAX_IP_KEY_LENGTH]}",
+            settings.AUTH_RATE_LIMIT_IP_BURST,
+            settings.AUTH_RATE_LIMIT_IP_PER_MINUTE / 60,
+        ),
+        Bucket(
+            f"email:{email.strip().lower()[:MAX_EMAIL_KEY_LENGTH]}",
+            settings.AUTH_RATE_LIMIT_EMAIL_BURST,
+            settings.AUTH_RATE_LIMIT_EMAIL_PER_MINUTE / 60,
+        ),
+    ]
+
+
+async def check_auth_rate_limit(request: Request, email: str) -> None:
+    """
+    Отвечает 429, если с этого IP или на этот email слишком много попыток.
+
+    Вызывается до запросов к БД и хэширования пароля: отказ не стоит ни
+    Argon2, ни проверок уникальности. Токен списывается из обеих корзин,
+    даже если отказала одна из них.
+    """
+    if not settings.AUTH_RATE_LIMIT_ENABLED:
+        return
+
+    buckets = auth_buckets(request, email)
+    if settings.AUTH_RATE_LIMIT_BACKEND == "postgres":
+        waits = await hit_shared_buckets(buckets)
+    else:
+        waits = [auth_rate_limiter.hit(bucket) for bucket in buckets]
+
+    retry_after = max(waits)
+    if retry_after > 0:
+        auth_rate_limiter.rejected += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, retry later",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    auth_rate_limiter.allowed += 1
@@ -0,0 +1,119 @@
+"""Проверка отзыва токенов по копии blacklist_tokens в памяти процесса"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.db import async_session_maker
+from models.token import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_LOAD_BATCH_SIZE: int = 10000
+
+# id из последовательности выдаются до commit, поэтому строка с меньшим id
+# может стать видна позже строки с большим. Каждый опрос перечитывает
+# последние REVOCATION_WATERMARK_OVERLAP id, чтобы не пропустить такие строки.
+REVOCATION_WATERMARK_OVERLAP: int = 100
+
+REVOCATION_PRUNE_INTERVAL_SECONDS: float = 60.0
+
+
+class RevocationList:
+    """
+    Множество отозванных jti с их сроком действия.
+
+    Проверка — поиск в словаре, без обращения к БД. Новые строки
+    blacklist_tokens подгружаются опросом по id выше водяного знака;
+    отзыв в этом же процессе виден сразу (revoke). Истёкшие jti
+    выбрасываются: такой токен и так не пройдёт проверку exp.
+    """
+
+    def __init__(self) -> None:
+        self._revoked: Dict[str, datetime] = {}
+        self.watermark = 0
+        self.loaded = False
+        self._pruned_at = 0.0
+
+    def __contains__(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def revoke(self, jti: str, expires_at: datetime) -> None:
+        self._revoked[jti] = expires_at
+
+    async def refresh(self) -> int:
+        """Подгружает новые строки; возвращает число прочитанных строк."""
+        loaded = 0
+        while True:
+            async with async_session_maker() as session:
+                result = await session.execute(
+                    select(BlacklistedToken.id, BlacklistedToken.jti, BlacklistedToken.expires_at)
+                    .where(BlacklistedToken.id > self.watermark - REVOCATION_WATERMARK_OVERLAP)
+                    .order_by(BlacklistedToken.id)
+                    .limit(REVOCATION_LOAD_BATCH_SIZE)
+                )
+                rows = result.all()
+
+            now = datetime.now()
+            for row in rows:
+                if row.expires_at > now:
+                    self._revoked[row.jti] = row.expires_at
+            loaded += len(rows)
+            if rows:
+                self.watermark = max(self.watermark, rows[-1].id)
+
+            if len(rows) < REVOCATION_LOAD_BATCH_SIZE:
+                break
+
+        self._prune()
+        self.loaded = True
+        return loaded
+
+    def _prune(self) -> None:
+        if time.monotonic() - self._pruned_at < REVOCATION_PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+        now = datetime.now()
+        expired = [jti for jti, expires_at in self._revoked.items() if expires_at <= now]
+        for jti in expired:
+            del self._revoked[jti]
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "revoked": len(self._revoked),
+            "watermark": self.watermark,
+        }
+
+
+revocation_list = RevocationList()
+
+
+async def is_token_revoked(session: AsyncSession, jti: str) -> bool:
+    """
+    Отозван ли токен.
+
+    Пока список не загружен (БД была недоступна при старте), проверка идёт
+    запросом к БД, чтобы отозванный токен не прошёл.
+    """
+    if revocation_list.loaded:
+        return jti in revocation_list
+    found = await session.scalar(select(BlacklistedToken.id).where(BlacklistedToken.jti == jti))
+    return found is not None
+
+
+async def run_revocation_list_refresher() -> None:
+    while True:
+        try:
+            await revocation_list.refresh()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Revocation list refresh failed: {e}")
+
+        await asyncio.sleep(settings.REVOCATION_POLL_INTERVAL_SECONDS)
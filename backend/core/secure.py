@@ -1,13 +1,28 @@
+import asyncio
+import hashlib
 import secrets
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Optional, Tuple
 
 import jwt
+from fastapi import HTTPException
 from passlib.context import CryptContext
 
 from app.config import settings
+from core.ttl_cache import TTLCache
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Хэши с другими параметрами считаются устаревшими и пересчитываются при входе
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=settings.PASSWORD_HASH_TIME_COST,
+    argon2__memory_cost=settings.PASSWORD_HASH_MEMORY_COST_KIB,
+    argon2__parallelism=settings.PASSWORD_HASH_PARALLELISM,
+)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -20,7 +35,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
 
-    to_encode.update({"exp": expire, "type": "access"})
+    to_encode.update({"exp": expire, "type": "access", "jti": str(uuid.uuid4())})
     encoded_jwt = jwt.encode(
         to_encode,
         settings.SECRET_KEY.get_secret_value(),
@@ -34,7 +49,7 @@ def create_refresh_token(data: dict) -> str:
     expire = datetime.now(timezone.utc) + timedelta(
         days=settings.REFRESH_TOKEN_EXPIRE_DAYS
     )
-    to_encode.update({"exp": expire, "type": "refresh"})
+    to_encode.update({"exp": expire, "type": "refresh", "jti": str(uuid.uuid4())})
     encoded_jwt = jwt.encode(
         to_encode,
         settings.SECRET_KEY.get_secret_value(),
@@ -43,6 +58,41 @@ def create_refresh_token(data: dict) -> str:
     return encoded_jwt
 
 
+def create_upload_token(data: dict, expires_delta: timedelta) -> str:
+    """Подписанное подтверждение presigned-загрузки: кто, какой ключ и под каким именем."""
+    to_encode = data.copy()
+    expire = datetime.now(timezone.utc) + expires_delta
+    to_encode.update({"exp": expire, "type": "upload"})
+    return jwt.encode(
+        to_encode,
+        settings.SECRET_KEY.get_secret_value(),
+        algorithm=settings.ALGORITHM,
+    )
+
+
+def create_share_resume_token(share_token: str, resume_id: int, expires_at: datetime) -> str:
+    """Подписанная ссылка на разрешение докачки (строку share_resumes)."""
+    return jwt.encode(
+        {"share": share_token, "resume": resume_id, "exp": expires_at, "type": "share_resume"},
+        settings.SECRET_KEY.get_secret_value(),
+        algorithm=settings.ALGORITHM,
+    )
+
+
+def verify_share_resume_token(token: Optional[str], share_token: str) -> Optional[int]:
+    """Возвращает id разрешения докачки или None."""
+    if not token:
+        return None
+    payload = verify_token(token)
+    if (
+        payload is None
+        or payload.get("type") != "share_resume"
+        or payload.get("share") != share_token
+    ):
+        return None
+    return payload.get("resume")
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -51,6 +101,74 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHashPool:
+    """
+    Пул потоков для Argon2 с ограничением очереди.
+
+    argon2-cffi отпускает GIL на время вычисления, поэтому хэширование в
+    потоках не останавливает event loop. Если заданий (выполняемых и
+    ожидающих) уже workers + max_queue, новое сразу отклоняется с 503:
+    лучше быстро отказать, чем копить запросы, которые клиент не дождётся.
+    """
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.limit = workers + max_queue
+        self.pending = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+
+    def _done(self, _future) -> None:
+        with self._lock:
+            self.pending -= 1
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Too many password checks in progress, retry later",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+
+        # Счётчик уменьшается, когда задание действительно завершилось,
+        # а не когда клиент перестал его ждать
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "limit": self.limit,
+            "rejected": self.rejected,
+        }
+
+
+password_hash_pool = PasswordHashPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+)
+
+
+async def hash_password(password: str) -> str:
+    return await password_hash_pool.run(pwd_context.hash, password)
+
+
+async def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Проверяет пароль; второй элемент — новый хэш, если параметры Argon2
+    в настройках изменились и хэш пользователя нужно пересчитать.
+    """
+    return await password_hash_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
 def verify_token(token: str) -> Optional[dict]:
     try:
         payload = jwt.decode(
@@ -63,6 +181,45 @@ def verify_token(token: str) -> Optional[dict]:
         return None
 
 
+# Проверенные payload access-токенов по хэшу токена (сам токен не храним)
+token_cache = TTLCache(
+    max_entries=settings.TOKEN_CACHE_MAX_ENTRIES,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+def verify_token_cached(token: str) -> Optional[dict]:
+    """
+    verify_token с кэшем: повторное предъявление того же токена не требует
+    HMAC и разбора JSON. Запись живёт не дольше exp токена.
+
+    Кэш отвечает только на вопрос «подпись и срок верны»: отзыв
+    проверяется отдельно на каждом запросе (core.revocation). Возвращаемый
+    словарь общий для всех запросов с этим токеном — не изменять.
+    """
+    key = token_digest(token)
+    payload = token_cache.get(key)
+    if payload is not None:
+        return payload
+
+    payload = verify_token(token)
+    if payload and isinstance(payload.get("exp"), (int, float)):
+        token_cache.set(key, payload, ttl=payload["exp"] - time.time())
+    return payload
+
+
+def token_id(payload: dict, token: str) -> str:
+    """jti токена; у токенов, выданных до появления jti, — префикс его хэша."""
+    jti = payload.get("jti")
+    if jti is None:
+        jti = hashlib.sha256(token.encode()).hexdigest()[:36]
+    return jti
+
+
 def create_share_token() -> str:
     return secrets.token_urlsafe(32)
 
@@ -0,0 +1,115 @@
+"""Фоновая очистка брошенных возобновляемых и presigned-загрузок"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.db import async_session_maker
+from core.minio_client import abort_multipart_upload, delete_from_minio
+from models.pending_upload import PendingUpload
+from models.upload_session import UploadSession
+
+logger = logging.getLogger(__name__)
+
+REAP_BATCH_SIZE: int = 100
+
+
+async def reap_expired_upload_sessions() -> int:
+    """
+    Прерывает multipart upload у истёкших сессий и удаляет их записи.
+
+    Запись удаляется только после успешного AbortMultipartUpload, чтобы
+    части в MinIO не остались без ссылки на них.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    reaped = 0
+
+    while True:
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(UploadSession.id, UploadSession.name, UploadSession.upload_id)
+                .where(UploadSession.expires_at < now)
+                .order_by(UploadSession.expires_at)
+                .limit(REAP_BATCH_SIZE)
+            )
+            expired = result.all()
+
+        if not expired:
+            return reaped
+
+        aborted_ids = []
+        for upload_session in expired:
+            if await abort_multipart_upload(
+                upload_session.name, settings.MINIO_BUCKET_NAME, upload_session.upload_id
+            ):
+                aborted_ids.append(upload_session.id)
+
+        if aborted_ids:
+            async with async_session_maker() as session:
+                await session.execute(
+                    delete(UploadSession).where(UploadSession.id.in_(aborted_ids))
+                )
+                await session.commit()
+            reaped += len(aborted_ids)
+
+        if len(aborted_ids) < len(expired):
+            return reaped
+
+
+async def reap_expired_presigned_uploads() -> int:
+    """
+    Удаляет из MinIO объекты неподтверждённых presigned-загрузок.
+
+    Строки PendingUpload блокируются на время удаления: подтверждение,
+    которое забирает ту же строку, дождётся очистки и ответит 410, а уже
+    забранные подтверждением строки пропускаются.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    reaped = 0
+
+    while True:
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(PendingUpload.id, PendingUpload.name)
+                .where(PendingUpload.expires_at < now)
+                .order_by(PendingUpload.expires_at)
+                .limit(REAP_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            expired = result.all()
+            if not expired:
+                return reaped
+
+            deleted_ids = [
+                pending.id
+                for pending in expired
+                if await delete_from_minio(pending.name, settings.MINIO_BUCKET_NAME)
+            ]
+            if deleted_ids:
+                await session.execute(
+                    delete(PendingUpload).where(PendingUpload.id.in_(deleted_ids))
+                )
+            await session.commit()
+            reaped += len(deleted_ids)
+
+        if len(deleted_ids) < len(expired):
+            return reaped
+
+
+async def run_upload_session_reaper() -> None:
+    while True:
+        try:
+            reaped = await reap_expired_upload_sessions()
+            if reaped:
+                logger.info(f"Aborted {reaped} expired upload sessions")
+            reaped = await reap_expired_presigned_uploads()
+            if reaped:
+                logger.info(f"Deleted {reaped} unconfirmed presigned uploads")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Upload session reaper failed: {e}")
+
+        await asyncio.sleep(settings.UPLOAD_SESSION_REAP_INTERVAL_SECONDS)
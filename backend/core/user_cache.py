@@ -0,0 +1,56 @@
+"""Кэш пользователей для get_current_user"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event
+
+from app.config import settings
+from core.ttl_cache import TTLCache
+from models.user import User
+
+
+class CachedUser(NamedTuple):
+    """Поля пользователя, которые нужны обработчикам (без хэша пароля)."""
+    id: int
+    name: str
+    email: str
+    created_at: datetime
+
+
+user_cache = TTLCache(
+    max_entries=settings.USER_CACHE_MAX_ENTRIES if settings.USER_CACHE_ENABLED else 0,
+    ttl=settings.USER_CACHE_TTL_SECONDS,
+)
+
+
+def get_cached_user(user_id: int) -> Optional[User]:
+    """
+    Пользователь из кэша или None.
+
+    Возвращается новый объект User вне сессии, как и после expunge в
+    get_current_user: обработчикам доступны только скалярные поля.
+    """
+    record = user_cache.get(user_id)
+    if record is None:
+        return None
+    return User(**record._asdict())
+
+
+def cache_user(user: User) -> None:
+    user_cache.set(user.id, CachedUser(user.id, user.name, user.email, user.created_at))
+
+
+def invalidate_user(user_id: int) -> None:
+    """
+    Сбрасывает запись пользователя при изменении или удалении аккаунта.
+
+    Изменения через ORM сбрасывают кэш автоматически; другие воркеры
+    увидят их не позже чем через USER_CACHE_TTL_SECONDS.
+    """
+    user_cache.invalidate(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User) -> None:
+    invalidate_user(target.id)
@@ -1,5 +1,10 @@
 
 from .token import BlacklistedToken
 from .user import User
+from .blob import Blob
 from .file import File
-from .link import ShareLink
\ No newline at end of file
+from .link import ShareLink
+from .upload_session import UploadSession
+from .rate_limit import AuthRateLimit
+from .pending_upload import PendingUpload
+from .share_resume import ShareResume
@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+BLOB_KEY_PREFIX = "sha256/"
+
+
+class Blob(Base):
+    """Объект в MinIO, адресуемый SHA-256 содержимого и общий для нескольких File."""
+
+    __tablename__ = "blobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    digest: Mapped[str] = mapped_column(String(64), nullable=False, unique=True, index=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_at: Mapped[datetime] = mapped_column(
+        default=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
+    )
+
+    @property
+    def key(self) -> str:
+        return f"{BLOB_KEY_PREFIX}{self.digest}"
+
+    def __repr__(self) -> str:
+        return f"Blob(id={self.id!r}, digest={self.digest!r}, ref_count={self.ref_count!r})"
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 
-from sqlalchemy import BigInteger, ForeignKey, Integer, String, Enum
+from sqlalchemy import BigInteger, ForeignKey, Index, Integer, String, Enum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db import Base
@@ -12,6 +12,14 @@ from schemas.file import AccessLevel
 
 class File(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # Keyset-пагинация списка файлов владельца (см. get_files_user)
+        Index("ix_files_owner_created_at", "owner", "created_at", "id"),
+        Index("ix_files_owner_size", "owner", "size", "id"),
+        # Имя файла уникально в пределах владельца; индекс же служит
+        # сортировке по имени
+        Index("ix_files_owner_original_filename", "owner", "original_filename", unique=True),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False, unique=False)
@@ -20,6 +28,8 @@ class File(Base):
     owner: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
     path: Mapped[str] = mapped_column(String(), nullable=False)
     size: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    # NULL у файлов, загруженных в обход дедупликации (uuid-ключ в MinIO)
+    blob_id: Mapped[int | None] = mapped_column(ForeignKey("blobs.id"), nullable=True, index=True)
     created_at: Mapped[datetime] = mapped_column(
         default=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
     )
@@ -38,12 +48,18 @@ class File(Base):
         "FileShares",
         back_populates="file",
         cascade="all, delete-orphan",
-        lazy="selectin"  # или "joined"
+        # Выдачи доступа нужны единичным запросам: пусть грузят их явно
+        lazy="raise"
     )
 
 
 class FileShares(Base):
     __tablename__ = "file_shares"
+    __table_args__ = (
+        Index("ix_file_shares_file_id_user_id", "file_id", "user_id", unique=True),
+        # Keyset-пагинация чужих файлов: ORDER BY shared_at, file_id
+        Index("ix_file_shares_user_id_shared_at_file_id", "user_id", "shared_at", "file_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     file_id: Mapped[int] = mapped_column(ForeignKey(File.id))
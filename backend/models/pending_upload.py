@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+class PendingUpload(Base):
+    """Выданная presigned-загрузка, которую ещё не подтвердили."""
+
+    __tablename__ = "pending_uploads"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
+    owner: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    # После этого срока объект без подтверждения удаляет фоновая очистка
+    expires_at: Mapped[datetime] = mapped_column(index=True)
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+class AuthRateLimit(Base):
+    """Корзина токенов лимита попыток входа и регистрации (общий режим)."""
+    __tablename__ = "auth_rate_limits"
+    # Состояние лимитов не жалко потерять при сбое сервера, а WAL на
+    # каждую попытку входа писать незачем
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(String(320), unique=True)
+    tokens: Mapped[float]
+    capacity: Mapped[float]
+    refill_rate: Mapped[float]
+    allowed: Mapped[bool]
+    updated_at: Mapped[datetime]
+    # Когда корзина снова заполнится целиком: после этого строка ничем не
+    # отличается от отсутствующей и её удаляет фоновая очистка
+    expires_at: Mapped[datetime] = mapped_column(index=True)
@@ -0,0 +1,20 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, ForeignKey
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+class ShareResume(Base):
+    """Разрешение докачать файл после учтённого скачивания по ссылке."""
+
+    __tablename__ = "share_resumes"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    share_link_id: Mapped[int] = mapped_column(ForeignKey("share_links.id", ondelete="CASCADE"))
+    # Докачка должна начинаться не раньше этого байта: каждая следующая
+    # продолжает загрузку дальше предыдущей, а не отдаёт файл заново
+    next_start: Mapped[int] = mapped_column(BigInteger, default=1)
+    resumes_left: Mapped[int] = mapped_column()
+    expires_at: Mapped[datetime] = mapped_column(index=True)
@@ -15,7 +15,7 @@ class BlacklistedToken(Base):
     )
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"))
     token_type: Mapped[str] = mapped_column(String(20))
-    expires_at: Mapped[datetime] = mapped_column()
+    expires_at: Mapped[datetime] = mapped_column(index=True)
     revoked_at: Mapped[datetime] = mapped_column(
         default=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
     )
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import BigInteger, ForeignKey, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db import Base
+
+
+class UploadSession(Base):
+    """Незавершённая возобновляемая загрузка, привязанная к multipart upload в MinIO."""
+
+    __tablename__ = "upload_sessions"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    upload_id: Mapped[str] = mapped_column(String(), nullable=False)
+    name: Mapped[str] = mapped_column(String(255), nullable=False)
+    original_filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    type: Mapped[str] = mapped_column(String(), nullable=False)
+    owner: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    part_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        default=lambda: datetime.now(timezone.utc).replace(tzinfo=None)
+    )
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+    @property
+    def total_parts(self) -> int:
+        return max(1, -(-self.size // self.part_size))
+
+    def expected_part_size(self, part_number: int) -> int:
+        if part_number < self.total_parts:
+            return self.part_size
+        return self.size - self.part_size * (self.total_parts - 1)
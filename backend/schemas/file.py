@@ -1,6 +1,8 @@
 from enum import Enum
 
-from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class FileId(BaseModel):
@@ -23,7 +25,53 @@ class ShareRequest(BaseModel):
     access_level: str = "read"
 
 
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(ge=0)
+    content_type: Optional[str] = None
+
+
+class PresignedUploadRequest(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    size: int = Field(ge=0)
+    content_type: Optional[str] = None
+
+
+class PresignedUploadConfirm(BaseModel):
+    upload_token: str
+
+
 class AccessLevel(str, Enum):
     READ = "read"
     WRITE = "write"
     MANAGE = "manage"
+
+
+class BulkShareRequest(BaseModel):
+    """Доступ выдаётся каждому получателю к каждому файлу."""
+    file_ids: List[int] = Field(min_length=1)
+    user_ids: List[int] = Field(min_length=1)
+    access_level: AccessLevel = AccessLevel.READ
+
+
+class BulkRevokeRequest(BaseModel):
+    """Доступ отзывается у каждого получателя к каждому файлу."""
+    file_ids: List[int] = Field(min_length=1)
+    user_ids: List[int] = Field(min_length=1)
+
+
+class FileScope(str, Enum):
+    ALL = "all"
+    OWNED = "owned"
+    SHARED = "shared"
+
+
+class FileSortField(str, Enum):
+    CREATED_AT = "created_at"
+    NAME = "name"
+    SIZE = "size"
+
+
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
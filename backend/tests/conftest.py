@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import close_all_sessions
 
 from app.main import app
 from app.db import async_session_maker, engine
+from core.rate_limit import auth_rate_limiter
 
 
 @pytest.fixture(autouse=True)
@@ -17,6 +18,7 @@ async def clean_db():
     async with async_session_maker() as session:
         await session.execute(text("TRUNCATE TABLE files, users CASCADE"))
         await session.commit()
+    auth_rate_limiter.clear()
     yield
 
     await close_all_sessions()  # Закрывает все соединения
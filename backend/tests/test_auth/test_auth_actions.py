@@ -23,6 +23,34 @@ async def test_logout(db_connect):
     }
 
 
+@pytest.mark.anyio
+async def test_tokens_revoked_after_logout(db_connect):
+    """Тест отказа в доступе по токенам, отозванным при logout"""
+    await db_connect.post(
+        "/auth/register",
+        json={
+            "name": "revoke_test_user",
+            "email": "revoke_test@mail.com",
+            "password": "Vfhnf12999",
+            "password_confirm": "Vfhnf12999",
+        },
+    )
+    access_token = db_connect.cookies["access_token"]
+    refresh_token = db_connect.cookies["refresh_token"]
+
+    await db_connect.post("/auth/logout")
+    db_connect.cookies.clear()
+    db_connect.cookies.set("access_token", access_token)
+    db_connect.cookies.set("refresh_token", refresh_token)
+
+    response = await db_connect.get("/auth/me")
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Token revoked"}
+
+    response = await db_connect.post("/auth/refresh")
+    assert response.status_code == 401
+
+
 @pytest.mark.anyio
 async def test_refresh_token(db_connect):
     """Тест обновления токена"""
@@ -56,4 +56,28 @@ async def test_login_incorrect_password(db_connect):
         )
 
     assert response.status_code == 401
-    assert response.json() == {"detail": "Incorrect password"}
\ No newline at end of file
+    assert response.json() == {"detail": "Incorrect password"}
+
+@pytest.mark.anyio
+async def test_login_rate_limited_by_email(db_connect):
+    """Тест лимита попыток входа на один email: после исчерпания корзины 429"""
+    for _ in range(5):
+        response = await db_connect.post(
+                "/auth/login",
+                json={"email": "bruteforce@mail.com", "password": "Vfhnf12999"},
+            )
+        assert response.status_code == 404
+
+    response = await db_connect.post(
+            "/auth/login",
+            json={"email": "bruteforce@mail.com", "password": "Vfhnf12999"},
+        )
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    response = await db_connect.post(
+            "/auth/login",
+            json={"email": "other@mail.com", "password": "Vfhnf12999"},
+        )
+    assert response.status_code == 404
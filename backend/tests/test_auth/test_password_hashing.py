@@ -0,0 +1,25 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from core.secure import PasswordHashPool
+
+
+@pytest.mark.anyio
+async def test_password_hash_pool_rejects_when_saturated():
+    """Тест быстрого отказа 503, когда очередь хэширования заполнена"""
+    pool = PasswordHashPool(workers=1, max_queue=0)
+    release = threading.Event()
+
+    busy = asyncio.ensure_future(pool.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as error:
+        await pool.run(lambda: None)
+    assert error.value.status_code == 503
+
+    release.set()
+    await busy
+    assert await pool.run(lambda: "ok") == "ok"
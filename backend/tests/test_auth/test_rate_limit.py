@@ -0,0 +1,109 @@
+import asyncio
+import ipaddress
+
+import pytest
+from sqlalchemy import select, text
+from starlette.requests import Request
+
+from app.config import settings
+from app.db import async_session_maker
+from core import rate_limit
+from core.maintenance import sweep_expired_rows
+from core.rate_limit import Bucket, client_ip, hit_shared_buckets
+from models.rate_limit import AuthRateLimit
+
+
+def make_request(peer: str, headers: dict) -> Request:
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/auth/login",
+        "client": (peer, 40000),
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+@pytest.fixture
+async def shared_backend(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_RATE_LIMIT_BACKEND", "postgres")
+    async with async_session_maker() as session:
+        await session.execute(text("TRUNCATE TABLE auth_rate_limits"))
+        await session.commit()
+
+
+@pytest.mark.anyio
+async def test_client_ip_ignores_forwarded_headers_from_untrusted_peer(monkeypatch):
+    """Тест: заголовкам прокси от недоверенного соединения не верим"""
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_NETWORKS", ())
+    request = make_request("203.0.113.5", {"x-forwarded-for": "1.1.1.1", "x-real-ip": "2.2.2.2"})
+
+    assert client_ip(request) == "203.0.113.5"
+
+
+@pytest.mark.anyio
+async def test_client_ip_from_trusted_proxy(monkeypatch):
+    """Тест: за доверенным прокси клиент — первый недоверенный адрес справа"""
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_NETWORKS", (ipaddress.ip_network("172.28.0.0/16"),))
+
+    # Левое значение подставил клиент, правое добавил nginx
+    request = make_request("172.28.0.10", {"x-forwarded-for": "6.6.6.6, 198.51.100.7"})
+    assert client_ip(request) == "198.51.100.7"
+
+    request = make_request("172.28.0.10", {"x-real-ip": "198.51.100.8"})
+    assert client_ip(request) == "198.51.100.8"
+
+
+@pytest.mark.anyio
+async def test_login_rate_limited_by_ip(db_connect):
+    """Тест лимита по IP: разные email с одного адреса упираются в общую корзину"""
+    for attempt in range(settings.AUTH_RATE_LIMIT_IP_BURST):
+        response = await db_connect.post(
+            "/auth/login",
+            json={"email": f"user{attempt}@mail.com", "password": "Vfhnf12999"},
+        )
+        assert response.status_code == 404
+
+    response = await db_connect.post(
+        "/auth/login",
+        json={"email": "another@mail.com", "password": "Vfhnf12999"},
+    )
+    assert response.status_code == 429
+
+
+@pytest.mark.anyio
+async def test_login_rate_limited_in_postgres(db_connect, shared_backend):
+    """Тест общего режима: корзины в auth_rate_limits, лимит по email держится"""
+    for _ in range(settings.AUTH_RATE_LIMIT_EMAIL_BURST):
+        response = await db_connect.post(
+            "/auth/login",
+            json={"email": "shared@mail.com", "password": "Vfhnf12999"},
+        )
+        assert response.status_code == 404
+
+    response = await db_connect.post(
+        "/auth/login",
+        json={"email": "shared@mail.com", "password": "Vfhnf12999"},
+    )
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    async with async_session_maker() as session:
+        keys = (await session.scalars(select(AuthRateLimit.key).order_by(AuthRateLimit.key))).all()
+    assert keys == ["email:shared@mail.com", "ip:127.0.0.1"]
+
+
+@pytest.mark.anyio
+async def test_shared_buckets_race_and_sweep(shared_backend):
+    """Тест общего режима: одновременные попытки не превышают ёмкость, полные корзины удаляются"""
+    buckets = [Bucket("email:race@mail.com", 3, 0.01)]
+    waits = await asyncio.gather(*[hit_shared_buckets(buckets) for _ in range(10)])
+    assert sum(1 for wait in waits if max(wait) == 0) == 3
+
+    await hit_shared_buckets([Bucket("ip:fast", 1, 100.0)])
+    await asyncio.sleep(0.1)
+    swept = await sweep_expired_rows()
+    assert swept["auth_rate_limits"] == 1
+
+    async with async_session_maker() as session:
+        keys = (await session.scalars(select(AuthRateLimit.key))).all()
+    assert keys == ["email:race@mail.com"]
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from sqlalchemy import select, update
+
+from app.db import async_session_maker
+from core.ttl_cache import TTLCache
+from core.user_cache import user_cache
+from models.user import User
+
+
+@pytest.mark.anyio
+async def test_ttl_cache_evicts_least_recently_used():
+    """Тест вытеснения самой давно использованной записи"""
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+@pytest.mark.anyio
+async def test_ttl_cache_expires_entries(monkeypatch):
+    """Тест истечения записи по собственному сроку жизни"""
+    cache = TTLCache(max_entries=10, ttl=60)
+    cache.set("short", 1, ttl=5)
+    cache.set("long", 2)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+@pytest.mark.anyio
+async def test_user_cache_invalidated_on_update(db_connect, register):
+    """Тест сброса кэша пользователя при изменении аккаунта"""
+    response = await db_connect.get("/auth/me")
+    assert response.status_code == 200
+    user_id = response.json()["id"]
+    assert user_cache.get(user_id) is not None
+
+    async with async_session_maker() as session:
+        user = await session.scalar(select(User).where(User.id == user_id))
+        user.name = "renamed_user"
+        await session.commit()
+
+    assert user_cache.get(user_id) is None
+    response = await db_connect.get("/auth/me")
+    assert response.json()["name"] == "renamed_user"
@@ -0,0 +1,36 @@
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.db import engine
+from core.maintenance import SWEEP_LOCK_NAME, sweep_expired_rows
+
+
+@pytest.mark.anyio
+async def test_sweeper_invalidates_connection_when_unlock_fails(monkeypatch):
+    """Тест: если снять блокировку не удалось, соединение закрывается и блокировка освобождается"""
+    invalidated = []
+    original_invalidate = AsyncConnection.invalidate
+
+    async def spy_invalidate(self, exception=None):
+        invalidated.append(self)
+        await original_invalidate(self, exception)
+
+    def fail_unlock(conn, cursor, statement, parameters, context, executemany):
+        if "pg_advisory_unlock" in statement:
+            raise RuntimeError("unlock failed")
+
+    monkeypatch.setattr(AsyncConnection, "invalidate", spy_invalidate)
+    event.listen(engine.sync_engine, "before_cursor_execute", fail_unlock)
+    try:
+        await sweep_expired_rows()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", fail_unlock)
+
+    assert len(invalidated) == 1
+
+    # Блокировку держала сессия закрытого соединения: она свободна
+    lock_key = func.hashtextextended(SWEEP_LOCK_NAME, 0)
+    async with engine.connect() as connection:
+        assert await connection.scalar(select(func.pg_try_advisory_lock(lock_key)))
+        await connection.scalar(select(func.pg_advisory_unlock(lock_key)))
@@ -0,0 +1,39 @@
+import pytest
+from pydantic import SecretStr
+
+from app.config import settings
+from app.db import DATABASE_URL, Replica, replica_router
+
+
+@pytest.mark.anyio
+async def test_metrics_disabled_without_token(db_connect, monkeypatch):
+    """Тест: без METRICS_TOKEN метрики не отдаются"""
+    monkeypatch.setattr(settings, "METRICS_TOKEN", None)
+
+    response = await db_connect.get("/metrics")
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_metrics_require_token(db_connect, monkeypatch):
+    """Тест: метрики только с верным токеном и без адресов реплик"""
+    monkeypatch.setattr(settings, "METRICS_TOKEN", SecretStr("metrics-secret"))
+    replica = Replica(DATABASE_URL)
+    replica.error = "connection to server at 10.0.0.5 failed"
+    monkeypatch.setattr(replica_router, "replicas", [replica])
+
+    try:
+        response = await db_connect.get("/metrics")
+        assert response.status_code == 401
+
+        response = await db_connect.get("/metrics", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+
+        response = await db_connect.get("/metrics", headers={"Authorization": "Bearer metrics-secret"})
+    finally:
+        await replica.engine.dispose()
+
+    assert response.status_code == 200
+    assert response.json()["db_replicas"] == [
+        {"replica": 0, "healthy": False, "lag_seconds": None, "failing": True}
+    ]
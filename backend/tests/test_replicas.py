@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import text
+
+from app import db
+from app.db import DATABASE_URL, ReplicaRouter
+
+
+@pytest.mark.anyio
+async def test_replica_without_lag_value_leaves_rotation(monkeypatch):
+    """Тест: реплика без значения отставания (нет WAL-receiver) выходит из ротации"""
+    router = ReplicaRouter([DATABASE_URL], max_lag=5)
+    try:
+        monkeypatch.setattr(db, "REPLICA_LAG_QUERY", text("SELECT 0"))
+        await router.check()
+        assert router.choose() is router.replicas[0].engine
+
+        monkeypatch.setattr(db, "REPLICA_LAG_QUERY", text("SELECT NULL"))
+        await router.check()
+        assert router.choose() is None
+        assert router.stats()[0]["lag_seconds"] is None
+
+        monkeypatch.setattr(db, "REPLICA_LAG_QUERY", text("SELECT 30"))
+        await router.check()
+        assert router.choose() is None
+    finally:
+        await router.dispose()
+
+
+@pytest.mark.anyio
+async def test_lag_query_on_primary():
+    """Тест запроса отставания на сервере не в режиме восстановления"""
+    async with db.engine.connect() as connection:
+        assert await connection.scalar(db.REPLICA_LAG_QUERY) == 0
@@ -0,0 +1,69 @@
+import hashlib
+
+import pytest
+from sqlalchemy import select
+
+from app.db import async_session_maker
+from core import blob_store
+from core.blob_store import acquire_blob, rollback_new_blobs
+from models.blob import Blob
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Подменяет MinIO: записывает скопированные и удалённые ключи"""
+    calls = {"copied": [], "deleted": []}
+
+    async def fake_copy_object(source_key, target_key, bucket_name):
+        calls["copied"].append(target_key)
+
+    async def fake_delete_from_minio(filename, bucket_name):
+        calls["deleted"].append(filename)
+        return True
+
+    monkeypatch.setattr(blob_store, "copy_object", fake_copy_object)
+    monkeypatch.setattr(blob_store, "delete_from_minio", fake_delete_from_minio)
+    return calls
+
+
+@pytest.fixture
+async def digest():
+    digest = hashlib.sha256(b"blob store test").hexdigest()
+    yield digest
+    async with async_session_maker() as session:
+        blob = await session.scalar(select(Blob).where(Blob.digest == digest))
+        if blob is not None:
+            await session.delete(blob)
+            await session.commit()
+
+
+@pytest.mark.anyio
+async def test_rollback_deletes_uncommitted_blob(storage, digest):
+    """Тест: объект, скопированный в откатанной транзакции, удаляется из хранилища"""
+    async with async_session_maker() as session:
+        blob = await acquire_blob(session, "tmp/upload", digest, 10)
+        key = blob.key
+        await rollback_new_blobs(session)
+
+    assert storage["copied"] == [key]
+    assert storage["deleted"] == [key]
+    async with async_session_maker() as session:
+        assert await session.scalar(select(Blob).where(Blob.digest == digest)) is None
+
+
+@pytest.mark.anyio
+async def test_rollback_keeps_committed_blob(storage, digest):
+    """Тест: после commit на объект ссылается строка blobs, и откат его не трогает"""
+    async with async_session_maker() as session:
+        await acquire_blob(session, "tmp/upload", digest, 10)
+        await session.commit()
+
+        # Повторная ссылка на то же содержимое не копирует объект
+        await acquire_blob(session, "tmp/upload-2", digest, 10)
+        await rollback_new_blobs(session)
+
+    assert len(storage["copied"]) == 1
+    assert storage["deleted"] == []
+    async with async_session_maker() as session:
+        blob = await session.scalar(select(Blob).where(Blob.digest == digest))
+    assert blob.ref_count == 1
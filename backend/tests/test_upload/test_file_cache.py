@@ -0,0 +1,198 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.config import settings
+from core import minio_client
+from core.file_cache import FileCache
+from core.minio_client import download_from_minio, iter_cached_body
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    cache = FileCache(max_bytes=10, max_entry_bytes=8)
+    cache.load()
+    return cache
+
+
+async def fill(cache, key, data):
+    writer = cache.writer(key, len(data))
+    await writer.write(data)
+    await writer.commit()
+
+
+def cached(cache, key):
+    """Содержимое записи кэша или None"""
+    file = cache.get(key)
+    if file is None:
+        return None
+    with file:
+        return file.read()
+
+
+def disk_usage(cache):
+    return sum(path.stat().st_size for path in Path(cache.directory).iterdir())
+
+
+class FakeBody:
+    """Тело ответа S3 с iter_chunks, как у aiobotocore"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def iter_chunks(self, chunk_size):
+        for chunk in self.chunks:
+            yield chunk
+
+
+@pytest.mark.anyio
+async def test_file_cache_evicts_least_recently_used(cache):
+    """Тест вытеснения самой старой записи при превышении лимита"""
+    await fill(cache, "a", b"aaaa")
+    await fill(cache, "b", b"bbbb")
+    assert cached(cache, "a") == b"aaaa"
+
+    await fill(cache, "c", b"cccc")
+
+    assert cached(cache, "b") is None
+    assert cached(cache, "a") == b"aaaa"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 8
+
+
+@pytest.mark.anyio
+async def test_file_cache_skips_incomplete_and_large_entries(cache):
+    """Тест: оборванная запись и слишком большие объекты не попадают в кэш"""
+    assert cache.writer("big", 9) is None
+
+    writer = cache.writer("a", 4)
+    await writer.write(b"aa")
+    await writer.commit()
+    assert cached(cache, "a") is None
+
+
+@pytest.mark.anyio
+async def test_file_cache_invalidate(cache):
+    """Тест сброса записи при удалении объекта"""
+    await fill(cache, "a", b"aaaa")
+    cache.invalidate("a")
+    assert cached(cache, "a") is None
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.anyio
+async def test_file_cache_open_entry_survives_eviction(cache):
+    """Тест: открытая запись дочитывается, даже если её удалил другой воркер"""
+    await fill(cache, "a", b"aaaa")
+    file = cache.get("a")
+
+    other = FileCache(max_bytes=10, max_entry_bytes=8)
+    other.load()
+    other.invalidate("a")
+
+    with file:
+        assert file.read() == b"aaaa"
+    assert cached(cache, "a") is None
+
+
+@pytest.mark.anyio
+async def test_file_cache_budget_shared_between_workers(cache):
+    """Тест: воркеры с общим каталогом вместе не выходят за max_bytes"""
+    other = FileCache(max_bytes=10, max_entry_bytes=8)
+    other.load()
+
+    await fill(cache, "a", b"aaaa")
+    await fill(cache, "b", b"bbbb")
+    await fill(other, "c", b"cccc")
+
+    assert disk_usage(cache) <= 10
+    # Вытесняется чужая запись, а не только что добавленная
+    assert cached(other, "c") == b"cccc"
+    assert [cached(cache, "a"), cached(cache, "b")].count(None) == 1
+
+    # Запись, вытесненная другим воркером, забывается при следующей перестройке
+    await fill(cache, "d", b"dd")
+    assert cache.stats()["bytes"] == disk_usage(cache)
+
+
+@pytest.mark.anyio
+async def test_file_cache_keeps_entries_hot_in_other_worker(cache):
+    """Тест: попадания соседнего воркера защищают запись от вытеснения"""
+    other = FileCache(max_bytes=10, max_entry_bytes=8)
+    other.load()
+
+    await fill(cache, "a", b"aaaa")
+    await fill(cache, "b", b"bbbb")
+    # Запись "a" горячая только у соседа
+    assert cached(other, "a") == b"aaaa"
+
+    await fill(cache, "c", b"cccc")
+
+    assert cached(cache, "a") == b"aaaa"
+    assert cached(cache, "b") is None
+
+
+@pytest.mark.anyio
+async def test_file_cache_load_keeps_live_temp_files(cache):
+    """Тест: при запуске удаляются только недописанные файлы завершившихся процессов"""
+    live = Path(cache.directory) / f".tmp-{os.getppid()}-live"
+    stale = Path(cache.directory) / ".tmp-999999999-stale"
+    live.write_bytes(b"aa")
+    stale.write_bytes(b"aa")
+
+    FileCache(max_bytes=10, max_entry_bytes=8).load()
+
+    assert live.exists()
+    assert not stale.exists()
+
+
+@pytest.mark.anyio
+async def test_cached_body_survives_cache_errors(cache):
+    """Тест: ошибка записи кэша не обрывает отдачу объекта клиенту"""
+    chunks = [b"aa", b"bb"]
+
+    # Временный файл удалил другой процесс: os.replace в commit падает
+    writer = cache.writer("a", 4)
+    received = []
+    async for chunk in iter_cached_body(FakeBody(chunks), writer):
+        if not received:
+            os.unlink(writer.temp_path)
+        received.append(chunk)
+    assert received == chunks
+    assert cached(cache, "a") is None
+
+    # Запись на диск падает с первого куска
+    writer = cache.writer("b", 4)
+
+    async def failing_write(chunk):
+        raise OSError(28, "No space left on device")
+
+    writer.write = failing_write
+    received = [chunk async for chunk in iter_cached_body(FakeBody(chunks), writer)]
+    assert received == chunks
+    assert cached(cache, "b") is None
+    assert [path.name for path in Path(cache.directory).iterdir()] == []
+
+
+@pytest.mark.anyio
+async def test_download_from_cache_after_eviction(cache, monkeypatch):
+    """Тест: ответ из кэша дочитывается, если запись вытеснили после его создания"""
+    monkeypatch.setattr(minio_client, "file_cache", cache)
+    await fill(cache, "a", b"abcdef")
+
+    full = await download_from_minio("a", "bucket", size=6)
+    partial = await download_from_minio("a", "bucket", size=6, ranges=[(2, 3)])
+    cache.invalidate("a")
+
+    assert full.headers["Content-Length"] == "6"
+    assert b"".join([chunk async for chunk in full.body_iterator]) == b"abcdef"
+    assert partial.status_code == 206
+    assert b"".join([chunk async for chunk in partial.body_iterator]) == b"cd"
@@ -0,0 +1,87 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from api.routes import upload
+from app.config import settings
+from app.db import async_session_maker
+from core import upload_sessions
+from core.secure import create_upload_token
+from models.pending_upload import PendingUpload
+from models.user import User
+
+
+@pytest.fixture
+def presigned_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "PRESIGNED_URLS_ENABLED", True)
+
+
+@pytest.mark.anyio
+async def test_download_url_disabled(db_connect, register):
+    """Тест presigned-ссылки при выключенном режиме"""
+    response = await db_connect.get("/files/1/download-url")
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Presigned URLs are disabled"}
+
+
+@pytest.mark.anyio
+async def test_upload_url_disabled(db_connect, register):
+    """Тест presigned-загрузки при выключенном режиме"""
+    response = await db_connect.post(
+        "/files/upload-url", json={"filename": "direct.bin", "size": 10}
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_upload_url_limits_size_and_records_pending(db_connect, register, presigned_enabled):
+    """Тест presigned POST: размер ограничен политикой, загрузка записана как ожидающая"""
+    response = await db_connect.post(
+        "/files/upload-url", json={"filename": "direct.bin", "size": 10}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["method"] == "POST"
+    policy = json.loads(base64.b64decode(data["fields"]["policy"]))
+    assert ["content-length-range", 0, 10] in policy["conditions"]
+
+    async with async_session_maker() as session:
+        names = (await session.scalars(select(PendingUpload.name))).all()
+    assert names == [data["fields"]["key"]]
+
+
+@pytest.mark.anyio
+async def test_unconfirmed_presigned_upload_is_reaped(db_connect, register, presigned_enabled, monkeypatch):
+    """Тест очистки: объект неподтверждённой загрузки удаляется, подтверждение отвечает 410"""
+    deleted = []
+
+    async def fake_delete_from_minio(filename, bucket_name):
+        deleted.append(filename)
+        return True
+
+    async def fake_head_object(filename, bucket_name):
+        return {"ContentLength": 10}
+
+    monkeypatch.setattr(upload_sessions, "delete_from_minio", fake_delete_from_minio)
+    monkeypatch.setattr(upload, "head_object", fake_head_object)
+
+    async with async_session_maker() as session:
+        owner = await session.scalar(select(User.id).where(User.email == "test_reg@mail.com"))
+        session.add(PendingUpload(name="abandoned.bin", owner=owner, expires_at=datetime.now() - timedelta(minutes=1)))
+        await session.commit()
+
+    assert await upload_sessions.reap_expired_presigned_uploads() == 1
+    assert deleted == ["abandoned.bin"]
+
+    upload_token = create_upload_token(
+        {"sub": str(owner), "key": "abandoned.bin", "filename": "abandoned.bin", "content_type": "application/octet-stream"},
+        timedelta(minutes=5),
+    )
+    response = await db_connect.post("/files/upload-url/confirm", json={"upload_token": upload_token})
+    assert response.status_code == 410
@@ -0,0 +1,33 @@
+import pytest
+
+from core.http_range import parse_range_header
+
+
+@pytest.mark.anyio
+async def test_parse_single_range():
+    """Тест разбора одного диапазона"""
+    assert parse_range_header("bytes=10-19", 100) == [(10, 19)]
+    assert parse_range_header("bytes=90-", 100) == [(90, 99)]
+    assert parse_range_header("bytes=-5", 100) == [(95, 99)]
+    assert parse_range_header("bytes=50-500", 100) == [(50, 99)]
+
+
+@pytest.mark.anyio
+async def test_parse_multiple_ranges_are_merged():
+    """Тест объединения пересекающихся диапазонов"""
+    assert parse_range_header("bytes=0-9,5-14,50-59", 100) == [(0, 14), (50, 59)]
+
+
+@pytest.mark.anyio
+async def test_parse_invalid_range_is_ignored():
+    """Тест игнорирования некорректного заголовка"""
+    assert parse_range_header("items=0-9", 100) is None
+    assert parse_range_header("bytes=9-0", 100) is None
+    assert parse_range_header("bytes=abc", 100) is None
+
+
+@pytest.mark.anyio
+async def test_parse_unsatisfiable_range():
+    """Тест диапазона за пределами файла"""
+    assert parse_range_header("bytes=100-", 100) == []
+    assert parse_range_header("bytes=-0", 100) == []
@@ -0,0 +1,177 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import Response
+from sqlalchemy import select
+
+from api.routes import share
+from app.config import settings
+from app.db import DATABASE_URL, Replica, async_session_maker, replica_router
+from core.deps import PRIMARY_PIN_COOKIE
+from models.file import File as FileModel
+from models.link import ShareLink
+from models.user import User
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """Подменяет MinIO: учёт скачиваний проверяется без хранилища"""
+    async def fake_download_from_minio(filename, bucket_name, original_filename=None, ranges=None, **kwargs):
+        if ranges:
+            return Response(b"partial", status_code=206)
+        return Response(b"content")
+
+    monkeypatch.setattr(share, "download_from_minio", fake_download_from_minio)
+
+
+async def create_share_link(max_downloads: int) -> str:
+    async with async_session_maker() as session:
+        owner = await session.scalar(select(User.id).where(User.email == "test_reg@mail.com"))
+        file = FileModel(name="shared.txt", original_filename="shared.txt", type="text/plain", owner=owner, path="", size=100)
+        session.add(file)
+        await session.flush()
+        session.add(ShareLink(
+            token="share-token",
+            file_id=file.id,
+            expires_at=datetime.now() + timedelta(hours=1),
+            max_downloads=max_downloads,
+            download_count=0,
+            created_at=datetime.now(),
+        ))
+        await session.commit()
+    return "share-token"
+
+
+async def download_count(token: str) -> int:
+    async with async_session_maker() as session:
+        return await session.scalar(select(ShareLink.download_count).where(ShareLink.token == token))
+
+
+@pytest.mark.anyio
+async def test_share_download_limit(db_connect, register, storage):
+    """Тест учёта скачиваний: последнее разрешённое проходит, следующее — 410"""
+    token = await create_share_link(max_downloads=2)
+    db_connect.cookies.clear()
+
+    assert (await db_connect.get(f"/share/{token}")).status_code == 200
+    db_connect.cookies.clear()
+    assert (await db_connect.get(f"/share/{token}")).status_code == 200
+    db_connect.cookies.clear()
+
+    response = await db_connect.get(f"/share/{token}")
+    assert response.status_code == 410
+    assert response.json() == {"detail": "Download limit reached"}
+    assert await download_count(token) == 2
+
+
+@pytest.mark.anyio
+async def test_share_range_counted_without_resume_cookie(db_connect, register, storage):
+    """Тест: Range не с нуля без cookie докачки считается скачиванием и упирается в лимит"""
+    token = await create_share_link(max_downloads=1)
+    db_connect.cookies.clear()
+
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=1-"})
+    assert response.status_code == 206
+    assert await download_count(token) == 1
+    db_connect.cookies.clear()
+
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=1-"})
+    assert response.status_code == 410
+    assert await download_count(token) == 1
+
+
+@pytest.mark.anyio
+async def test_share_resume_after_counted_download(db_connect, register, storage):
+    """Тест докачки: после учтённого скачивания Range с cookie проходит без учёта"""
+    token = await create_share_link(max_downloads=1)
+    db_connect.cookies.clear()
+
+    response = await db_connect.get(f"/share/{token}")
+    assert response.status_code == 200
+    assert "share_resume" in response.cookies
+
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=50-"})
+    assert response.status_code == 206
+    assert await download_count(token) == 1
+
+    # Без Range cookie не помогает: полная отдача — новое скачивание
+    response = await db_connect.get(f"/share/{token}")
+    assert response.status_code == 410
+
+
+@pytest.mark.anyio
+async def test_share_resume_only_continues_download(db_connect, register, storage, monkeypatch):
+    """Тест: cookie докачки не даёт скачивать файл заново Range-запросами"""
+    monkeypatch.setattr(settings, "SHARE_MAX_RESUMES", 2)
+    token = await create_share_link(max_downloads=1)
+    db_connect.cookies.clear()
+    assert (await db_connect.get(f"/share/{token}")).status_code == 200
+
+    # Range с нулевого байта — это полная отдача, а не докачка
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=0-"})
+    assert response.status_code == 410
+
+    assert (await db_connect.get(f"/share/{token}", headers={"Range": "bytes=10-"})).status_code == 206
+    # Повтор с того же смещения не продолжает загрузку
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=10-"})
+    assert response.status_code == 410
+
+    assert (await db_connect.get(f"/share/{token}", headers={"Range": "bytes=20-"})).status_code == 206
+    # Докачки этого скачивания исчерпаны
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=30-"})
+    assert response.status_code == 410
+    assert await download_count(token) == 1
+
+
+@pytest.mark.anyio
+async def test_share_failed_download_not_counted(db_connect, register, storage, monkeypatch):
+    """Тест: 416 на Range и отсутствие объекта в хранилище не тратят скачивание"""
+    token = await create_share_link(max_downloads=1)
+    db_connect.cookies.clear()
+
+    response = await db_connect.get(f"/share/{token}", headers={"Range": "bytes=1000-"})
+    assert response.status_code == 416
+    assert await download_count(token) == 0
+
+    async def missing_object(*args, **kwargs):
+        return None
+
+    with monkeypatch.context() as patch:
+        patch.setattr(share, "download_from_minio", missing_object)
+        response = await db_connect.get(f"/share/{token}")
+    assert response.status_code == 404
+    assert await download_count(token) == 0
+    assert "share_resume" not in response.cookies
+
+    assert (await db_connect.get(f"/share/{token}")).status_code == 200
+    assert await download_count(token) == 1
+
+
+@pytest.mark.anyio
+async def test_share_concurrent_downloads_race_for_last_slot(db_connect, register, storage):
+    """Тест гонки: из одновременных запросов последнее скачивание получает один"""
+    token = await create_share_link(max_downloads=1)
+    db_connect.cookies.clear()
+
+    responses = await asyncio.gather(*[db_connect.get(f"/share/{token}") for _ in range(5)])
+
+    assert sorted(response.status_code for response in responses) == [200, 410, 410, 410, 410]
+    assert await download_count(token) == 1
+
+
+@pytest.mark.anyio
+async def test_share_download_pins_client_to_primary(db_connect, register, storage, monkeypatch):
+    """Тест: запись при скачивании закрепляет клиента за primary, хотя обработчик возвращает свой Response"""
+    replica = Replica(DATABASE_URL)
+    monkeypatch.setattr(replica_router, "replicas", [replica])
+    token = await create_share_link(max_downloads=1)
+    db_connect.cookies.clear()
+
+    try:
+        response = await db_connect.get(f"/share/{token}")
+    finally:
+        await replica.engine.dispose()
+
+    assert response.status_code == 200
+    assert PRIMARY_PIN_COOKIE in response.cookies
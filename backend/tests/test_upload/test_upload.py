@@ -1,5 +1,15 @@
+from datetime import datetime
+
 import pytest
 
+from sqlalchemy import select
+
+from api.routes import upload
+from api.routes.upload import resolve_filenames
+from app.db import async_session_maker
+from models.file import File as FileModel, FileShares
+from models.user import User
+
 
 @pytest.mark.anyio
 async def test_get_user_files_unauthorized(db_connect):
@@ -64,6 +74,16 @@ async def test_remove_share_unauthorized(db_connect):
     assert response.status_code == 401
 
 
+@pytest.mark.anyio
+async def test_bulk_share_unauthorized(db_connect):
+    """Тест массовой выдачи доступа без авторизации"""
+    response = await db_connect.post(
+        "/files/share/bulk", json={"file_ids": [1], "user_ids": [2]}
+    )
+
+    assert response.status_code == 401
+
+
 @pytest.mark.anyio
 async def test_upload_multiple_files_unauthorized(db_connect):
     """Тест загрузки нескольких файлов без авторизации"""
@@ -79,3 +99,160 @@ async def test_upload_multiple_files_unauthorized(db_connect):
 
     assert response.status_code == 401
 
+
+
+@pytest.mark.anyio
+async def test_get_user_files_empty_page(db_connect, register):
+    """Тест пустого списка файлов с пагинацией"""
+    response = await db_connect.get("/files/", params={"limit": 10, "sort": "name"})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "files": {"owned": [], "shared": []},
+        "counts": {"owned": 0, "shared": 0, "total": 0},
+        "next_cursor": None,
+    }
+
+
+@pytest.mark.anyio
+async def test_get_user_files_invalid_cursor(db_connect, register):
+    """Тест некорректного курсора"""
+    response = await db_connect.get("/files/", params={"cursor": "garbage"})
+
+    assert response.status_code == 400
+
+
+async def seed_listing(owner_email: str) -> dict:
+    """
+    Пять своих и пять чужих файлов; значения ключей сортировки повторяются,
+    чтобы страницы резались посреди групп с одинаковым значением.
+    """
+    same_time = datetime(2026, 1, 1, 12, 0, 0)
+    async with async_session_maker() as session:
+        user_id = await session.scalar(select(User.id).where(User.email == owner_email))
+        other = User(name="listing_other", email="listing_other@mail.com", password="x")
+        session.add(other)
+        await session.flush()
+
+        owned, shared = [], []
+        for index in range(5):
+            file = FileModel(
+                name=f"own-{index}", original_filename=f"own-{index}.txt", type="text/plain",
+                owner=user_id, path="", size=index % 2, created_at=same_time,
+            )
+            foreign = FileModel(
+                name=f"foreign-{index}", original_filename=f"foreign-{index}.txt", type="text/plain",
+                owner=other.id, path="", size=index % 2, created_at=same_time,
+            )
+            session.add_all([file, foreign])
+            await session.flush()
+            session.add(FileShares(file_id=foreign.id, user_id=user_id, owner_id=other.id, shared_at=same_time))
+            owned.append(file.id)
+            shared.append(foreign.id)
+        await session.commit()
+    return {"owned": owned, "shared": shared}
+
+
+async def collect_pages(client, **params) -> list:
+    ids, cursor = [], None
+    while True:
+        query = {**params, "limit": 2}
+        if cursor:
+            query["cursor"] = cursor
+        response = await client.get("/files/", params=query)
+        assert response.status_code == 200
+        data = response.json()
+        ids.extend(item["id"] for item in data["files"]["owned"] + data["files"]["shared"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("sort", ["created_at", "size", "name"])
+@pytest.mark.parametrize("order", ["desc", "asc"])
+async def test_get_user_files_pages_without_gaps(db_connect, register, sort, order):
+    """Тест keyset-пагинации: при равных ключах сортировки страницы без дублей и пропусков"""
+    seeded = await seed_listing("test_reg@mail.com")
+
+    for scope, expected in (
+        ("owned", seeded["owned"]),
+        ("shared", seeded["shared"]),
+        ("all", seeded["owned"] + seeded["shared"]),
+    ):
+        ids = await collect_pages(db_connect, scope=scope, sort=sort, order=order)
+        assert len(ids) == len(set(ids))
+        assert sorted(ids) == sorted(expected)
+
+
+@pytest.mark.anyio
+async def test_get_shared_files_ordered_by_shared_at(db_connect, register):
+    """Тест: чужие файлы по умолчанию упорядочены по времени выдачи доступа"""
+    seeded = await seed_listing("test_reg@mail.com")
+    async with async_session_maker() as session:
+        first_shared = await session.scalar(
+            select(FileShares).where(FileShares.file_id == seeded["shared"][0])
+        )
+        first_shared.shared_at = datetime(2026, 6, 1)
+        await session.commit()
+
+    response = await db_connect.get("/files/", params={"scope": "shared"})
+
+    assert [item["id"] for item in response.json()["files"]["shared"]][0] == seeded["shared"][0]
+
+
+@pytest.mark.anyio
+async def test_resolve_filenames_batch(db_connect, register):
+    """Тест подбора суффиксов для пачки файлов одним запросом"""
+    async with async_session_maker() as session:
+        owner = await session.scalar(select(User.id).where(User.email == "test_reg@mail.com"))
+        for filename in ["a.txt", "a (1).txt", "a (3).txt", "b_%.txt"]:
+            session.add(FileModel(name=filename, original_filename=filename, type="text/plain", owner=owner, path=""))
+        await session.commit()
+
+        names = await resolve_filenames(
+            session, owner, ["a.txt", "a.txt", "b_%.txt", "bx%.txt", "c"]
+        )
+
+    assert names == ["a (2).txt", "a (4).txt", "b_% (1).txt", "bx%.txt", "c"]
+
+
+@pytest.mark.anyio
+async def test_bulk_share_reports_each_pair(db_connect, register):
+    """Тест результатов массовой выдачи доступа по каждой паре"""
+    response = await db_connect.post(
+        "/files/share/bulk", json={"file_ids": [1, 2], "user_ids": [5, 5]}
+    )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert data["failed"] == 2
+    assert [(r["file_id"], r["user_id"], r["status"]) for r in data["results"]] == [
+        (1, 5, "error"),
+        (2, 5, "error"),
+    ]
+
+
+@pytest.mark.anyio
+async def test_upload_duplicate_name_rejected_before_storage(db_connect, register, monkeypatch):
+    """Тест: занятое имя отклоняется до передачи тела в хранилище"""
+    async with async_session_maker() as session:
+        user_id = await session.scalar(select(User.id).where(User.email == "test_reg@mail.com"))
+        session.add(FileModel(
+            name="dup", original_filename="dup.txt", type="text/plain", owner=user_id, path="", size=1,
+        ))
+        await session.commit()
+
+    async def unexpected_upload(*args, **kwargs):
+        raise AssertionError("тело не должно уходить в хранилище")
+
+    monkeypatch.setattr(upload, "upload_stream", unexpected_upload)
+
+    response = await db_connect.post(
+        "/files/upload",
+        files={"file": ("dup.txt", b"content", "text/plain")},
+    )
+
+    assert response.status_code == 409
+    assert response.json() == {"detail": "Файл с именем 'dup.txt' уже существует у вас"}
@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.mark.anyio
+async def test_create_upload_session_unauthorized(db_connect):
+    """Тест создания сессии загрузки без авторизации"""
+    response = await db_connect.post(
+        "/files/upload-sessions", json={"filename": "big.bin", "size": 1024}
+    )
+
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_put_upload_part_unauthorized(db_connect):
+    """Тест отправки части файла без авторизации"""
+    response = await db_connect.put("/files/upload-sessions/1/parts/1", content=b"data")
+
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_upload_session_not_found(db_connect, register):
+    """Тест запроса чужой или несуществующей сессии"""
+    response = await db_connect.get("/files/upload-sessions/999999")
+
+    assert response.status_code == 404
+
+
+@pytest.mark.anyio
+async def test_upload_session_too_large(db_connect, register):
+    """Тест создания сессии для слишком большого файла"""
+    response = await db_connect.post(
+        "/files/upload-sessions",
+        json={"filename": "huge.bin", "size": 101 * 1024 * 1024},
+    )
+
+    assert response.status_code == 413